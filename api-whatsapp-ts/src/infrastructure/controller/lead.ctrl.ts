@@ -4,12 +4,35 @@ import fs from 'fs';
 import path from 'path';
 import axios from 'axios';
 
+// Tiempo que se recuerdan los envíos con Idempotency-Key (por defecto 24 horas)
+const IDEMPOTENCY_TTL_MS = Number(process.env.IDEMPOTENCY_TTL_MS || 24 * 60 * 60 * 1000);
+
+type EstadoEnvio = {
+  status: 'pending' | 'sent' | 'error';
+  response?: unknown;
+  promise?: Promise<unknown>;
+  updatedAt: number;
+};
+
 class LeadCtrl {
+  // Envíos recientes por Idempotency-Key: un reintento del cliente no duplica el mensaje
+  private readonly envios = new Map<string, EstadoEnvio>();
+
   constructor(private readonly leadCreator: LeadCreate) {}
 
-  public sendCtrl = async ({ body }: Request, res: Response) => {
+  private purgarEnvios() {
+    const limite = Date.now() - IDEMPOTENCY_TTL_MS;
+    for (const [key, envio] of this.envios) {
+      if (envio.status !== 'pending' && envio.updatedAt < limite) {
+        this.envios.delete(key);
+      }
+    }
+  }
+
+  public sendCtrl = async (req: Request, res: Response) => {
     try {
-      const { message, phone, pdfPath } = body;
+      const { message, phone, pdfPath } = req.body;
+      const idempotencyKey = req.get('Idempotency-Key');
       
       if (!message || !phone) {
         return res.status(400).send({ error: 'Se requieren los campos message y phone' });
@@ -33,19 +56,61 @@ class LeadCtrl {
         }
       }
       
-      const response = await this.leadCreator.sendMessageAndSave({ 
-        message, 
-        phone, 
-        pdfPath: validPdfPath 
+      if (!idempotencyKey) {
+        const response = await this.leadCreator.sendMessageAndSave({ 
+          message, 
+          phone, 
+          pdfPath: validPdfPath 
+        });
+        return res.send(response);
+      }
+
+      // Reintento de un envío ya realizado o en curso: devolver el mismo resultado
+      const previo = this.envios.get(idempotencyKey);
+      if (previo && previo.status === 'sent') {
+        res.set('Idempotent-Replayed', 'true');
+        return res.send(previo.response);
+      }
+      if (previo && previo.status === 'pending') {
+        res.set('Idempotent-Replayed', 'true');
+        return res.send(await previo.promise);
+      }
+
+      this.purgarEnvios();
+      const envio: EstadoEnvio = { status: 'pending', updatedAt: Date.now() };
+      envio.promise = this.leadCreator.sendMessageAndSave({
+        message,
+        phone,
+        pdfPath: validPdfPath
       });
-      
-      return res.send(response);
+      this.envios.set(idempotencyKey, envio);
+      try {
+        envio.response = await envio.promise;
+        envio.status = 'sent';
+      } catch (error) {
+        // Un envío fallido puede reintentarse con la misma clave
+        envio.status = 'error';
+        throw error;
+      } finally {
+        envio.promise = undefined;
+        envio.updatedAt = Date.now();
+      }
+      return res.send(envio.response);
     } catch (error) {
       console.error('Error en sendCtrl:', error);
       return res.status(500).send({ error: 'Error interno del servidor' });
     }
   };
 
+  // Estado de un envío por su Idempotency-Key, para clientes que perdieron la respuesta
+  public statusCtrl = async (req: Request, res: Response) => {
+    const envio = this.envios.get(req.params.key);
+    if (!envio) {
+      return res.status(404).send({ status: 'unknown' });
+    }
+    return res.send({ status: envio.status, response: envio.response });
+  };
+
   // Nuevo método para manejar mensajes entrantes de WhatsApp
   public handleIncomingMessage = async (req: Request, res: Response) => {
     try {
@@ -9,6 +9,11 @@ const router: Router = Router();
 const leadCtrl: LeadCtrl = container.get("lead.ctrl");
 router.post("/", leadCtrl.sendCtrl);
 
+/**
+ * http://localhost/lead/status/:key GET - Estado de un envío por Idempotency-Key
+ */
+router.get("/status/:key", leadCtrl.statusCtrl);
+
 /**
  * http://localhost/lead/webhook POST - Recibe mensajes entrantes
  */
@@ -1,20 +1,33 @@
 import os
 import json
 import logging
+import hmac
 import uuid
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, send_file, flash
+import time as time_module
+import multiprocessing
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, send_file, flash, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, date, time
-import threading
-import pymysql
+from datetime import datetime
 
 # Importar módulos propios
 from config import Config
 from models.diagnostico import Diagnostico
-from utils.report_generator import ReportGenerator
-from utils.email_sender import EmailSender
-from utils.whatsapp_sender import WhatsappSender
+from utils.report_generator import get_report_generator, huella_informe
+from utils.notificaciones import entregar_diagnostico, bandeja_salida
+from utils.job_queue import crear_cola, limitador_etapas, ColaLlenaError, ColaTrabajos
+from utils.status_store import crear_almacen_estado
+from utils.db_pool import get_pool
+from utils.record_cache import cache_registros
+from utils.write_buffer import get_buffer_escritura, buffer_escritura_existente
+from utils.local_store import get_almacen_local, almacen_local_existente
+from utils.diagnosis_cache import cache_diagnosticos
+from utils.rate_limiter import controlador_llm
+from utils.pdf_pool import pdf_pool_existente
+from utils.batch_import import ImportadorLote, leer_filas, formato_de
+from utils.attachment_cache import cache_adjuntos, leer_enlace, EnlaceInvalidoError, EnlaceExpiradoError
+from utils.metrics import registro as registro_metricas, span, muestras_de_estadisticas, TIPO_CONTENIDO
+from utils.agenda import agenda_citas, CitaNoValidaError, HorarioOcupadoError, CitaExistenteError
 
 # Cargar variables de entorno
 load_dotenv()
@@ -48,70 +61,8 @@ app.config['DB_CONFIG'] = {
 REPORTS_DIR = os.path.join(os.path.dirname(__file__), 'reports')
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-# Diccionario para almacenar el estado de los diagnósticos
-diagnostico_status = {}
-
-# Función para obtener los próximos 3 días laborables
-def get_next_workdays(days_ahead=3):
-    """Obtener los próximos 3 días laborables a partir de mañana"""
-    result = []
-    today = date.today()
-    day_count = 0
-    days_checked = 0
-    
-    # Comenzar desde mañana
-    current_date = today + timedelta(days=1)
-    
-    # Continuar hasta obtener el número de días laborables solicitados
-    while day_count < days_ahead and days_checked < 14:  # Límite de seguridad: 14 días
-        # Lunes = 0, Domingo = 6
-        weekday = current_date.weekday()
-        
-        # Si es día laborable (lunes a viernes)
-        if weekday < 5:  # 0-4 son lunes a viernes
-            # Formato: "DD-MM-YYYY"
-            result.append(current_date.strftime('%d-%m-%Y'))
-            day_count += 1
-        
-        current_date += timedelta(days=1)
-        days_checked += 1
-    
-    return result
-
-# Generar slots para horarios de consulta
-def generate_schedule_slots():
-    """Generar slots de horarios de 30 minutos con descanso de 15 minutos"""
-    slots = []
-    # Horario de trabajo: 9:00 AM - 5:00 PM
-    current_time = time(9, 0)  # 9:00 AM
-    end_time = time(17, 0)     # 5:00 PM
-    
-    while current_time < end_time:
-        # Hora actual
-        hour = current_time.hour
-        minute = current_time.minute
-        
-        # Calcular hora final (30 minutos después)
-        end_hour = hour
-        end_minute = minute + 30
-        
-        if end_minute >= 60:
-            end_hour += 1
-            end_minute -= 60
-        
-        # Formatear horario: "HH:MM - HH:MM"
-        time_slot = f"{hour:02d}:{minute:02d} - {end_hour:02d}:{end_minute:02d}"
-        slots.append(time_slot)
-        
-        # Avanzar 45 minutos (30 min de sesión + 15 min de descanso)
-        minute += 45
-        if minute >= 60:
-            hour += 1
-            minute -= 60
-        
-        current_time = time(hour, minute)
-    
-    return slots
+# Almacén compartido del estado de los diagnósticos
+status_store = crear_almacen_estado()
 
 # Rutas de la aplicación
 @app.route('/', methods=['GET', 'POST'])
@@ -125,10 +76,12 @@ def index():
             # Generar ID único para el diagnóstico
             diagnostico_id = str(uuid.uuid4().hex[:16])
             
-            # Iniciar el procesamiento en segundo plano
-            thread = threading.Thread(target=process_diagnostico, args=(form_data, diagnostico_id))
-            thread.daemon = True
-            thread.start()
+            # Encolar el procesamiento en segundo plano
+            try:
+                job_queue.submit(diagnostico_id, form_data)
+            except ColaLlenaError as e:
+                logger.warning(f"Cola de diagnósticos llena, se rechaza {diagnostico_id}: {str(e)}")
+                return "Estamos atendiendo muchas solicitudes, por favor intenta de nuevo en unos minutos.", 503
             
             # Redirigir a la página de procesamiento
             return redirect(url_for('processing', diagnostico_id=diagnostico_id))
@@ -145,9 +98,44 @@ def processing(diagnostico_id):
 
 @app.route('/check-status/<diagnostico_id>')
 def check_status(diagnostico_id):
-    status = diagnostico_status.get(diagnostico_id, {'status': 'processing'})
+    status = status_store.get(diagnostico_id) or {'status': 'processing'}
     return jsonify(status)
 
+@app.route('/stream-status/<diagnostico_id>')
+def stream_status(diagnostico_id):
+    """Envía los cambios de estado del diagnóstico mediante Server-Sent Events"""
+    def generar_eventos():
+        # Indicar al navegador cuánto esperar antes de reconectar
+        yield "retry: 3000\n\n"
+        
+        estado = status_store.get(diagnostico_id)
+        limite = time_module.time() + Config.STATUS_STREAM_TIMEOUT
+        while True:
+            yield f"data: {json.dumps(estado or {'status': 'processing'}, ensure_ascii=False)}\n\n"
+            if estado and estado.get('status') in ('completed', 'error'):
+                return
+            
+            # Esperar el siguiente cambio, enviando un comentario periódico para
+            # mantener viva la conexión a través de proxies
+            nuevo_estado = estado
+            while nuevo_estado == estado:
+                restante = limite - time_module.time()
+                if restante <= 0:
+                    # El navegador reconectará automáticamente
+                    return
+                nuevo_estado = status_store.esperar_cambio(
+                    diagnostico_id, estado, min(Config.STATUS_STREAM_HEARTBEAT, restante)
+                )
+                if nuevo_estado == estado:
+                    yield ": ping\n\n"
+            estado = nuevo_estado
+    
+    return Response(
+        stream_with_context(generar_eventos()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/success/<diagnostico_id>')
 def success(diagnostico_id):
     # Obtener información del diagnóstico
@@ -156,39 +144,62 @@ def success(diagnostico_id):
         flash("Diagnóstico no encontrado", "error")
         return redirect(url_for('index'))
     
-    # Obtener próximos días disponibles para consulta
-    available_dates = get_next_workdays(3)
-    
-    # Generar slots de horarios disponibles
-    available_slots = generate_schedule_slots()
+    # Calendario de consultas del día (precalculado) con los horarios ya reservados
+    agenda = agenda_citas.disponibilidad()
     
     return render_template('success.html', 
                           diagnostico_id=diagnostico_id,
-                          available_dates=available_dates,
-                          available_slots=available_slots,
+                          available_dates=agenda['fechas'],
+                          available_slots=agenda['horarios'],
+                          booked_slots=agenda['ocupados'],
                           diagnostico=diagnostico_info,
                           now=datetime.now())
 
 @app.route('/download-report/<diagnostico_id>')
 def download_report(diagnostico_id):
+    return _enviar_informe(diagnostico_id)
+
+@app.route('/report/<token>')
+def download_signed_report(token):
+    """Descarga mediante el enlace firmado enviado en lugar del adjunto"""
+    try:
+        diagnostico_id = leer_enlace(token)
+    except EnlaceExpiradoError:
+        return "El enlace de descarga ha caducado", 410
+    except EnlaceInvalidoError:
+        return "Enlace de descarga no válido", 404
+    return _enviar_informe(diagnostico_id)
+
+def _enviar_informe(diagnostico_id):
+    """Envía el PDF de un diagnóstico con validación condicional por ETag"""
     try:
         # Obtener información del diagnóstico
         diagnostico_info = get_diagnostico_by_id(diagnostico_id)
-        if not diagnostico_info:
+        if not diagnostico_info or diagnostico_info.get('simulado'):
             return "Diagnóstico no encontrado", 404
         
-        # Ruta al informe PDF
-        report_path = os.path.join(REPORTS_DIR, f"diagnostico_{diagnostico_id}.pdf")
+        # El ETag es el hash del contenido: si el cliente ya tiene el informe no se toca el disco
+        huella = huella_informe(diagnostico_info)
+        if request.if_none_match.contains(huella):
+            return Response(status=304, headers={'ETag': f'"{huella}"'})
+        
+        # Obtener el informe almacenado, renderizándolo en la primera descarga
+        with limitador_etapas.etapa('pdf'):
+            report_path = get_report_generator().obtener_pdf(diagnostico_info)
         
         # Verificar si el archivo existe
-        if not os.path.exists(report_path):
+        if not report_path:
             return "El informe PDF no está disponible", 404
         
-        # Enviar el archivo como descarga
+        # Enviar el archivo como descarga (responde 304 a If-Modified-Since)
         return send_file(
             report_path,
             as_attachment=True,
-            download_name=f"Diagnóstico_Bienestar_{diagnostico_id}.pdf"
+            download_name=f"Diagnóstico_Bienestar_{diagnostico_id}.pdf",
+            etag=huella,
+            last_modified=os.path.getmtime(report_path),
+            max_age=Config.PDF_CACHE_MAX_AGE,
+            conditional=True
         )
     except Exception as e:
         logger.error(f"Error al descargar reporte: {str(e)}", exc_info=True)
@@ -204,6 +215,131 @@ def view_report(diagnostico_id):
     # Mostrar el informe en HTML
     return render_template('report.html', diagnostico=diagnostico_info, now=datetime.now())
 
+@app.route('/notification-status/<diagnostico_id>')
+def notification_status(diagnostico_id):
+    """Estado de entrega del correo y el WhatsApp de un diagnóstico"""
+    return jsonify(bandeja_salida.estado(diagnostico_id))
+
+def _stats_si_existe(componente):
+    """Estadísticas de un componente creado bajo demanda; None si este proceso aún no lo creó"""
+    return componente.stats() if componente is not None else None
+
+def _estadisticas():
+    """Estadísticas de los componentes del proceso (cola, pools, cachés)"""
+    return {
+        'job_queue': job_queue.stats(),
+        'batch_queue': cola_lotes.stats(),
+        'outbox': bandeja_salida.stats(),
+        'status_store': status_store.stats(),
+        'db_pool': get_pool().stats(),
+        'record_cache': cache_registros.stats(),
+        'write_buffer': _stats_si_existe(buffer_escritura_existente()),
+        'local_store': _stats_si_existe(almacen_local_existente()),
+        'diagnosis_cache': cache_diagnosticos.stats() if cache_diagnosticos is not None else None,
+        'llm_rate_limiter': controlador_llm.stats(),
+        'pdf_pool': _stats_si_existe(pdf_pool_existente()),
+        'attachment_cache': cache_adjuntos.stats(),
+        'agenda': agenda_citas.stats()
+    }
+
+@app.route('/api/stats')
+def api_stats():
+    """Estadísticas internas de la cola, el almacén de estado y el pool de conexiones"""
+    return jsonify(_estadisticas())
+
+def _recolectar_estadisticas():
+    """Recolector de /metrics: profundidad de colas, pools y cachés en el momento de la consulta"""
+    muestras = []
+    for componente, stats in _estadisticas().items():
+        muestras.extend(muestras_de_estadisticas(componente, stats))
+    return [('component_stat', 'gauge', 'Estadísticas de los componentes (las mismas que /api/stats)', muestras)]
+
+registro_metricas.recolector(_recolectar_estadisticas)
+
+@app.route('/metrics')
+def metrics():
+    """Métricas del proceso en el formato de exposición de Prometheus"""
+    if not Config.METRICS_ENABLED:
+        return "Métricas deshabilitadas", 404
+    return Response(registro_metricas.exponer(), mimetype=None, content_type=TIPO_CONTENIDO)
+
+def _rechazo_lotes():
+    """
+    Comprueba el token de la API de lotes.
+    
+    Returns:
+        tuple: Respuesta de error, o None si la petición está autorizada
+    """
+    if not Config.BATCH_API_TOKEN:
+        return jsonify({
+            "success": False,
+            "error": "La importación por API está deshabilitada; usa python -m utils.batch_import"
+        }), 404
+    esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+    if esquema != 'Bearer' or not hmac.compare_digest(token.encode('utf-8'), Config.BATCH_API_TOKEN.encode('utf-8')):
+        return jsonify({"success": False, "error": "No autorizado"}), 401
+    return None
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """Encola un lote de encuestas (CSV o JSONL); el resultado por fila se consulta en /api/batch/<lote_id>"""
+    rechazo = _rechazo_lotes()
+    if rechazo is not None:
+        return rechazo
+    try:
+        archivo = request.files.get('archivo')
+        if archivo is not None:
+            contenido = archivo.read().decode('utf-8')
+            formato = request.form.get('formato') or formato_de(archivo.filename or '')
+        else:
+            contenido = request.get_data(as_text=True)
+            formato = request.args.get('formato') or ('jsonl' if 'json' in (request.mimetype or '') else 'csv')
+        
+        filas = leer_filas(contenido, formato)
+        if not filas:
+            return jsonify({"success": False, "error": "El archivo no contiene filas"}), 400
+        if len(filas) > Config.BATCH_MAX_ROWS:
+            return jsonify({
+                "success": False,
+                "error": f"El lote supera el máximo de {Config.BATCH_MAX_ROWS} filas"
+            }), 413
+        
+        # Las notificaciones masivas deben pedirse explícitamente
+        notificar = request.args.get('notificar', 'false').lower() == 'true'
+        lote_id = f"lote-{uuid.uuid4().hex[:16]}"
+        cola_lotes.submit(lote_id, {'filas': filas, 'notificar': notificar})
+        return jsonify({
+            "success": True,
+            "id": lote_id,
+            "total": len(filas),
+            "status_url": url_for('api_batch_status', lote_id=lote_id)
+        }), 202
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except ColaLlenaError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error al encolar lote: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/batch/<lote_id>')
+def api_batch_status(lote_id):
+    """Estado de un lote encolado y, al terminar, el resultado por fila"""
+    rechazo = _rechazo_lotes()
+    if rechazo is not None:
+        return rechazo
+    trabajo = cola_lotes.consultar([lote_id]).get(lote_id)
+    if trabajo is None:
+        return jsonify({"success": False, "error": "Lote no encontrado"}), 404
+    return jsonify({
+        "success": True,
+        "id": lote_id,
+        "status": trabajo['status'],
+        "attempts": trabajo['attempts'],
+        "last_error": trabajo['last_error'],
+        **(status_store.get(lote_id) or {})
+    })
+
 @app.route('/api/schedule', methods=['POST'])
 def api_schedule():
     try:
@@ -220,19 +356,27 @@ def api_schedule():
         
         # Obtener información del diagnóstico
         diagnostico_info = get_diagnostico_by_id(diagnostico_id)
-        if not diagnostico_info:
+        if not diagnostico_info or diagnostico_info.get('simulado'):
             return jsonify({
                 "success": False,
                 "error": "Diagnóstico no encontrado"
             }), 404
         
-        # Actualizar información de la cita en la base de datos
-        # (implementación pendiente)
+        # Reservar el horario (un horario no puede reservarse dos veces)
+        try:
+            cita = agenda_citas.reservar(diagnostico_id, fecha, hora, data.get('notas'))
+        except CitaNoValidaError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        except HorarioOcupadoError as e:
+            return jsonify({"success": False, "error": str(e), "slot_taken": True}), 409
+        except CitaExistenteError as e:
+            return jsonify({"success": False, "error": str(e)}), 409
         
         # Devolver respuesta exitosa
         return jsonify({
             "success": True,
-            "message": "Cita agendada correctamente"
+            "message": "Cita agendada correctamente",
+            "cita": cita
         })
     except Exception as e:
         logger.error(f"Error al agendar cita: {str(e)}", exc_info=True)
@@ -241,122 +385,177 @@ def api_schedule():
             "error": f"Error al agendar cita: {str(e)}"
         }), 500
 
-# Función para procesar el diagnóstico (se ejecuta en segundo plano)
+# Función para procesar el diagnóstico (se ejecuta en la cola de trabajos)
 def process_diagnostico(form_data, diagnostico_id):
+    with span('job', diagnostico_id=diagnostico_id):
+        _procesar_diagnostico(form_data, diagnostico_id)
+
+# Progreso publicado tras guardar el diagnóstico: un reintento a partir de aquí
+# reutiliza el registro guardado en lugar de volver a generarlo
+PROGRESO_GUARDADO = 75
+
+def _registro_guardado(diagnostico_id):
+    """
+    Obtiene el registro de un intento anterior que llegó a guardarse.
+    
+    Returns:
+        dict: Registro guardado o None si hay que generar el diagnóstico
+    """
+    previo = status_store.get(diagnostico_id) or {}
+    if previo.get('progress', 0) < PROGRESO_GUARDADO:
+        return None
+    registro = get_diagnostico_by_id(diagnostico_id)
+    if not registro or registro.get('simulado'):
+        return None
+    return registro
+
+def _procesar_diagnostico(form_data, diagnostico_id):
     try:
+        registro = _registro_guardado(diagnostico_id)
+        if registro is not None:
+            # Reintento tras guardar: solo queda registrar las notificaciones (idempotente)
+            logger.info(f"Diagnóstico {diagnostico_id} ya guardado, se reanuda en la entrega")
+            diagnostico = Diagnostico.desde_registro(registro)
+            _entregar_y_completar(diagnostico, diagnostico_id)
+            return
+        
         # Actualizar estado
-        diagnostico_status[diagnostico_id] = {'status': 'processing', 'progress': 10}
+        status_store.set(diagnostico_id, {'status': 'processing', 'progress': 10})
         
         # Crear instancia del diagnóstico
-        diagnostico = Diagnostico(form_data)
+        with span('form_parse', diagnostico_id=diagnostico_id):
+            diagnostico = Diagnostico(form_data)
         
         # Actualizar estado
-        diagnostico_status[diagnostico_id] = {'status': 'processing', 'progress': 25}
+        status_store.set(diagnostico_id, {'status': 'processing', 'progress': 25})
+        
+        # Publicar el texto parcial a medida que llega, sin saturar el almacén de estado
+        ultima_publicacion = [0]
+        def publicar_parcial(seccion, texto):
+            ahora = time_module.time()
+            if ahora - ultima_publicacion[0] < Config.STATUS_PARTIAL_INTERVAL:
+                return
+            ultima_publicacion[0] = ahora
+            status_store.set(diagnostico_id, {
+                'status': 'processing',
+                'progress': 25 if seccion == 'diagnostico' else 40,
+                'seccion': seccion,
+                'parcial': texto
+            })
         
         # Generar diagnóstico usando IA
-        diagnostico.generar_diagnostico()
+        with limitador_etapas.etapa('llm'):
+            diagnostico.generar_diagnostico(on_parcial=publicar_parcial)
         
         # Actualizar estado
-        diagnostico_status[diagnostico_id] = {'status': 'processing', 'progress': 50}
+        status_store.set(diagnostico_id, {'status': 'processing', 'progress': 50})
         
         # Guardar en la base de datos
-        diagnostico.guardar_en_db(diagnostico_id)
+        with limitador_etapas.etapa('db'), span('db_write', diagnostico_id=diagnostico_id):
+            diagnostico.guardar_en_db(diagnostico_id)
         
         # Actualizar estado
-        diagnostico_status[diagnostico_id] = {'status': 'processing', 'progress': 75}
-        
-        # Generar informe PDF
-        report_generator = ReportGenerator()
-        pdf_path = report_generator.generate_pdf(diagnostico.get_data(), diagnostico_id)
+        status_store.set(diagnostico_id, {'status': 'processing', 'progress': PROGRESO_GUARDADO})
         
-        # Enviar por correo electrónico si se proporcionó email
-        if diagnostico.email:
-            email_sender = EmailSender()
-            email_sender.send_email(
-                to_email=diagnostico.email,
-                subject="Tu diagnóstico de bienestar está listo",
-                nombre=diagnostico.nombre,
-                diagnostico_id=diagnostico_id,
-                pdf_path=pdf_path
-            )
-        
-        # Enviar por WhatsApp si se proporcionó número de teléfono
-        if diagnostico.telefono:
-            whatsapp_sender = WhatsappSender()
-            whatsapp_sender.send_message(
-                para=diagnostico.telefono,
-                datos=diagnostico.get_data(),
-                pdf_path=pdf_path
-            )
-        
-        # Actualizar estado final
-        diagnostico_status[diagnostico_id] = {
-            'status': 'completed',
-            'progress': 100,
-            'redirect_url': f'/success/{diagnostico_id}'
-        }
+        _entregar_y_completar(diagnostico, diagnostico_id)
         
     except Exception as e:
+        # La cola se encarga de reintentar; el error se publica al agotar los intentos
         logger.error(f"Error al procesar diagnóstico {diagnostico_id}: {str(e)}", exc_info=True)
-        diagnostico_status[diagnostico_id] = {
-            'status': 'error',
-            'error': str(e)
-        }
+        raise
 
-# Función para obtener diagnóstico por ID
-def get_diagnostico_by_id(diagnostico_id):
-    try:
-        # Conectar a la base de datos
-        conn = pymysql.connect(
-            host=Config.DB_HOST,
-            user=Config.DB_USER,
-            password=Config.DB_PASSWORD,
-            database=Config.DB_NAME,
-            port=Config.DB_PORT,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        
-        with conn.cursor() as cursor:
-            # Consultar el diagnóstico
-            sql = "SELECT * FROM diagnosticos WHERE id = %s"
-            cursor.execute(sql, (diagnostico_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                # Calcular IMC nuevamente si hay peso y estatura pero no IMC
-                if result.get('peso') and result.get('estatura') and not result.get('imc'):
-                    try:
-                        peso = float(result['peso'])
-                        estatura = float(result['estatura'])
-                        if estatura > 0:
-                            result['imc'] = round(peso / (estatura ** 2), 2)
-                    except (ValueError, TypeError):
-                        pass
-                
-                logger.info(f"Diagnóstico encontrado: {diagnostico_id}")
-                return result
-            
-            # Si no se encuentra, buscar en archivos locales (respaldo)
-            logger.warning(f"Diagnóstico no encontrado en base de datos: {diagnostico_id}")
-    except Exception as e:
-        logger.error(f"Error al obtener diagnóstico {diagnostico_id} de la base de datos: {str(e)}", exc_info=True)
+def _entregar_y_completar(diagnostico, diagnostico_id):
+    """Registra las notificaciones y publica el estado final"""
+    # Registrar las notificaciones; se envían en segundo plano desde la bandeja de salida
+    with limitador_etapas.etapa('notify'):
+        entregar_diagnostico(diagnostico, diagnostico_id)
     
-    # Intento de respaldo - buscar en archivo local
+    # Actualizar estado final
+    status_store.set(diagnostico_id, {
+        'status': 'completed',
+        'progress': 100,
+        'redirect_url': f'/success/{diagnostico_id}'
+    })
+
+def on_diagnostico_failed(form_data, diagnostico_id, error):
+    """Publica el error cuando un diagnóstico agota sus reintentos"""
+    status_store.set(diagnostico_id, {
+        'status': 'error',
+        'error': str(error)
+    })
+
+# Cola de trabajos para el procesamiento de diagnósticos
+job_queue = crear_cola(process_diagnostico, on_failure=on_diagnostico_failed)
+
+def process_lote(payload, lote_id):
+    """Procesa un lote encolado desde /api/batch y publica el resultado por fila"""
+    informe = ImportadorLote(notificar=payload.get('notificar', False)).procesar(payload['filas'], lote_id=lote_id)
+    status_store.set(lote_id, informe)
+
+def on_lote_failed(payload, lote_id, error):
+    """Publica el error cuando un lote agota sus reintentos"""
+    status_store.set(lote_id, {'error': str(error)})
+
+# Cola de lotes: pocos trabajos largos, separados de los diagnósticos individuales
+cola_lotes = ColaTrabajos(
+    process_lote,
+    on_failure=on_lote_failed,
+    db_path=Config.BATCH_JOB_DB_PATH,
+    workers=Config.BATCH_JOB_WORKERS,
+    max_pending=Config.BATCH_JOB_MAX_PENDING
+)
+# Los procesos auxiliares (p. ej. el pool de renderizado PDF) pueden reimportar
+# este módulo; solo el proceso principal despacha trabajos
+if multiprocessing.parent_process() is None:
+    job_queue.start()
+    cola_lotes.start()
+    bandeja_salida.start()
+
+SQL_BUSCAR_DIAGNOSTICO = "SELECT * FROM diagnosticos WHERE id = %s"
+
+def buscar_registro_sin_bd(diagnostico_id):
+    """Busca un diagnóstico en la caché y en el spool de escritura diferida, sin consultar MySQL"""
+    # Los registros son inmutables tras guardarse, se sirven desde la caché si es posible
+    cached = cache_registros.get(diagnostico_id)
+    if cached is not None:
+        return cached
+    
+    # Registros guardados con escritura diferida que aún no se volcaron a MySQL
+    if Config.DB_WRITE_BEHIND:
+        pendiente = get_buffer_escritura().buscar(diagnostico_id)
+        if pendiente is not None:
+            return pendiente
+    return None
+
+def completar_registro_bd(diagnostico_id, result):
+    """Completa un registro leído de MySQL y lo guarda en la caché"""
+    # Calcular IMC nuevamente si hay peso y estatura pero no IMC
+    if result.get('peso') and result.get('estatura') and not result.get('imc'):
+        try:
+            peso = float(result['peso'])
+            estatura = float(result['estatura'])
+            if estatura > 0:
+                result['imc'] = round(peso / (estatura ** 2), 2)
+        except (ValueError, TypeError):
+            pass
+    
+    logger.info(f"Diagnóstico encontrado: {diagnostico_id}")
+    cache_registros.put(diagnostico_id, result)
+    return result
+
+def buscar_registro_respaldo(diagnostico_id):
+    """Busca un diagnóstico en el almacén local o devuelve datos simulados"""
+    # Intento de respaldo - buscar en el almacén local
     try:
-        import json
-        import os
-        
-        # Verificar si existe archivo de datos en modo desarrollo
-        data_file = os.path.join(os.path.dirname(__file__), 'data', f"diagnostico_{diagnostico_id}.json")
-        if os.path.exists(data_file):
-            with open(data_file, 'r', encoding='utf-8') as f:
-                logger.info(f"Diagnóstico encontrado en archivo local: {diagnostico_id}")
-                return json.load(f)
-    except Exception as json_error:
-        logger.error(f"Error al leer archivo de respaldo: {str(json_error)}")
+        result = get_almacen_local().buscar(diagnostico_id)
+        if result is not None:
+            logger.info(f"Diagnóstico encontrado en el almacén local: {diagnostico_id}")
+            cache_registros.put(diagnostico_id, result)
+            return result
+    except Exception as local_error:
+        logger.error(f"Error al leer el almacén local: {str(local_error)}")
     
-    # Si no se encuentra ni en la base de datos ni en archivos, devolver datos simulados
+    # Si no se encuentra ni en la base de datos ni en el almacén local, devolver datos simulados
     logger.warning(f"Usando datos simulados para diagnóstico: {diagnostico_id}")
     return {
         'id': diagnostico_id,
@@ -366,9 +565,33 @@ def get_diagnostico_by_id(diagnostico_id):
         'fecha': datetime.now().strftime('%d-%m-%Y'),
         'estado': 'completado',
         'diagnostico': 'Diagnóstico simulado para un usuario con buena salud general pero que podría beneficiarse de mejoras en su rutina diaria.',
-        'recomendaciones': 'Recomendaciones simuladas: Aumentar actividad física, mejorar la calidad del sueño y mantener una dieta equilibrada.'
+        'recomendaciones': 'Recomendaciones simuladas: Aumentar actividad física, mejorar la calidad del sueño y mantener una dieta equilibrada.',
+        'simulado': True
     }
 
+# Función para obtener diagnóstico por ID
+def get_diagnostico_by_id(diagnostico_id):
+    registro = buscar_registro_sin_bd(diagnostico_id)
+    if registro is not None:
+        return registro
+    
+    try:
+        # Obtener una conexión del pool compartido
+        with get_pool().conexion() as conn, conn.cursor() as cursor:
+            # Consultar el diagnóstico
+            cursor.execute(SQL_BUSCAR_DIAGNOSTICO, (diagnostico_id,))
+            result = cursor.fetchone()
+            
+            if result:
+                return completar_registro_bd(diagnostico_id, result)
+            
+            # Si no se encuentra, buscar en archivos locales (respaldo)
+            logger.warning(f"Diagnóstico no encontrado en base de datos: {diagnostico_id}")
+    except Exception as e:
+        logger.error(f"Error al obtener diagnóstico {diagnostico_id} de la base de datos: {str(e)}", exc_info=True)
+    
+    return buscar_registro_respaldo(diagnostico_id)
+
 # Punto de entrada para ejecutar la aplicación
 if __name__ == "__main__":
     # Verificar conexión a la base de datos y crear tablas si es necesario
@@ -0,0 +1,455 @@
+"""
+Modo de servicio asíncrono (ASGI) de la aplicación.
+
+    uvicorn asgi:app --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 asgi:app
+
+Las rutas en las que el usuario espera (estado del diagnóstico y su flujo SSE,
+estado de las notificaciones, vista y descarga del informe) se atienden como
+corrutinas: las consultas a MySQL usan aiomysql, todas las conexiones SSE de un
+proceso comparten un único VigilanteEstados y los informes se envían por bloques
+sin ocupar un hilo durante la descarga. El resto de rutas (formulario, agenda,
+lotes, estadísticas) se ejecuta en la aplicación Flask dentro de un pool de
+ASGI_THREADS hilos.
+
+El modo con hilos (python app.py o gunicorn app:app) sigue disponible sin cambios.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import logging
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from flask import render_template
+from werkzeug.http import (
+    dump_options_header, http_date, is_resource_modified, parse_if_range_header,
+    parse_range_header, quote_etag
+)
+
+import app as aplicacion
+from config import Config
+from utils.db_async import get_pool_async
+from utils.status_store import VigilanteEstados
+from utils.report_generator import get_report_generator, huella_informe
+from utils.job_queue import limitador_etapas
+from utils.attachment_cache import leer_enlace, EnlaceInvalidoError, EnlaceExpiradoError
+from utils.metrics import registro as registro_metricas, muestras_de_estadisticas
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de los bloques con los que se envían los informes
+BLOQUE_ARCHIVO = 256 * 1024
+
+# Hilos para las rutas de Flask y las operaciones que no tienen versión asíncrona
+ejecutor = ThreadPoolExecutor(max_workers=Config.ASGI_THREADS, thread_name_prefix='asgi')
+
+# Una sola consulta periódica para todas las conexiones que esperan un cambio de estado
+vigilante_estados = VigilanteEstados(aplicacion.status_store)
+
+
+def _environ(scope, cuerpo=b''):
+    """Construye el entorno WSGI (PEP 3333) de una petición ASGI"""
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1] or 80),
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[nombre] = valor
+            continue
+        clave = f'HTTP_{nombre}'
+        environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    if cuerpo and 'CONTENT_LENGTH' not in environ:
+        environ['CONTENT_LENGTH'] = str(len(cuerpo))
+    return environ
+
+
+def _cabeceras_asgi(cabeceras):
+    """Convierte pares (nombre, valor) en cabeceras ASGI"""
+    return [(nombre.lower().encode('latin-1'), str(valor).encode('latin-1')) for nombre, valor in cabeceras]
+
+
+async def _responder(send, status, cuerpo=b'', cabeceras=(), content_type='text/html; charset=utf-8'):
+    """Envía una respuesta completa"""
+    if isinstance(cuerpo, str):
+        cuerpo = cuerpo.encode('utf-8')
+    cabeceras = [('Content-Type', content_type), ('Content-Length', len(cuerpo)), *cabeceras]
+    await send({'type': 'http.response.start', 'status': status, 'headers': _cabeceras_asgi(cabeceras)})
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+async def _responder_json(send, datos, status=200):
+    """Envía un JSON con el mismo formato que jsonify()"""
+    respuesta = aplicacion.app.json.response(datos)
+    await _responder(send, status, respuesta.get_data(), content_type=respuesta.content_type)
+
+
+def _vigilar_desconexion(receive):
+    """
+    Lanza una tarea que detecta cuando el cliente cierra la conexión.
+
+    Returns:
+        tuple: (asyncio.Event que se activa al desconectarse, tarea a cancelar al terminar)
+    """
+    desconectado = asyncio.Event()
+
+    async def escuchar():
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'http.disconnect':
+                desconectado.set()
+                return
+
+    return desconectado, asyncio.create_task(escuchar())
+
+
+class PuenteWSGI:
+    """
+    Ejecuta la aplicación Flask desde ASGI en el pool de hilos. A diferencia de
+    un adaptador con un único hilo, cada petición ocupa un hilo distinto.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        limite = aplicacion.app.config.get('MAX_CONTENT_LENGTH')
+        partes, tamano = [], 0
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'http.disconnect':
+                return
+            partes.append(mensaje.get('body', b''))
+            tamano += len(partes[-1])
+            if limite and tamano > limite:
+                await _responder(send, 413, "El contenido enviado es demasiado grande")
+                return
+            if not mensaje.get('more_body'):
+                break
+
+        environ = _environ(scope, b''.join(partes))
+        inicio = {}
+
+        def start_response(status, headers, exc_info=None):
+            inicio['status'] = int(status.split(' ', 1)[0])
+            inicio['headers'] = headers
+            return lambda data: (_ for _ in ()).throw(NotImplementedError("write() no está soportado"))
+
+        def ejecutar():
+            resultado = self.wsgi_app(environ, start_response)
+            iterador = iter(resultado)
+            return resultado, iterador, next(iterador, None)
+
+        resultado, iterador, bloque = await asyncio.to_thread(ejecutar)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': inicio['status'],
+                'headers': _cabeceras_asgi(inicio['headers'])
+            })
+            while bloque is not None:
+                if bloque:
+                    await send({'type': 'http.response.body', 'body': bloque, 'more_body': True})
+                bloque = await asyncio.to_thread(next, iterador, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(resultado, 'close'):
+                await asyncio.to_thread(resultado.close)
+
+
+async def obtener_diagnostico(diagnostico_id):
+    """
+    Versión asíncrona de get_diagnostico_by_id: caché y spool, MySQL y respaldo local.
+
+    Args:
+        diagnostico_id (str): ID del diagnóstico
+
+    Returns:
+        dict: Registro del diagnóstico (simulado si no se encuentra)
+    """
+    registro = await asyncio.to_thread(aplicacion.buscar_registro_sin_bd, diagnostico_id)
+    if registro is not None:
+        return registro
+
+    try:
+        result = await get_pool_async().consultar_uno(aplicacion.SQL_BUSCAR_DIAGNOSTICO, (diagnostico_id,))
+        if result:
+            return await asyncio.to_thread(aplicacion.completar_registro_bd, diagnostico_id, result)
+        logger.warning(f"Diagnóstico no encontrado en base de datos: {diagnostico_id}")
+    except Exception as e:
+        logger.error(f"Error al obtener diagnóstico {diagnostico_id} de la base de datos: {str(e)}", exc_info=True)
+
+    return await asyncio.to_thread(aplicacion.buscar_registro_respaldo, diagnostico_id)
+
+
+async def check_status(scope, receive, send, diagnostico_id):
+    estado = await vigilante_estados.get(diagnostico_id) or {'status': 'processing'}
+    await _responder_json(send, estado)
+
+
+async def stream_status(scope, receive, send, diagnostico_id):
+    """Envía los cambios de estado del diagnóstico mediante Server-Sent Events"""
+    desconectado, escucha = _vigilar_desconexion(receive)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': _cabeceras_asgi([
+                ('Content-Type', 'text/event-stream; charset=utf-8'),
+                ('Cache-Control', 'no-cache'),
+                ('X-Accel-Buffering', 'no'),
+            ])
+        })
+
+        async def enviar(texto):
+            await send({'type': 'http.response.body', 'body': texto.encode('utf-8'), 'more_body': True})
+
+        # Indicar al navegador cuánto esperar antes de reconectar
+        await enviar("retry: 3000\n\n")
+        estado = await vigilante_estados.get(diagnostico_id)
+        limite = time.time() + Config.STATUS_STREAM_TIMEOUT
+        while not desconectado.is_set():
+            await enviar(f"data: {json.dumps(estado or {'status': 'processing'}, ensure_ascii=False)}\n\n")
+            if estado and estado.get('status') in ('completed', 'error'):
+                break
+
+            # Esperar el siguiente cambio, con un comentario periódico para los proxies
+            nuevo_estado = estado
+            while nuevo_estado == estado and not desconectado.is_set():
+                restante = limite - time.time()
+                if restante <= 0:
+                    break
+                nuevo_estado = await vigilante_estados.esperar_cambio(
+                    diagnostico_id, estado, min(Config.STATUS_STREAM_HEARTBEAT, restante)
+                )
+                if nuevo_estado == estado:
+                    await enviar(": ping\n\n")
+            if nuevo_estado == estado:
+                # Tiempo agotado o cliente desconectado: el navegador reconectará
+                break
+            estado = nuevo_estado
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        escucha.cancel()
+
+
+async def notification_status(scope, receive, send, diagnostico_id):
+    """Estado de entrega del correo y el WhatsApp de un diagnóstico"""
+    await _responder_json(send, await asyncio.to_thread(aplicacion.bandeja_salida.estado, diagnostico_id))
+
+
+async def view_report(scope, receive, send, diagnostico_id):
+    diagnostico_info = await obtener_diagnostico(diagnostico_id)
+    if not diagnostico_info:
+        await _responder(send, 404, "Diagnóstico no encontrado")
+        return
+
+    def renderizar():
+        with aplicacion.app.request_context(_environ(scope)):
+            return render_template('report.html', diagnostico=diagnostico_info, now=datetime.now())
+
+    await _responder(send, 200, await asyncio.to_thread(renderizar))
+
+
+async def download_report(scope, receive, send, diagnostico_id):
+    await _enviar_informe(scope, receive, send, diagnostico_id)
+
+
+async def download_signed_report(scope, receive, send, token):
+    """Descarga mediante el enlace firmado enviado en lugar del adjunto"""
+    try:
+        diagnostico_id = leer_enlace(token)
+    except EnlaceExpiradoError:
+        await _responder(send, 410, "El enlace de descarga ha caducado")
+        return
+    except EnlaceInvalidoError:
+        await _responder(send, 404, "Enlace de descarga no válido")
+        return
+    await _enviar_informe(scope, receive, send, diagnostico_id)
+
+
+def _obtener_pdf(diagnostico_info):
+    """Obtiene el informe almacenado, renderizándolo en la primera descarga (en un hilo)"""
+    with limitador_etapas.etapa('pdf'):
+        return get_report_generator().obtener_pdf(diagnostico_info)
+
+
+def _disposicion(nombre):
+    """Content-Disposition de una descarga, con el nombre en UTF-8 si no es ASCII"""
+    try:
+        nombre.encode('ascii')
+        return dump_options_header('attachment', {'filename': nombre})
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', nombre).encode('ascii', 'ignore').decode('ascii')
+        return dump_options_header('attachment', {
+            'filename': simple, 'filename*': f"UTF-8''{quote(nombre, safe='!#$&+-.^_`|~')}"
+        })
+
+
+async def _enviar_informe(scope, receive, send, diagnostico_id):
+    """Envía el PDF de un diagnóstico con validación condicional por ETag y rangos de bytes"""
+    iniciada = False
+    try:
+        diagnostico_info = await obtener_diagnostico(diagnostico_id)
+        if not diagnostico_info or diagnostico_info.get('simulado'):
+            await _responder(send, 404, "Diagnóstico no encontrado")
+            return
+
+        # El ETag es el hash del contenido: si el cliente ya tiene el informe no se toca el disco
+        huella = huella_informe(diagnostico_info)
+        environ = _environ(scope)
+        if not is_resource_modified(environ, etag=huella):
+            await _responder(send, 304, cabeceras=[('ETag', quote_etag(huella))])
+            return
+
+        report_path = await asyncio.to_thread(_obtener_pdf, diagnostico_info)
+        if not report_path:
+            await _responder(send, 404, "El informe PDF no está disponible")
+            return
+
+        info = await asyncio.to_thread(os.stat, report_path)
+        modificado = datetime.fromtimestamp(int(info.st_mtime), timezone.utc)
+        cabeceras = [
+            ('Content-Disposition', _disposicion(f"Diagnóstico_Bienestar_{diagnostico_id}.pdf")),
+            ('Last-Modified', http_date(modificado)),
+            ('Cache-Control', f'public, max-age={Config.PDF_CACHE_MAX_AGE}'),
+            ('Expires', http_date(time.time() + Config.PDF_CACHE_MAX_AGE)),
+            ('ETag', quote_etag(huella)),
+            ('Accept-Ranges', 'bytes'),
+        ]
+        if not is_resource_modified(environ, etag=huella, last_modified=modificado):
+            await _responder(send, 304, cabeceras=cabeceras[1:])
+            return
+
+        # Rangos de bytes (visores de PDF que descargan por partes), solo si If-Range coincide
+        inicio, fin, status = 0, info.st_size, 200
+        rango = parse_range_header(environ.get('HTTP_RANGE'))
+        if_range = parse_if_range_header(environ.get('HTTP_IF_RANGE'))
+        if rango is not None and len(rango.ranges) == 1 and (
+            (if_range.etag is None or if_range.etag == huella)
+            and (if_range.date is None or if_range.date >= modificado)
+        ):
+            limites = rango.range_for_length(info.st_size)
+            if limites is None:
+                await _responder(send, 416, cabeceras=[('Content-Range', f'bytes */{info.st_size}')])
+                return
+            inicio, fin = limites
+            status = 206
+            cabeceras.append(('Content-Range', f'bytes {inicio}-{fin - 1}/{info.st_size}'))
+
+        cabeceras = [('Content-Type', 'application/pdf'), ('Content-Length', fin - inicio), *cabeceras]
+        await send({'type': 'http.response.start', 'status': status, 'headers': _cabeceras_asgi(cabeceras)})
+        iniciada = True
+        if scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        desconectado, escucha = _vigilar_desconexion(receive)
+        fd = os.open(report_path, os.O_RDONLY)
+        try:
+            posicion = inicio
+            while posicion < fin and not desconectado.is_set():
+                bloque = await asyncio.to_thread(os.pread, fd, min(BLOQUE_ARCHIVO, fin - posicion), posicion)
+                if not bloque:
+                    break
+                posicion += len(bloque)
+                await send({'type': 'http.response.body', 'body': bloque, 'more_body': posicion < fin})
+            if posicion < fin and not desconectado.is_set():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            os.close(fd)
+            escucha.cancel()
+    except Exception as e:
+        logger.error(f"Error al descargar reporte: {str(e)}", exc_info=True)
+        if not iniciada:
+            await _responder(send, 500, f"Error al descargar reporte: {str(e)}")
+
+
+# Rutas atendidas como corrutinas (GET y HEAD); las demás pasan a Flask
+RUTAS_ASINCRONAS = [
+    (re.compile(r'^/check-status/([^/]+)$'), check_status),
+    (re.compile(r'^/stream-status/([^/]+)$'), stream_status),
+    (re.compile(r'^/notification-status/([^/]+)$'), notification_status),
+    (re.compile(r'^/view-report/([^/]+)$'), view_report),
+    (re.compile(r'^/download-report/([^/]+)$'), download_report),
+    (re.compile(r'^/report/([^/]+)$'), download_signed_report),
+]
+
+
+class AplicacionASGI:
+    """Aplicación ASGI: rutas asíncronas propias y Flask para el resto"""
+
+    def __init__(self, flask_app):
+        self.flask = PuenteWSGI(flask_app)
+        self._bucle = None
+
+    def _preparar_bucle(self):
+        """Usa el pool de ASGI_THREADS hilos para asyncio.to_thread() en el bucle actual"""
+        bucle = asyncio.get_running_loop()
+        if self._bucle is not bucle:
+            bucle.set_default_executor(ejecutor)
+            self._bucle = bucle
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._ciclo_de_vida(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self._preparar_bucle()
+
+        if scope['method'] in ('GET', 'HEAD'):
+            for patron, vista in RUTAS_ASINCRONAS:
+                coincidencia = patron.match(scope['path'])
+                if coincidencia:
+                    await vista(scope, receive, send, coincidencia.group(1))
+                    return
+        await self.flask(scope, receive, send)
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                self._preparar_bucle()
+                logger.info(f"Modo ASGI iniciado ({Config.ASGI_THREADS} hilos, MySQL con {get_pool_async().driver})")
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                await get_pool_async().close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def _recolectar_estadisticas():
+    """Recolector de /metrics con el estado del modo ASGI"""
+    muestras = muestras_de_estadisticas('status_watcher', vigilante_estados.stats())
+    muestras += muestras_de_estadisticas('db_pool_async', get_pool_async().stats())
+    return [('component_stat', 'gauge', 'Estadísticas de los componentes (las mismas que /api/stats)', muestras)]
+
+
+registro_metricas.recolector(_recolectar_estadisticas)
+
+app = AplicacionASGI(aplicacion.app)
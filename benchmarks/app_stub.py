@@ -0,0 +1,41 @@
+"""
+Aplicación web con MySQL simulado (utils.mysql_stub) para las pruebas de carga.
+
+benchmarks.journey la arranca con gunicorn:
+    gunicorn -w 2 -k gthread --threads 16 benchmarks.app_stub:app
+
+en modo ASGI (--asgi):
+    gunicorn -w 2 -k uvicorn.workers.UvicornWorker benchmarks.app_stub:asgi_app
+
+o, si gunicorn no está instalado, con el servidor de desarrollo con hilos:
+    python -m benchmarks.app_stub --port 5000
+
+Variables de entorno (además de las de la aplicación):
+    BENCH_MYSQL_PATH      Archivo SQLite que sustituye a MySQL (obligatoria)
+    BENCH_DB_LATENCY      Segundos simulados por sentencia SQL
+    BENCH_UPLOAD_FOLDER   Directorio de los informes publicados
+"""
+import os
+import argparse
+from config import Config
+
+if os.environ.get('BENCH_UPLOAD_FOLDER'):
+    Config.UPLOAD_FOLDER = os.environ['BENCH_UPLOAD_FOLDER']
+
+# aiomysql no puede usar el MySQL simulado: las consultas asíncronas van por el pool síncrono
+Config.DB_ASYNC_DRIVER = 'thread'
+
+from app import app  # noqa: E402
+from asgi import app as asgi_app  # noqa: E402,F401
+from utils import mysql_stub  # noqa: E402
+
+# Cada worker de gunicorn importa el módulo tras el fork y redirige su propio pool
+mysql_stub.instalar(os.environ['BENCH_MYSQL_PATH'], latency=float(os.environ.get('BENCH_DB_LATENCY', 0.002)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aplicación con MySQL simulado (servidor de desarrollo)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    app.run(host=args.host, port=args.port, threaded=True, use_reloader=False)
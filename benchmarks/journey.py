@@ -0,0 +1,557 @@
+"""
+Prueba de carga de la interfaz HTTP con el recorrido real de los usuarios.
+
+Cada usuario virtual repite el recorrido del navegador:
+    GET /  →  POST /  →  GET /processing/<id>  →  GET /check-status/<id> (cada --poll s)
+    →  GET /success/<id>  →  GET /view-report/<id>  →  GET /download-report/<id>
+
+La aplicación se arranca en un proceso aparte con gunicorn (o con el servidor de
+desarrollo si gunicorn no está instalado) contra los servicios simulados de
+benchmarks.pipeline, y los usuarios se añaden por escalones (--steps). Por escalón
+se informa la tasa de peticiones, los errores y la latencia de cada ruta, junto con
+la CPU, la memoria y los hilos del servidor y la profundidad de la cola.
+
+Uso:
+    python -m benchmarks.journey --steps 5,10,20,40 --step-duration 60 --workers 2 --threads 16
+    # Mismo recorrido con el modo ASGI (asgi.py) sobre workers de uvicorn
+    python -m benchmarks.journey --steps 5,10,20,40 --step-duration 60 --workers 2 --asgi
+    # Contra un servidor ya iniciado (sin medición de recursos salvo con --server-pid)
+    python -m benchmarks.journey --url http://localhost:5000 --steps 10,20
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+import requests
+
+from benchmarks.pipeline import (
+    BASE_DIR, preparar_entorno, esquema_formulario, encuesta_sintetica,
+    encuestas_de_ejemplo, percentiles
+)
+
+logger = logging.getLogger('benchmarks.journey')
+
+# Las rutas se agrupan sin el ID del diagnóstico
+_RUTA_CON_ID = re.compile(r'^/(processing|check-status|success|view-report|download-report)/[^/]+$')
+
+_TICKS_POR_SEGUNDO = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def normalizar_ruta(metodo, ruta):
+    """Nombre de la ruta en los resultados, p. ej. 'GET /check-status/<id>'"""
+    ruta = _RUTA_CON_ID.sub(r'/\1/<id>', ruta)
+    return f"{metodo} {ruta}"
+
+
+class Registro:
+    """Mediciones de todas las peticiones, agrupadas por escalón y ruta"""
+
+    def __init__(self):
+        self.escalon = 0
+        self._lock = threading.Lock()
+        self.peticiones = defaultdict(lambda: defaultdict(list))
+        self.errores = defaultdict(lambda: defaultdict(int))
+        self.detalle_errores = defaultdict(int)
+        self.recorridos = defaultdict(list)
+        self.recorridos_fallidos = defaultdict(int)
+
+    def peticion(self, ruta, segundos, error=None):
+        with self._lock:
+            self.peticiones[self.escalon][ruta].append(segundos)
+            if error:
+                self.errores[self.escalon][ruta] += 1
+                self.detalle_errores[f"{ruta}: {error}"] += 1
+
+    def recorrido(self, segundos=None):
+        with self._lock:
+            if segundos is None:
+                self.recorridos_fallidos[self.escalon] += 1
+            else:
+                self.recorridos[self.escalon].append(segundos)
+
+
+class UsuarioVirtual(threading.Thread):
+    """Repite el recorrido completo con su propia sesión HTTP hasta que se detiene la prueba"""
+
+    def __init__(self, n, args, base_url, encuestas, registro, detener):
+        super().__init__(name=f'usuario-{n}', daemon=True)
+        self.n = n
+        self.args = args
+        self.base_url = base_url
+        self.encuestas = encuestas
+        self.registro = registro
+        self.detener = detener
+        self.rng = random.Random(args.seed + n)
+        self.sesion = requests.Session()
+
+    def _pedir(self, metodo, ruta, esperado=(200,), **kwargs):
+        """Hace una petición, la registra y devuelve la respuesta (o None si falló)"""
+        nombre = normalizar_ruta(metodo, ruta)
+        inicio = time.monotonic()
+        try:
+            respuesta = self.sesion.request(
+                metodo, f"{self.base_url}{ruta}", timeout=self.args.request_timeout,
+                allow_redirects=False, **kwargs
+            )
+            # Las descargas cuentan hasta recibir el último byte
+            respuesta.content
+        except requests.RequestException as e:
+            self.registro.peticion(nombre, time.monotonic() - inicio, type(e).__name__)
+            return None
+        duracion = time.monotonic() - inicio
+        if respuesta.status_code not in esperado:
+            self.registro.peticion(nombre, duracion, f"HTTP {respuesta.status_code}")
+            return None
+        self.registro.peticion(nombre, duracion)
+        return respuesta
+
+    def _pensar(self):
+        """Pausa del usuario entre páginas"""
+        if self.args.think > 0:
+            self.detener.wait(self.rng.uniform(0.5, 1.5) * self.args.think)
+
+    def run(self):
+        while not self.detener.is_set():
+            # Los recorridos interrumpidos al terminar la prueba no cuentan como fallidos
+            if not self.recorrer() and not self.detener.is_set():
+                self.registro.recorrido(None)
+                # Evitar reintentos en bucle cerrado cuando el servidor rechaza peticiones
+                self.detener.wait(self.args.poll)
+
+    def recorrer(self):
+        """
+        Ejecuta un recorrido completo.
+
+        Returns:
+            bool: True si terminó con el informe descargado
+        """
+        if self._pedir('GET', '/') is None:
+            return False
+        self._pensar()
+
+        encuesta = dict(self.rng.choice(self.encuestas))
+        encuesta['email'] = f'carga+{self.n}-{self.rng.randrange(10 ** 6)}@example.com'
+        inicio = time.monotonic()
+        respuesta = self._pedir('POST', '/', esperado=(302,), data=encuesta)
+        if respuesta is None:
+            return False
+        diagnostico_id = respuesta.headers['Location'].rstrip('/').rsplit('/', 1)[-1]
+
+        if self._pedir('GET', f'/processing/{diagnostico_id}') is None:
+            return False
+
+        # El navegador consulta el estado cada pocos segundos hasta que termina
+        limite = inicio + self.args.journey_timeout
+        while True:
+            respuesta = self._pedir('GET', f'/check-status/{diagnostico_id}')
+            estado = respuesta.json().get('status') if respuesta is not None else None
+            if estado == 'completed':
+                break
+            if estado == 'error' or time.monotonic() > limite or self.detener.is_set():
+                return False
+            self.detener.wait(self.args.poll)
+
+        if self._pedir('GET', f'/success/{diagnostico_id}') is None:
+            return False
+        self._pensar()
+        if self._pedir('GET', f'/view-report/{diagnostico_id}') is None:
+            return False
+        if self._pedir('GET', f'/download-report/{diagnostico_id}') is None:
+            return False
+        self.registro.recorrido(time.monotonic() - inicio)
+        self._pensar()
+        return True
+
+
+def _leer(ruta):
+    try:
+        with open(ruta) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _arbol_procesos(pid):
+    """PIDs del proceso y todos sus descendientes (Linux)"""
+    hijos = defaultdict(list)
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        stat = _leer(f'/proc/{entrada}/stat')
+        if stat:
+            # El nombre del proceso va entre paréntesis y puede contener espacios
+            campos = stat.rsplit(')', 1)[-1].split()
+            hijos[int(campos[1])].append(int(entrada))
+    arbol, pendientes = [], [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        arbol.append(actual)
+        pendientes.extend(hijos.get(actual, []))
+    return arbol
+
+
+def _uso_proceso(pid):
+    """(ticks de CPU, RSS en KB, hilos) de un proceso, o None si ya no existe"""
+    stat, status = _leer(f'/proc/{pid}/stat'), _leer(f'/proc/{pid}/status')
+    if not stat or not status:
+        return None
+    campos = stat.rsplit(')', 1)[-1].split()
+    ticks = int(campos[11]) + int(campos[12])
+    valores = dict(linea.split(':', 1) for linea in status.splitlines() if ':' in linea)
+    rss = int(valores.get('VmRSS', '0 kB').split()[0])
+    return ticks, rss, int(valores.get('Threads', '0'))
+
+
+class MuestreadorServidor(threading.Thread):
+    """Toma muestras de CPU, memoria, hilos y procesos del árbol del servidor"""
+
+    def __init__(self, pid, registro, intervalo=1.0):
+        super().__init__(name='journey-recursos', daemon=True)
+        self.pid = pid
+        self.registro = registro
+        self.intervalo = intervalo
+        self.muestras = defaultdict(list)
+        self._detener = threading.Event()
+        self._previo = None
+
+    def stop(self):
+        self._detener.set()
+        self.join()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            usos = [u for u in map(_uso_proceso, _arbol_procesos(self.pid)) if u]
+            if not usos:
+                continue
+            ahora = time.monotonic()
+            ticks = sum(u[0] for u in usos)
+            cpu = None
+            if self._previo is not None:
+                cpu = (ticks - self._previo[1]) / _TICKS_POR_SEGUNDO / (ahora - self._previo[0]) * 100
+            self._previo = (ahora, ticks)
+            self.muestras[self.registro.escalon].append({
+                'cpu_percent': cpu,
+                'rss_kb': sum(u[1] for u in usos),
+                'threads': sum(u[2] for u in usos),
+                'processes': len(usos),
+            })
+
+    def resumen(self, escalon):
+        muestras = self.muestras.get(escalon)
+        if not muestras:
+            return {}
+        cpu = [m['cpu_percent'] for m in muestras if m['cpu_percent'] is not None]
+        return {
+            'cpu_percent_mean': round(sum(cpu) / len(cpu), 1) if cpu else None,
+            'cpu_percent_max': round(max(cpu), 1) if cpu else None,
+            'rss_mb_max': round(max(m['rss_kb'] for m in muestras) / 1024, 1),
+            'threads_max': max(m['threads'] for m in muestras),
+            'processes_max': max(m['processes'] for m in muestras),
+        }
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(args, directorio):
+    """
+    Arranca la aplicación con los servicios simulados en un proceso aparte.
+
+    Returns:
+        tuple: (subprocess.Popen, URL base)
+    """
+    from utils import mysql_stub
+
+    puerto = _puerto_libre()
+    mysql_path = os.path.join(directorio, 'mysql.sqlite3')
+    # Crear el esquema una sola vez antes de que arranquen los workers
+    mysql_stub.crear_esquema(mysql_path)
+    entorno = dict(os.environ, BENCH_MYSQL_PATH=mysql_path, BENCH_DB_LATENCY=str(args.db_latency),
+                   BENCH_UPLOAD_FOLDER=os.path.join(directorio, 'reports'), PYTHONPATH=BASE_DIR)
+
+    if shutil.which('gunicorn') and args.asgi and not args.dev_server:
+        comando = [
+            'gunicorn', '-w', str(args.workers), '-k', 'uvicorn.workers.UvicornWorker',
+            '-b', f'127.0.0.1:{puerto}', '--timeout', '120', '--log-level', 'warning',
+            'benchmarks.app_stub:asgi_app'
+        ]
+        entorno['ASGI_THREADS'] = str(args.threads)
+    elif shutil.which('gunicorn') and not args.dev_server:
+        comando = [
+            'gunicorn', '-w', str(args.workers), '-k', 'gthread', '--threads', str(args.threads),
+            '-b', f'127.0.0.1:{puerto}', '--timeout', '120', '--log-level', 'warning',
+            'benchmarks.app_stub:app'
+        ]
+    else:
+        if not args.dev_server:
+            logger.warning("gunicorn no está instalado: se usa el servidor de desarrollo con hilos")
+        comando = [sys.executable, '-m', 'benchmarks.app_stub', '--port', str(puerto)]
+
+    salida = open(os.path.join(directorio, 'server.log'), 'w')
+    # Grupo de procesos propio para detener también los workers y el pool de PDF
+    proceso = subprocess.Popen(comando, cwd=BASE_DIR, env=entorno, stdout=salida, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    base_url = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar; ver {salida.name}")
+        try:
+            if requests.get(f"{base_url}/api/stats", timeout=2).ok:
+                logger.info(f"Servidor listo en {base_url}: {' '.join(comando)}")
+                return proceso, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    detener_servidor(proceso)
+    raise RuntimeError("El servidor no respondió en 60 segundos")
+
+
+def detener_servidor(proceso):
+    """Detiene el servidor y todos sus procesos"""
+    if proceso.poll() is not None:
+        return
+    os.killpg(proceso.pid, signal.SIGTERM)
+    try:
+        proceso.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proceso.pid, signal.SIGKILL)
+        proceso.wait()
+
+
+def _profundidad_cola(base_url):
+    """Trabajos pendientes y en curso de la cola y la bandeja, según /api/stats"""
+    try:
+        stats = requests.get(f"{base_url}/api/stats", timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return None
+    return {
+        nombre: sum(v for k, v in (stats.get(nombre) or {}).items() if k in ('pending', 'running'))
+        for nombre in ('job_queue', 'outbox')
+    }
+
+
+def ejecutar(args):
+    """
+    Ejecuta la prueba de carga.
+
+    Returns:
+        dict: Resultados por escalón
+    """
+    directorio = tempfile.mkdtemp(prefix='vitalscan-journey-')
+    servidores, proceso = {}, None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        # preparar_entorno lleva todas las bases SQLite (trabajos, lotes, bandeja, métricas...) al
+        # directorio temporal; el servidor las hereda del entorno. Dimensiona JOB_MAX_PENDING con
+        # --jobs, que aquí no aplica
+        servidores = preparar_entorno(argparse.Namespace(**vars(args), jobs=0), directorio)
+        proceso, base_url = iniciar_servidor(args, directorio)
+
+    from models.diagnostico import RANGOS_NUMERICOS
+    rng = random.Random(args.seed)
+    esquema = esquema_formulario()
+    encuestas = encuestas_de_ejemplo() + [
+        encuesta_sintetica(esquema, RANGOS_NUMERICOS, rng, i) for i in range(200)
+    ]
+
+    registro = Registro()
+    detener = threading.Event()
+    pid_servidor = args.server_pid or (proceso.pid if proceso else None)
+    muestreador = MuestreadorServidor(pid_servidor, registro) if pid_servidor else None
+    if muestreador:
+        muestreador.start()
+
+    usuarios, escalones = [], []
+    try:
+        for n, objetivo in enumerate(args.steps):
+            registro.escalon = n
+            inicio = time.monotonic()
+            # Los usuarios nuevos se incorporan de forma escalonada
+            while len(usuarios) < objetivo:
+                usuario = UsuarioVirtual(len(usuarios), args, base_url, encuestas, registro, detener)
+                usuario.start()
+                usuarios.append(usuario)
+                if args.spawn_rate > 0:
+                    time.sleep(1 / args.spawn_rate)
+            time.sleep(max(0.0, inicio + args.step_duration - time.monotonic()))
+            duracion = time.monotonic() - inicio
+            escalones.append({'users': objetivo, 'seconds': round(duracion, 1),
+                              'queue_depth': _profundidad_cola(base_url)})
+            logger.info(f"Escalón de {objetivo} usuarios terminado en {duracion:.0f} s")
+    finally:
+        detener.set()
+        for usuario in usuarios:
+            usuario.join(timeout=args.request_timeout + 1)
+        if muestreador:
+            muestreador.stop()
+        estadisticas = None
+        if proceso:
+            try:
+                estadisticas = requests.get(f"{base_url}/api/stats", timeout=5).json()
+            except (requests.RequestException, ValueError):
+                pass
+            detener_servidor(proceso)
+        for servidor in servidores.values():
+            servidor.shutdown()
+
+    if args.url:
+        servidor = 'external'
+    elif args.dev_server or not shutil.which('gunicorn'):
+        servidor = 'dev'
+    else:
+        servidor = 'asgi' if args.asgi else 'gunicorn'
+    resultado = {
+        'config': {
+            'url': args.url,
+            'steps': args.steps,
+            'step_duration': args.step_duration,
+            'server': servidor,
+            'workers': args.workers if servidor in ('gunicorn', 'asgi') else None,
+            'threads': args.threads if servidor in ('gunicorn', 'asgi') else None,
+            'think': args.think,
+            'poll': args.poll,
+            'llm_latency': args.llm_latency,
+        },
+        'steps': [],
+        'errors': dict(sorted(registro.detalle_errores.items(), key=lambda e: -e[1])[:20]),
+        'server_stats': estadisticas,
+    }
+    for n, escalon in enumerate(escalones):
+        rutas = {}
+        total = errores = 0
+        for ruta, duraciones in sorted(registro.peticiones[n].items()):
+            fallos = registro.errores[n][ruta]
+            total += len(duraciones)
+            errores += fallos
+            rutas[ruta] = {
+                'rps': round(len(duraciones) / escalon['seconds'], 2),
+                'error_rate': round(fallos / len(duraciones), 4),
+                **percentiles(duraciones),
+            }
+        recorridos = registro.recorridos[n]
+        resultado['steps'].append({
+            **escalon,
+            'rps': round(total / escalon['seconds'], 2),
+            'error_rate': round(errores / total, 4) if total else 0.0,
+            'journeys': {
+                'completed': len(recorridos),
+                'failed': registro.recorridos_fallidos[n],
+                'per_minute': round(len(recorridos) / escalon['seconds'] * 60, 2),
+                **percentiles(recorridos),
+            },
+            'routes': rutas,
+            'server': muestreador.resumen(n) if muestreador else {},
+        })
+    resultado['sustained_users'] = usuarios_sostenidos(resultado['steps'], args)
+
+    if args.conservar:
+        resultado['directory'] = directorio
+    else:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return resultado
+
+
+def usuarios_sostenidos(escalones, args):
+    """
+    Mayor número de usuarios con errores (de peticiones y de recorridos) y latencia
+    del recorrido dentro de los límites.
+
+    Returns:
+        int: Usuarios del último escalón aceptable (0 si ninguno lo fue)
+    """
+    sostenidos = 0
+    for escalon in escalones:
+        recorridos = escalon['journeys']
+        intentos = recorridos['completed'] + recorridos['failed']
+        fallidos = recorridos['failed'] / intentos if intentos else 0.0
+        p95 = recorridos.get('p95_ms')
+        if (escalon['error_rate'] > args.max_error_rate or fallidos > args.max_error_rate
+                or p95 is None or p95 > args.max_journey_seconds * 1000):
+            break
+        sostenidos = escalon['users']
+    return sostenidos
+
+
+def imprimir(resultado):
+    """Muestra un resumen legible de los resultados"""
+    for escalon in resultado['steps']:
+        recorridos = escalon['journeys']
+        servidor = escalon['server']
+        print(f"\n== {escalon['users']} usuarios ({escalon['seconds']} s): {escalon['rps']} peticiones/s, "
+              f"{escalon['error_rate'] * 100:.2f}% errores, {recorridos['completed']} recorridos "
+              f"({recorridos['per_minute']}/min, p95 {recorridos.get('p95_ms', '-')} ms), "
+              f"{recorridos['failed']} fallidos")
+        if servidor:
+            print(f"   servidor: CPU media {servidor['cpu_percent_mean']}% (máx {servidor['cpu_percent_max']}%), "
+                  f"RSS {servidor['rss_mb_max']} MB, {servidor['threads_max']} hilos, "
+                  f"{servidor['processes_max']} procesos; cola {json.dumps(escalon['queue_depth'])}")
+        print(f"   {'ruta':<34}{'rps':>8}{'err %':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for ruta, p in escalon['routes'].items():
+            print(f"   {ruta:<34}{p['rps']:>8}{p['error_rate'] * 100:>8.2f}"
+                  f"{p['p50_ms']:>10}{p['p95_ms']:>10}{p['p99_ms']:>10}")
+    print(f"\nUsuarios concurrentes sostenidos: {resultado['sustained_users']}")
+    for error, veces in resultado['errors'].items():
+        print(f"Error ({veces}): {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prueba de carga con el recorrido completo de los usuarios')
+    parser.add_argument('--url', help='Servidor ya iniciado (por defecto se arranca uno con servicios simulados)')
+    parser.add_argument('--server-pid', type=int, help='PID del servidor externo para medir sus recursos')
+    parser.add_argument('--steps', type=lambda v: [int(x) for x in v.split(',')], default=[5, 10, 20],
+                        help='Usuarios concurrentes de cada escalón, p. ej. 5,10,20,40')
+    parser.add_argument('--step-duration', type=float, default=60, help='Segundos por escalón')
+    parser.add_argument('--spawn-rate', type=float, default=5, help='Usuarios nuevos por segundo')
+    parser.add_argument('--think', type=float, default=1.0, help='Segundos medios de pausa entre páginas')
+    parser.add_argument('--poll', type=float, default=3.0, help='Segundos entre consultas de estado (como el navegador)')
+    parser.add_argument('--request-timeout', type=float, default=30)
+    parser.add_argument('--journey-timeout', type=float, default=300, help='Segundos máximos hasta el diagnóstico')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Errores aceptables por escalón')
+    parser.add_argument('--max-journey-seconds', type=float, default=60, help='p95 aceptable del recorrido')
+    parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Hilos por worker de gunicorn (con --asgi, ASGI_THREADS de cada worker)')
+    parser.add_argument('--asgi', action='store_true', help='Servir asgi.py con workers de uvicorn')
+    parser.add_argument('--dev-server', action='store_true', help='Usar el servidor de desarrollo en lugar de gunicorn')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='Habilitar la caché de diagnósticos')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Segundos antes del primer token')
+    parser.add_argument('--llm-tps', type=float, default=200.0, help='Tokens por segundo del LLM simulado')
+    parser.add_argument('--llm-words', type=int, default=300, help='Palabras máximas por respuesta')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Proporción de respuestas 429')
+    parser.add_argument('--db-latency', type=float, default=0.002, help='Segundos por sentencia SQL')
+    parser.add_argument('--smtp-latency', type=float, default=0.05, help='Segundos al conectar y autenticar')
+    parser.add_argument('--whatsapp-latency', type=float, default=0.3, help='Segundos por mensaje')
+    parser.add_argument('--whatsapp-error-rate', type=float, default=0.0, help='Proporción de respuestas 500')
+    parser.add_argument('--json', help='Archivo donde guardar los resultados')
+    parser.add_argument('--conservar', action='store_true', help='No borrar el directorio temporal')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    resultado = ejecutar(args)
+    imprimir(resultado)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return 0 if resultado['sustained_users'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
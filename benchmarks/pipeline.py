@@ -0,0 +1,480 @@
+"""
+Benchmark del pipeline completo de diagnósticos con servicios simulados.
+
+Envía encuestas por el formulario web (POST /) y espera a que terminen el
+diagnóstico y las notificaciones, usando en lugar de los servicios externos:
+utils.llm_stub (OpenAI), utils.mysql_stub (MySQL sobre SQLite),
+utils.smtp_stub (correo) y utils.whatsapp_stub (API de WhatsApp).
+Todo el estado se escribe en un directorio temporal.
+
+Uso:
+    python -m benchmarks.pipeline --jobs 100 --llm-latency 0.5 --json resultado.json
+
+Las variables de entorno de la aplicación (JOB_WORKERS, JOB_STAGE_LIMITS,
+OPENAI_GENERATION_MODE, PDF_POOL_WORKERS...) se respetan, de modo que se pueden
+comparar configuraciones sin modificar el script.
+"""
+import os
+import sys
+import atexit
+import glob
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from html.parser import HTMLParser
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger('benchmarks.pipeline')
+
+# Campos de los registros de ejemplo que no forman parte del formulario
+CAMPOS_RESULTADO = ('diagnostico', 'recomendaciones', 'imc', 'nombre_completo', 'fecha_creacion',
+                    'fecha_actualizacion', 'estado', 'id')
+
+TEXTOS_LIBRES = {
+    'objetivos': ['Bajar de peso', 'Tener más energía', 'Dormir mejor', 'Mejorar mi digestión',
+                  'Ganar masa muscular', 'Reducir el estrés'],
+    'antecedentes': ['', 'Hipertensión', 'Diabetes tipo 2 en la familia', 'Gastritis'],
+    'comentarios': ['', '¿Qué debería cambiar primero?', 'Trabajo muchas horas sentado'],
+}
+
+
+class _EsquemaFormulario(HTMLParser):
+    """Extrae de templates/index.html las opciones de cada select y grupo de casillas"""
+
+    def __init__(self):
+        super().__init__()
+        self.opciones = defaultdict(list)
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'select':
+            self._select = attrs.get('name')
+        elif tag == 'option' and self._select and attrs.get('value'):
+            self.opciones[self._select].append(attrs['value'])
+        elif tag == 'input' and attrs.get('type') == 'checkbox' and attrs.get('name') and attrs.get('value'):
+            self.opciones[attrs['name']].append(attrs['value'])
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+
+
+def esquema_formulario():
+    """
+    Obtiene las opciones válidas del formulario web.
+
+    Returns:
+        dict: Valores posibles por campo
+    """
+    parser = _EsquemaFormulario()
+    with open(os.path.join(BASE_DIR, 'templates', 'index.html'), encoding='utf-8') as f:
+        parser.feed(f.read())
+    return {campo: sorted(set(valores)) for campo, valores in parser.opciones.items()}
+
+
+def encuesta_sintetica(esquema, rangos, rng, n):
+    """
+    Genera una encuesta aleatoria válida según el formulario y los rangos del modelo.
+
+    Args:
+        esquema (dict): Opciones por campo del formulario
+        rangos (tuple): RANGOS_NUMERICOS del modelo Diagnostico
+        rng (random.Random): Generador de números aleatorios
+        n (int): Número de la encuesta, para los datos de contacto
+
+    Returns:
+        dict: Campos del formulario
+    """
+    limites = {campo: (minimo, maximo) for campo, minimo, maximo in rangos}
+    estatura = round(rng.uniform(1.45, 1.95), 2)
+    encuesta = {
+        'nombre': f'Persona{n}',
+        'apellido': 'Benchmark',
+        'email': f'bench+{n}@example.com',
+        'telefono': f'+5930990{n:05d}',
+        'edad': str(rng.randint(limites['edad'][0], 80)),
+        'peso': str(round(rng.uniform(45, 120), 1)),
+        'estatura': str(estatura),
+        'presion_arterial': f'{rng.randint(95, 160)}/{rng.randint(60, 100)}',
+        'pulso': str(rng.randint(55, 110)),
+        'nivel_energia': str(rng.randint(*limites['nivel_energia'])),
+    }
+    for campo, valores in esquema.items():
+        if campo == 'sintomas':
+            encuesta[campo] = rng.sample(valores, rng.randint(0, min(3, len(valores))))
+        elif valores:
+            encuesta[campo] = rng.choice(valores)
+    for campo, valores in TEXTOS_LIBRES.items():
+        encuesta[campo] = rng.choice(valores)
+    return encuesta
+
+
+def encuestas_de_ejemplo():
+    """
+    Carga los registros de data/ como encuestas, con datos de contacto ficticios.
+
+    Returns:
+        list: Campos del formulario de cada registro
+    """
+    encuestas = []
+    for n, ruta in enumerate(sorted(glob.glob(os.path.join(BASE_DIR, 'data', 'diagnostico_*.json')))):
+        with open(ruta, encoding='utf-8') as f:
+            registro = json.load(f)
+        encuesta = {k: v for k, v in registro.items() if k not in CAMPOS_RESULTADO and v is not None}
+        encuesta['email'] = f'muestra+{n}@example.com'
+        encuesta['telefono'] = f'+5930980{n:05d}'
+        if isinstance(encuesta.get('sintomas'), str):
+            encuesta['sintomas'] = [s.strip() for s in encuesta['sintomas'].split(',') if s.strip()]
+        encuestas.append(encuesta)
+    return encuestas
+
+
+def percentiles(valores):
+    """
+    Calcula p50, p95 y p99 por el método del rango más cercano.
+
+    Args:
+        valores (list): Muestras en segundos
+
+    Returns:
+        dict: Número de muestras, percentiles, media y máximo en milisegundos
+    """
+    if not valores:
+        return {'n': 0}
+    ordenados = sorted(valores)
+
+    def rango(p):
+        return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))]
+
+    return {
+        'n': len(ordenados),
+        'p50_ms': round(rango(50) * 1000, 1),
+        'p95_ms': round(rango(95) * 1000, 1),
+        'p99_ms': round(rango(99) * 1000, 1),
+        'mean_ms': round(sum(ordenados) / len(ordenados) * 1000, 1),
+        'max_ms': round(ordenados[-1] * 1000, 1),
+    }
+
+
+def _rss_kb(pid='self'):
+    """Memoria residente de un proceso en KB (Linux), o None si no se puede leer"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class MuestreadorRecursos:
+    """Toma muestras periódicas de memoria, hilos y procesos hijos"""
+
+    def __init__(self, intervalo=0.5):
+        self.intervalo = intervalo
+        self.muestras = []
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name='bench-recursos', daemon=True)
+
+    def start(self):
+        self._hilo.start()
+
+    def stop(self):
+        self._detener.set()
+        self._hilo.join()
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            hijos = multiprocessing.active_children()
+            self.muestras.append({
+                'rss_kb': _rss_kb(),
+                'children_rss_kb': sum(_rss_kb(p.pid) or 0 for p in hijos),
+                'threads': threading.active_count(),
+                'children': len(hijos),
+            })
+
+    def resumen(self):
+        if not self.muestras:
+            return {}
+        return {
+            'rss_mb_max': round(max(m['rss_kb'] or 0 for m in self.muestras) / 1024, 1),
+            'children_rss_mb_max': round(max(m['children_rss_kb'] for m in self.muestras) / 1024, 1),
+            'threads_max': max(m['threads'] for m in self.muestras),
+            'threads_final': self.muestras[-1]['threads'],
+            'children_max': max(m['children'] for m in self.muestras),
+        }
+
+
+def preparar_entorno(args, directorio):
+    """
+    Inicia los servicios simulados y configura la aplicación para usarlos.
+    Debe llamarse antes de importar config o app.
+
+    Returns:
+        dict: Servidores simulados iniciados
+    """
+    from utils import llm_stub, smtp_stub, whatsapp_stub
+
+    servidores = {
+        'llm': llm_stub.iniciar_en_segundo_plano(
+            port=0, latency=args.llm_latency, tokens_per_second=args.llm_tps,
+            max_words=args.llm_words, error_rate=args.llm_error_rate
+        ),
+        'smtp': smtp_stub.iniciar_en_segundo_plano(port=0, handshake_latency=args.smtp_latency),
+        'whatsapp': whatsapp_stub.iniciar_en_segundo_plano(
+            port=0, latency=args.whatsapp_latency, error_rate=args.whatsapp_error_rate
+        ),
+    }
+
+    os.environ.update({
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{servidores['llm'].server_port}/v1",
+        'OPENAI_API_KEY': 'stub',
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': str(servidores['smtp'].server_address[1]),
+        'MAIL_USE_TLS': 'False',
+        'MAIL_USERNAME': 'bench',
+        'MAIL_PASSWORD': 'bench',
+        'WHATSAPP_API_URL': f"http://127.0.0.1:{servidores['whatsapp'].server_port}",
+        'JOB_BACKEND': 'thread',
+        'LOG_FILE': os.path.join(directorio, 'app.log'),
+        'JOB_DB_PATH': os.path.join(directorio, 'jobs.sqlite3'),
+        'OUTBOX_DB_PATH': os.path.join(directorio, 'outbox.sqlite3'),
+        'BATCH_JOB_DB_PATH': os.path.join(directorio, 'batch_jobs.sqlite3'),
+        'STATUS_DB_PATH': os.path.join(directorio, 'status.sqlite3'),
+        'DIAGNOSIS_CACHE_PATH': os.path.join(directorio, 'diagnosis_cache.sqlite3'),
+        'DB_WRITE_SPOOL_PATH': os.path.join(directorio, 'write_spool.sqlite3'),
+        'LOCAL_STORE_PATH': os.path.join(directorio, 'local_store.sqlite3'),
+        'METRICS_DB_PATH': os.path.join(directorio, 'metrics.sqlite3'),
+        'PDF_STORE_DIR': os.path.join(directorio, 'reports', 'store'),
+        'DIAGNOSIS_CACHE_ENABLED': 'True' if args.cache else 'False',
+    })
+    os.environ.setdefault('JOB_MAX_PENDING', str(max(500, args.jobs)))
+    return servidores
+
+
+def ejecutar(args):
+    """
+    Ejecuta el benchmark.
+
+    Returns:
+        dict: Resultados
+    """
+    directorio = tempfile.mkdtemp(prefix='vitalscan-bench-')
+    servidores = preparar_entorno(args, directorio)
+
+    from config import Config
+    Config.UPLOAD_FOLDER = os.path.join(directorio, 'reports')
+    from utils import mysql_stub
+    from utils.job_queue import LimitadorEtapas
+
+    # Las mediciones por etapa llegan desde el limitador de etapas del pipeline y de la bandeja
+    etapas = defaultdict(list)
+    esperas = defaultdict(list)
+    lock = threading.Lock()
+
+    def observar(nombre, espera, duracion):
+        with lock:
+            etapas[nombre].append(duracion)
+            esperas[nombre].append(espera)
+
+    LimitadorEtapas.observadores.append(observar)
+
+    import app as aplicacion
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    mysql_stub.instalar(os.path.join(directorio, 'mysql.sqlite3'), latency=args.db_latency)
+
+    from models.diagnostico import RANGOS_NUMERICOS
+    rng = random.Random(args.seed)
+    muestras = [] if args.solo_sinteticas else encuestas_de_ejemplo()
+    esquema = esquema_formulario()
+    encuestas = [
+        muestras[i] if i < len(muestras) else encuesta_sintetica(esquema, RANGOS_NUMERICOS, rng, i)
+        for i in range(args.jobs)
+    ]
+
+    cliente = aplicacion.app.test_client()
+    recursos = MuestreadorRecursos()
+    recursos.start()
+
+    enviados = {}
+    formulario = []
+    rechazados = 0
+    inicio = time.monotonic()
+    for n, encuesta in enumerate(encuestas):
+        if args.rate > 0:
+            time.sleep(max(0.0, inicio + n / args.rate - time.monotonic()))
+        t0 = time.monotonic()
+        respuesta = cliente.post('/', data=encuesta)
+        formulario.append(time.monotonic() - t0)
+        if respuesta.status_code != 302:
+            rechazados += 1
+            continue
+        enviados[respuesta.headers['Location'].rstrip('/').rsplit('/', 1)[-1]] = t0
+
+    # Esperar a que terminen los diagnósticos
+    completados, fallidos = {}, {}
+    limite = time.monotonic() + args.timeout
+    pendientes = set(enviados)
+    while pendientes and time.monotonic() < limite:
+        for diagnostico_id in list(pendientes):
+            estado = aplicacion.status_store.get(diagnostico_id) or {}
+            if estado.get('status') == 'completed':
+                completados[diagnostico_id] = time.monotonic()
+                pendientes.discard(diagnostico_id)
+            elif estado.get('status') == 'error':
+                fallidos[diagnostico_id] = estado.get('error')
+                pendientes.discard(diagnostico_id)
+        time.sleep(0.05)
+    fin_diagnosticos = time.monotonic()
+
+    # Esperar a que la bandeja de salida entregue las notificaciones
+    entregas_completas = aplicacion.bandeja_salida.esperar(max(1.0, limite - time.monotonic()))
+    fin_entregas = time.monotonic()
+    recursos.stop()
+
+    entregas = defaultdict(lambda: defaultdict(int))
+    for diagnostico_id in completados:
+        for canal, estado in aplicacion.bandeja_salida.estado(diagnostico_id).items():
+            entregas[canal][estado.get('status') if isinstance(estado, dict) else estado] += 1
+
+    duracion = fin_diagnosticos - inicio
+    resultado = {
+        'config': {
+            'jobs': args.jobs,
+            'rate': args.rate,
+            'llm_latency': args.llm_latency,
+            'llm_tps': args.llm_tps,
+            'db_latency': args.db_latency,
+            'smtp_latency': args.smtp_latency,
+            'whatsapp_latency': args.whatsapp_latency,
+            'cache': args.cache,
+            'job_workers': Config.JOB_WORKERS,
+            'stage_limits': Config.JOB_STAGE_LIMITS,
+            'outbox_channel_limits': Config.OUTBOX_CHANNEL_LIMITS,
+            'generation_mode': Config.OPENAI_GENERATION_MODE,
+            'pdf_pool_workers': Config.PDF_POOL_WORKERS,
+        },
+        'jobs': {
+            'submitted': len(enviados),
+            'rejected': rechazados,
+            'completed': len(completados),
+            'failed': len(fallidos),
+            'timed_out': len(pendientes),
+            'seconds': round(duracion, 2),
+            'jobs_per_second': round(len(completados) / duracion, 3) if duracion > 0 else 0.0,
+        },
+        'deliveries': {
+            'drained': entregas_completas,
+            'seconds': round(fin_entregas - inicio, 2),
+            'by_channel': {canal: dict(conteo) for canal, conteo in entregas.items()},
+        },
+        'latency': {
+            'form_post': percentiles(formulario),
+            'end_to_end': percentiles([completados[i] - enviados[i] for i in completados]),
+            **{f'stage_{nombre}': percentiles(valores) for nombre, valores in sorted(etapas.items())},
+        },
+        'stage_wait': {nombre: percentiles(valores) for nombre, valores in sorted(esperas.items())},
+        'resources': recursos.resumen(),
+        'stubs': {
+            'llm': getattr(servidores['llm'], 'stub_config', {}),
+            'smtp': getattr(servidores['smtp'], 'stub_stats', {}),
+            'whatsapp': servidores['whatsapp'].stub_stats,
+        },
+        'errors': sorted({str(e) for e in fallidos.values()})[:10],
+    }
+
+    if args.metrics:
+        # Copia de /metrics al terminar, con las duraciones por etapa y los tokens consumidos
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(cliente.get('/metrics').get_data(as_text=True))
+
+    aplicacion.job_queue.stop()
+    aplicacion.bandeja_salida.stop()
+    if Config.DB_WRITE_BEHIND:
+        # Volcar el spool antes de borrar el directorio temporal
+        from utils.write_buffer import get_buffer_escritura
+        buffer = get_buffer_escritura()
+        buffer.cerrar()
+        atexit.unregister(buffer.cerrar)
+    with aplicacion.get_pool().conexion() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS filas FROM diagnosticos")
+        filas = cursor.fetchone()['filas']
+    resultado['database'] = {'rows': filas, 'pool': aplicacion.get_pool().stats()}
+    if Config.PDF_POOL_WORKERS > 0:
+        # Los procesos de renderizado quedarían huérfanos si no se cierran
+        from utils.pdf_pool import get_pdf_pool
+        get_pdf_pool().shutdown()
+    for servidor in servidores.values():
+        servidor.shutdown()
+    if args.conservar:
+        resultado['directory'] = directorio
+    else:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return resultado
+
+
+def imprimir(resultado):
+    """Muestra un resumen legible de los resultados"""
+    jobs = resultado['jobs']
+    print(f"\nDiagnósticos: {jobs['completed']}/{jobs['submitted']} completados, "
+          f"{jobs['failed']} fallidos, {jobs['timed_out']} sin terminar, {jobs['rejected']} rechazados")
+    print(f"Rendimiento: {jobs['jobs_per_second']} diagnósticos/s en {jobs['seconds']} s")
+    entregas = resultado['deliveries']
+    print(f"Notificaciones: {json.dumps(entregas['by_channel'])} en {entregas['seconds']} s"
+          f"{'' if entregas['drained'] else ' (bandeja sin vaciar)'}")
+    print(f"\n{'etapa':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}{'espera p95':>12}")
+    for nombre, p in resultado['latency'].items():
+        if not p.get('n'):
+            continue
+        espera = resultado['stage_wait'].get(nombre.replace('stage_', ''), {}).get('p95_ms', '')
+        print(f"{nombre:<22}{p['n']:>6}{p['p50_ms']:>10}{p['p95_ms']:>10}{p['p99_ms']:>10}{p['max_ms']:>10}{espera:>12}")
+    print(f"\nFilas en la base de datos: {resultado['database']['rows']}")
+    print(f"Recursos: {json.dumps(resultado['resources'])}")
+    for error in resultado['errors']:
+        print(f"Error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark del pipeline de diagnósticos con servicios simulados')
+    parser.add_argument('--jobs', type=int, default=50, help='Encuestas a enviar')
+    parser.add_argument('--rate', type=float, default=0.0, help='Encuestas por segundo (0 = todas a la vez)')
+    parser.add_argument('--solo-sinteticas', action='store_true', help='No usar los registros de data/')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='Habilitar la caché de diagnósticos')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Segundos antes del primer token')
+    parser.add_argument('--llm-tps', type=float, default=200.0, help='Tokens por segundo del LLM simulado')
+    parser.add_argument('--llm-words', type=int, default=300, help='Palabras máximas por respuesta')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Proporción de respuestas 429')
+    parser.add_argument('--db-latency', type=float, default=0.002, help='Segundos por sentencia SQL')
+    parser.add_argument('--smtp-latency', type=float, default=0.05, help='Segundos al conectar y autenticar')
+    parser.add_argument('--whatsapp-latency', type=float, default=0.3, help='Segundos por mensaje')
+    parser.add_argument('--whatsapp-error-rate', type=float, default=0.0, help='Proporción de respuestas 500')
+    parser.add_argument('--timeout', type=float, default=600, help='Segundos máximos de espera')
+    parser.add_argument('--json', help='Archivo donde guardar los resultados')
+    parser.add_argument('--metrics', help='Archivo donde guardar la salida de /metrics al terminar')
+    parser.add_argument('--conservar', action='store_true', help='No borrar el directorio temporal')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar los logs de la aplicación')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    resultado = ejecutar(args)
+    imprimir(resultado)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return 0 if resultado['jobs']['completed'] == resultado['jobs']['submitted'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,6 +12,8 @@ class Config:
     DEBUG = ENV == 'development'
     TESTING = ENV == 'testing'
     SECRET_KEY = os.environ.get('SECRET_KEY', 'clave_secreta_desarrollo')
+    # URL pública de la aplicación, usada en los enlaces de correos y mensajes
+    APP_URL = os.environ.get('APP_URL', 'http://localhost:5000').rstrip('/')
     
     # Directorios
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -25,9 +27,38 @@ class Config:
     DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
     DB_NAME = os.environ.get('DB_NAME', 'welltechflow')
     DB_PORT = int(os.environ.get('DB_PORT', 3306))
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+    
+    # Pool de conexiones a MySQL
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+    DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))
+    # Modo ASGI (asgi.py): consultas con aiomysql o, con 'thread', con el pool síncrono en hilos
+    DB_ASYNC_DRIVER = os.environ.get('DB_ASYNC_DRIVER', 'aiomysql')
+    # Hilos del modo ASGI para las rutas de Flask y las operaciones bloqueantes
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+    # Escritura diferida: los diagnósticos se guardan en un spool local y se insertan por lotes
+    DB_WRITE_BEHIND = os.environ.get('DB_WRITE_BEHIND', 'True') == 'True'
+    DB_WRITE_SPOOL_PATH = os.environ.get('DB_WRITE_SPOOL_PATH', os.path.join(BASE_DIR, 'data', 'write_spool.sqlite3'))
+    DB_WRITE_BATCH_SIZE = int(os.environ.get('DB_WRITE_BATCH_SIZE', 50))
+    DB_WRITE_MAX_DELAY = float(os.environ.get('DB_WRITE_MAX_DELAY', 1.0))
+    DB_WRITE_RETRY_MAX_BACKOFF = float(os.environ.get('DB_WRITE_RETRY_MAX_BACKOFF', 60))
+    # Almacén local de respaldo cuando MySQL no está disponible
+    LOCAL_STORE_PATH = os.environ.get('LOCAL_STORE_PATH', os.path.join(BASE_DIR, 'data', 'local_store.sqlite3'))
+    LOCAL_STORE_REPLAY_BATCH = int(os.environ.get('LOCAL_STORE_REPLAY_BATCH', 500))
     
     # URL para la API de WhatsApp
     WHATSAPP_API_URL = os.environ.get('WHATSAPP_API_URL', 'http://localhost:3001')
+    # Sesión HTTP compartida con el servicio de WhatsApp
+    WHATSAPP_POOL_SIZE = int(os.environ.get('WHATSAPP_POOL_SIZE', 4))
+    WHATSAPP_CONNECT_TIMEOUT = float(os.environ.get('WHATSAPP_CONNECT_TIMEOUT', 5))
+    WHATSAPP_TIMEOUT = float(os.environ.get('WHATSAPP_TIMEOUT', 30))
+    WHATSAPP_MAX_RETRIES = int(os.environ.get('WHATSAPP_MAX_RETRIES', 3))
+    WHATSAPP_RETRY_BACKOFF = float(os.environ.get('WHATSAPP_RETRY_BACKOFF', 0.5))
+    # Segundos máximos consultando el estado de un envío cuya respuesta se perdió
+    WHATSAPP_ACK_TIMEOUT = float(os.environ.get('WHATSAPP_ACK_TIMEOUT', 60))
     
     # Configuración de email
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -36,13 +67,125 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME', '')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD', '')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'info@welltechflow.com')
+    MAIL_TIMEOUT = float(os.environ.get('MAIL_TIMEOUT', 30))
+    # Pool de sesiones SMTP autenticadas
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE', 4))
+    MAIL_POOL_TIMEOUT = float(os.environ.get('MAIL_POOL_TIMEOUT', 30))
+    MAIL_POOL_MAX_IDLE = float(os.environ.get('MAIL_POOL_MAX_IDLE', 120))
+    MAIL_POOL_PING_AFTER = float(os.environ.get('MAIL_POOL_PING_AFTER', 15))
+    MAIL_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100))
+    # Adjuntos: codificación compartida entre envíos y enlace firmado para informes grandes
+    ATTACHMENT_CACHE_MAX_BYTES = int(os.environ.get('ATTACHMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Tamaño a partir del cual el informe se envía como enlace; acota la memoria de cada adjunto
+    ATTACHMENT_LINK_THRESHOLD = int(os.environ.get('ATTACHMENT_LINK_THRESHOLD', 10 * 1024 * 1024))  # -1 = adjuntar siempre (sin límite)
+    ATTACHMENT_LINK_TTL = int(os.environ.get('ATTACHMENT_LINK_TTL', 7 * 86400))
     
     # Configuración de OpenAI (para generación de diagnósticos)
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
     OPENAI_ASSISTANT_ID = os.environ.get('OPENAI_ASSISTANT_ID', '')
     OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+    OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 120))
+    OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 10))
+    OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get('OPENAI_KEEPALIVE_EXPIRY', 60))
+    # Control de tasa y reintentos de las llamadas a OpenAI
+    OPENAI_MAX_CONCURRENT = int(os.environ.get('OPENAI_MAX_CONCURRENT', 8))
+    OPENAI_RPM = int(os.environ.get('OPENAI_RPM', 500))
+    OPENAI_TPM = int(os.environ.get('OPENAI_TPM', 200000))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 5))
+    OPENAI_RETRY_BACKOFF = float(os.environ.get('OPENAI_RETRY_BACKOFF', 1))
+    OPENAI_RETRY_MAX_BACKOFF = float(os.environ.get('OPENAI_RETRY_MAX_BACKOFF', 30))
+    OPENAI_MAX_QUEUE_WAIT = float(os.environ.get('OPENAI_MAX_QUEUE_WAIT', 120))
+    # 'sequential' (dos llamadas), 'stream' (dos llamadas con streaming) o 'single' (una llamada)
+    OPENAI_GENERATION_MODE = os.environ.get('OPENAI_GENERATION_MODE', 'stream')
+    
+    # Configuración de la cola de trabajos
+    JOB_BACKEND = os.environ.get('JOB_BACKEND', 'thread')  # 'thread' (SQLite local) o 'celery'
+    JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(BASE_DIR, 'data', 'jobs.sqlite3'))
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+    JOB_MAX_RETRIES = int(os.environ.get('JOB_MAX_RETRIES', 3))
+    JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 5))
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 500))
+    JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 600))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    # Concurrencia máxima por etapa, formato: "llm=4,db=8,pdf=2,notify=4"
+    JOB_STAGE_LIMITS = {
+        etapa.strip(): int(limite)
+        for etapa, limite in (
+            item.split('=') for item in os.environ.get('JOB_STAGE_LIMITS', 'llm=4,db=8,pdf=2,notify=4').split(',')
+            if '=' in item
+        )
+    }
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    
+    # Bandeja de salida de notificaciones (correo y WhatsApp)
+    OUTBOX_DB_PATH = os.environ.get('OUTBOX_DB_PATH', os.path.join(BASE_DIR, 'data', 'outbox.sqlite3'))
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 4))
+    OUTBOX_MAX_RETRIES = int(os.environ.get('OUTBOX_MAX_RETRIES', 5))
+    OUTBOX_RETRY_BACKOFF = float(os.environ.get('OUTBOX_RETRY_BACKOFF', 30))
+    OUTBOX_MAX_PENDING = int(os.environ.get('OUTBOX_MAX_PENDING', 10000))
+    OUTBOX_RETENTION_DAYS = float(os.environ.get('OUTBOX_RETENTION_DAYS', 30))
+    # Envíos simultáneos por canal, formato: "email=4,whatsapp=1"
+    OUTBOX_CHANNEL_LIMITS = {
+        canal.strip(): int(limite)
+        for canal, limite in (
+            item.split('=') for item in os.environ.get('OUTBOX_CHANNEL_LIMITS', 'email=4,whatsapp=1').split(',')
+            if '=' in item
+        )
+    }
+    
+    # Importación de encuestas por lotes
+    BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+    BATCH_INSERT_SIZE = int(os.environ.get('BATCH_INSERT_SIZE', 50))
+    BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', 1000))
+    # Token Bearer de /api/batch; vacío deshabilita la API (solo línea de comandos)
+    BATCH_API_TOKEN = os.environ.get('BATCH_API_TOKEN', '')
+    BATCH_JOB_DB_PATH = os.environ.get('BATCH_JOB_DB_PATH', os.path.join(BASE_DIR, 'data', 'batch_jobs.sqlite3'))
+    BATCH_JOB_WORKERS = int(os.environ.get('BATCH_JOB_WORKERS', 1))
+    BATCH_JOB_MAX_PENDING = int(os.environ.get('BATCH_JOB_MAX_PENDING', 10))
+    
+    # Caché de diagnósticos generados, indexada por las respuestas normalizadas
+    DIAGNOSIS_CACHE_ENABLED = os.environ.get('DIAGNOSIS_CACHE_ENABLED', 'True') == 'True'
+    DIAGNOSIS_CACHE_PATH = os.environ.get('DIAGNOSIS_CACHE_PATH', os.path.join(BASE_DIR, 'data', 'diagnosis_cache.sqlite3'))
+    DIAGNOSIS_CACHE_MAX_ENTRIES = int(os.environ.get('DIAGNOSIS_CACHE_MAX_ENTRIES', 5000))
+    # Si es True, se guardan plantillas (claves por bandas) y se rellenan con los valores del nuevo
+    # encuestado; si es False, solo se reutilizan textos de respuestas con los mismos valores exactos
+    DIAGNOSIS_CACHE_PERSONALIZE = os.environ.get('DIAGNOSIS_CACHE_PERSONALIZE', 'False') == 'True'
+    # Por defecto antecedentes, objetivos y comentarios (normalizados) forman parte de la clave. Si es True
+    # se excluyen: los aciertos ignoran los antecedentes del nuevo encuestado y solo se guardan textos de
+    # encuestados que no escribieron respuestas libres
+    DIAGNOSIS_CACHE_IGNORE_FREE_TEXT = os.environ.get('DIAGNOSIS_CACHE_IGNORE_FREE_TEXT', 'False') == 'True'
+    
+    # Caché de registros de diagnósticos
+    RECORD_CACHE_SIZE = int(os.environ.get('RECORD_CACHE_SIZE', 2048))
+    RECORD_CACHE_TTL = float(os.environ.get('RECORD_CACHE_TTL', 3600))
+    RECORD_CACHE_REDIS_URL = os.environ.get('RECORD_CACHE_REDIS_URL', '')
+    
+    # Almacén de estado de los diagnósticos ('memory', 'sqlite' o 'redis')
+    STATUS_BACKEND = os.environ.get('STATUS_BACKEND', 'sqlite')
+    STATUS_DB_PATH = os.environ.get('STATUS_DB_PATH', os.path.join(BASE_DIR, 'data', 'status.sqlite3'))
+    STATUS_REDIS_URL = os.environ.get('STATUS_REDIS_URL', 'redis://localhost:6379/1')
+    STATUS_TTL = float(os.environ.get('STATUS_TTL', 86400))
+    STATUS_STREAM_POLL = float(os.environ.get('STATUS_STREAM_POLL', 0.25))
+    STATUS_STREAM_TIMEOUT = float(os.environ.get('STATUS_STREAM_TIMEOUT', 300))
+    STATUS_STREAM_HEARTBEAT = float(os.environ.get('STATUS_STREAM_HEARTBEAT', 15))
+    STATUS_PARTIAL_INTERVAL = float(os.environ.get('STATUS_PARTIAL_INTERVAL', 0.5))
     
     # Configuración de PDF
+    PDF_POOL_WORKERS = int(os.environ.get('PDF_POOL_WORKERS', min(4, os.cpu_count() or 1)))  # 0 = en el mismo proceso
+    PDF_POOL_MAX_PENDING = int(os.environ.get('PDF_POOL_MAX_PENDING', 0))  # 0 = el doble de workers
+    PDF_POOL_QUEUE_TIMEOUT = float(os.environ.get('PDF_POOL_QUEUE_TIMEOUT', 60))
+    PDF_RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', 60))
+    PDF_WORKER_MAX_TASKS = int(os.environ.get('PDF_WORKER_MAX_TASKS', 200))  # 0 = sin reciclaje
+    # Mantener vivo un proceso de wkhtmltopdf por worker en lugar de uno por informe
+    PDF_PERSISTENT_RENDERER = os.environ.get('PDF_PERSISTENT_RENDERER', 'True') == 'True'
+    PDF_RENDERER_MAX_RENDERS = int(os.environ.get('PDF_RENDERER_MAX_RENDERS', 100))
+    # Generar el PDF solo cuando se descarga o se envía, no al procesar el diagnóstico
+    PDF_LAZY = os.environ.get('PDF_LAZY', 'True') == 'True'
+    # Informes almacenados por hash de su contenido
+    PDF_STORE_DIR = os.environ.get('PDF_STORE_DIR', os.path.join(UPLOAD_FOLDER, 'store'))
+    PDF_CACHE_MAX_AGE = int(os.environ.get('PDF_CACHE_MAX_AGE', 3600))
     PDF_OPTIONS = {
         'page-size': 'A4',
         'margin-top': '1cm',
@@ -52,6 +195,24 @@ class Config:
         'encoding': 'UTF-8',
     }
     
+    # Agenda de consultas (página de resultados y /api/schedule)
+    SCHEDULE_TIMEZONE = os.environ.get('SCHEDULE_TIMEZONE', 'America/Guayaquil')
+    SCHEDULE_DAYS_AHEAD = int(os.environ.get('SCHEDULE_DAYS_AHEAD', 3))
+    SCHEDULE_START = os.environ.get('SCHEDULE_START', '09:00')
+    SCHEDULE_END = os.environ.get('SCHEDULE_END', '17:00')
+    SCHEDULE_SLOT_MINUTES = int(os.environ.get('SCHEDULE_SLOT_MINUTES', 30))
+    SCHEDULE_BREAK_MINUTES = int(os.environ.get('SCHEDULE_BREAK_MINUTES', 15))
+    # Feriados separados por comas: "YYYY-MM-DD" o "MM-DD" para los que se repiten cada año
+    SCHEDULE_HOLIDAYS = os.environ.get('SCHEDULE_HOLIDAYS', '01-01,05-01,08-10,10-09,11-02,11-03,12-25')
+    # Segundos entre sincronizaciones de las reservas hechas por otros workers
+    SCHEDULE_REFRESH = float(os.environ.get('SCHEDULE_REFRESH', 30))
+    
+    # Métricas en formato Prometheus expuestas en /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+    # Archivo donde cada worker vuelca sus métricas para agregarlas en /metrics (vacío = solo el worker que responde)
+    METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH', os.path.join(BASE_DIR, 'data', 'metrics.sqlite3'))
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    
     # Configuración de la aplicación
     APP_NAME = 'WellTechFlow - VitalScan'
     COMPANY_NAME = 'WellTechFlow'
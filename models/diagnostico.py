@@ -1,13 +1,67 @@
 import os
-import json
 import logging
 import pymysql
-import openai
 from config import Config
+from utils.db_pool import get_pool, PoolAgotadoError
+from utils.llm_client import get_openai_client
+from utils.diagnosis_cache import cache_diagnosticos
+from utils.rate_limiter import controlador_llm, estimar_tokens, ReintentosAgotadosError
+from utils.record_cache import cache_registros
+from utils.write_buffer import get_buffer_escritura
+from utils.local_store import get_almacen_local
+from utils.metrics import span, registrar_tokens
 import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Instrucciones de sistema para cada etapa de la generación
+SISTEMA_DIAGNOSTICO = (
+    "Eres un experto en bienestar y nutrición especializado en diagnósticos preliminares. "
+    "Proporciona diagnósticos en formato de párrafo continuo, sin estructuras ni listas. "
+    "Asegúrate de que cada diagnóstico se complete completamente y concluya con una "
+    "recomendación clara sobre la necesidad de consultar con un profesional. "
+    "Usa los datos exactos proporcionados, no inventes ni modifiques valores."
+)
+SISTEMA_RECOMENDACIONES = (
+    "Eres un experto en bienestar y nutrición. "
+    "Proporciona recomendaciones en formato de párrafo continuo, sin estructuras ni listas. "
+    "Asegúrate de que cada recomendación sea específica, accionable y personalizada. "
+    "Concluye con una nota positiva y motivadora."
+)
+
+# Marca que separa las secciones en el modo de una sola llamada
+SEPARADOR_RECOMENDACIONES = "===RECOMENDACIONES==="
+
+# Campos marcados como obligatorios en el formulario web
+CAMPOS_OBLIGATORIOS = (
+    'nombre', 'apellido', 'email', 'edad', 'genero', 'nivel_energia', 'peso', 'estatura',
+    'habitos_sueno', 'habitos_alimentacion', 'actividad_fisica', 'estres', 'objetivos'
+)
+
+# Rangos admitidos por el formulario web y por las columnas de la tabla diagnosticos
+RANGOS_NUMERICOS = (
+    ('edad', 18, 120),
+    ('nivel_energia', 1, 10),
+    ('peso', 1, 999.99),
+    ('estatura', 0.3, 9.99),
+    ('pulso', 40, 200),
+)
+
+SQL_INSERTAR = """
+INSERT INTO diagnosticos 
+(id, nombre, apellido, email, telefono, edad, genero, 
+peso, estatura, imc, presion_arterial, pulso, nivel_energia,
+habitos_sueno, habitos_alimentacion, actividad_fisica, estres,
+sintomas, antecedentes, objetivos, comentarios,
+diagnostico, recomendaciones,
+nombre_encuestador, encuestador_id, fecha_creacion)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Código de MySQL para una clave primaria duplicada (el diagnóstico ya estaba guardado)
+ER_CLAVE_DUPLICADA = 1062
+
 class Diagnostico:
     """Modelo para gestionar diagnósticos de bienestar"""
     
@@ -68,8 +122,8 @@ class Diagnostico:
         self.diagnostico = ''
         self.recomendaciones = ''
         
-        # Configurar OpenAI API
-        openai.api_key = Config.OPENAI_API_KEY
+        # Fecha de creación: se guarda en todas las copias del registro (sin microsegundos, como en MySQL)
+        self.fecha_creacion = datetime.now().replace(microsecond=0)
     
     def _calcular_imc(self):
         """Calcula el IMC basado en peso y estatura"""
@@ -81,21 +135,60 @@ class Diagnostico:
             pass
         return None
     
-    def generar_diagnostico(self):
+    def interpretar_imc(self):
+        """
+        Clasifica el IMC en su categoría.
+        
+        Returns:
+            str: Categoría del IMC o cadena vacía si no está disponible
+        """
+        if not self.imc:
+            return ""
+        if self.imc < 18.5:
+            return "Bajo peso"
+        elif 18.5 <= self.imc < 25:
+            return "Peso normal"
+        elif 25 <= self.imc < 30:
+            return "Sobrepeso"
+        elif 30 <= self.imc < 35:
+            return "Obesidad grado I"
+        elif 35 <= self.imc < 40:
+            return "Obesidad grado II"
+        else:
+            return "Obesidad grado III"
+    
+    def generar_diagnostico(self, on_parcial=None):
         """
         Genera un diagnóstico personalizado utilizando IA (OpenAI).
         
+        Según Config.OPENAI_GENERATION_MODE se usan dos llamadas secuenciales
+        ('sequential'), dos llamadas con streaming ('stream') o una sola llamada
+        con streaming que devuelve ambas secciones ('single').
+        
+        Args:
+            on_parcial (callable, optional): Se llama con (seccion, texto) a medida
+                que llegan los tokens, para mostrar el avance al usuario.
+        
         Returns:
             dict: Diagnóstico generado con recomendaciones.
         """
         try:
+            # Reutilizar un diagnóstico previo para respuestas equivalentes
+            if cache_diagnosticos is not None:
+                cached = cache_diagnosticos.get(self)
+                if cached is not None:
+                    self.diagnostico = cached['diagnostico']
+                    self.recomendaciones = cached['recomendaciones']
+                    logger.info(f"Diagnóstico obtenido de la caché para {self.nombre} {self.apellido}")
+                    return cached
+            
             # Validar la conexión con OpenAI
             if not Config.OPENAI_API_KEY:
                 raise ValueError("No se ha configurado la API key de OpenAI")
             
             # Preparar prompt para OpenAI según el nuevo formato
-            prompt_diagnostico = self._preparar_prompt_diagnostico()
-            prompt_recomendaciones = None  # Se preparará después de obtener el diagnóstico
+            with span('prompt_build', seccion='diagnostico'):
+                prompt_diagnostico = self._preparar_prompt_diagnostico()
             
             # Validar datos antes de enviar
             logger.info(f"Validando datos para diagnóstico de {self.nombre} {self.apellido}")
@@ -113,60 +206,64 @@ class Diagnostico:
                 # Implementación para usar el asistente será añadida en el futuro
                 # Por ahora, usar el método tradicional
             
-            # Llamar a la API de OpenAI con el nuevo formato (>=1.0.0)
-            client = openai.OpenAI(
-                api_key=Config.OPENAI_API_KEY,
-                base_url="https://api.openai.com/v1"
-            )
-            
-            # 1. Generar diagnóstico
-            start_time = time.time()
-            response_diagnostico = client.chat.completions.create(
-                model=Config.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Eres un experto en bienestar y nutrición especializado en diagnósticos preliminares. "
-                                                 "Proporciona diagnósticos en formato de párrafo continuo, sin estructuras ni listas. "
-                                                 "Asegúrate de que cada diagnóstico se complete completamente y concluya con una "
-                                                 "recomendación clara sobre la necesidad de consultar con un profesional. "
-                                                 "Usa los datos exactos proporcionados, no inventes ni modifiques valores."},
-                    {"role": "user", "content": prompt_diagnostico}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            
-            # Extraer diagnóstico del resultado
-            diagnostico_texto = response_diagnostico.choices[0].message.content
-            self.diagnostico = diagnostico_texto
-            
-            logger.info(f"Diagnóstico generado en {time.time() - start_time:.2f} segundos")
+            # Cliente compartido del proceso (reutiliza las conexiones entre diagnósticos)
+            client = get_openai_client()
             
-            # 2. Generar recomendaciones basadas en el diagnóstico
-            prompt_recomendaciones = self._preparar_prompt_recomendaciones(diagnostico_texto)
+            modo = Config.OPENAI_GENERATION_MODE
+            stream = modo in ('stream', 'single')
+            inicio_generacion = start_time = time.time()
             
-            response_recomendaciones = client.chat.completions.create(
-                model=Config.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Eres un experto en bienestar y nutrición. "
-                                                 "Proporciona recomendaciones en formato de párrafo continuo, sin estructuras ni listas. "
-                                                 "Asegúrate de que cada recomendación sea específica, accionable y personalizada. "
-                                                 "Concluye con una nota positiva y motivadora."},
-                    {"role": "user", "content": prompt_recomendaciones}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            
-            # Extraer recomendaciones
-            self.recomendaciones = response_recomendaciones.choices[0].message.content
+            if modo == 'single':
+                # Una sola llamada que devuelve diagnóstico y recomendaciones
+                self._generar_en_una_llamada(client, prompt_diagnostico, on_parcial)
+                logger.info(f"Diagnóstico y recomendaciones generados en {time.time() - start_time:.2f} segundos")
+            else:
+                # 1. Generar diagnóstico
+                self.diagnostico = self._completar(
+                    client,
+                    [
+                        {"role": "system", "content": SISTEMA_DIAGNOSTICO},
+                        {"role": "user", "content": prompt_diagnostico}
+                    ],
+                    stream=stream,
+                    on_delta=(lambda texto: on_parcial('diagnostico', texto)) if on_parcial else None,
+                    llamada='diagnostico'
+                )
+                
+                logger.info(f"Diagnóstico generado en {time.time() - start_time:.2f} segundos")
+                
+                # 2. Generar recomendaciones basadas en el diagnóstico, en cuanto este termina
+                start_time = time.time()
+                with span('prompt_build', seccion='recomendaciones'):
+                    prompt_recomendaciones = self._preparar_prompt_recomendaciones(self.diagnostico)
+                
+                self.recomendaciones = self._completar(
+                    client,
+                    [
+                        {"role": "system", "content": SISTEMA_RECOMENDACIONES},
+                        {"role": "user", "content": prompt_recomendaciones}
+                    ],
+                    stream=stream,
+                    on_delta=(lambda texto: on_parcial('recomendaciones', texto)) if on_parcial else None,
+                    llamada='recomendaciones'
+                )
+                
+                logger.info(f"Recomendaciones generadas en {time.time() - start_time:.2f} segundos")
             
             logger.info(f"Diagnóstico completo generado para {self.nombre} {self.apellido}")
             
+            if cache_diagnosticos is not None and self.diagnostico and self.recomendaciones:
+                cache_diagnosticos.put(self, time.time() - inicio_generacion)
+            
             return {
                 "diagnostico": self.diagnostico,
                 "recomendaciones": self.recomendaciones
             }
             
+        except ReintentosAgotadosError:
+            # La API está saturada: propagar para que la cola reintente el trabajo
+            # más tarde en lugar de guardar un diagnóstico genérico
+            raise
         except Exception as e:
             logger.error(f"Error al generar diagnóstico: {str(e)}", exc_info=True)
             self.diagnostico = "No se pudo generar un diagnóstico en este momento."
@@ -177,6 +274,98 @@ class Diagnostico:
                 "recomendaciones": self.recomendaciones
             }
     
+    def _completar(self, client, messages, max_tokens=1000, stream=False, on_delta=None, llamada='diagnostico'):
+        """
+        Ejecuta una llamada de chat y devuelve el texto generado.
+        
+        Args:
+            client (openai.OpenAI): Cliente compartido de OpenAI
+            messages (list): Mensajes de la conversación
+            max_tokens (int): Máximo de tokens a generar
+            stream (bool): Si es True, consume la respuesta token a token
+            on_delta (callable, optional): Se llama con el texto acumulado durante el streaming
+            llamada (str): Nombre de la llamada en las métricas (diagnostico, recomendaciones, completo)
+            
+        Returns:
+            str: Texto generado
+        """
+        def llamar():
+            # Cada intento se mide por separado; los reintentos quedan como outcome="error"
+            with span('llm_call', llamada=llamada, modelo=Config.OPENAI_MODEL):
+                response = client.chat.completions.create(
+                    model=Config.OPENAI_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    stream=stream
+                )
+                
+                if not stream:
+                    uso = getattr(response, 'usage', None)
+                    if uso is not None:
+                        registrar_tokens(llamada, uso.prompt_tokens, uso.completion_tokens)
+                    return response.choices[0].message.content
+                
+                # Las respuestas con streaming no informan el uso: cada fragmento es ~1 token
+                partes = []
+                for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        partes.append(delta)
+                        if on_delta:
+                            on_delta(''.join(partes))
+                registrar_tokens(llamada, estimar_tokens(messages, 0), len(partes), origen='estimado')
+                return ''.join(partes)
+        
+        # El controlador limita la concurrencia y la tasa, y reintenta los 429/5xx
+        return controlador_llm.ejecutar(llamar, estimar_tokens(messages, max_tokens))
+    
+    def _generar_en_una_llamada(self, client, prompt_diagnostico, on_parcial=None):
+        """
+        Genera diagnóstico y recomendaciones en una sola llamada con streaming.
+        El modelo separa ambas secciones con SEPARADOR_RECOMENDACIONES.
+        
+        Args:
+            client (openai.OpenAI): Cliente compartido de OpenAI
+            prompt_diagnostico (str): Prompt del diagnóstico
+            on_parcial (callable, optional): Se llama con (seccion, texto) durante el streaming
+        """
+        prompt = (
+            f"{prompt_diagnostico}\n\n"
+            f"Después del diagnóstico escribe en una línea aparte exactamente {SEPARADOR_RECOMENDACIONES} "
+            f"y a continuación las recomendaciones siguiendo estas indicaciones:\n"
+            f"{self._preparar_prompt_recomendaciones('el diagnóstico que acabas de escribir')}"
+        )
+        
+        def publicar(texto):
+            if not on_parcial:
+                return
+            diagnostico, separador, recomendaciones = texto.partition(SEPARADOR_RECOMENDACIONES)
+            if separador:
+                on_parcial('recomendaciones', recomendaciones.strip())
+            else:
+                on_parcial('diagnostico', diagnostico.strip())
+        
+        texto = self._completar(
+            client,
+            [
+                {"role": "system", "content": f"{SISTEMA_DIAGNOSTICO} {SISTEMA_RECOMENDACIONES}"},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=2000,
+            stream=True,
+            on_delta=publicar,
+            llamada='completo'
+        )
+        
+        diagnostico, separador, recomendaciones = texto.partition(SEPARADOR_RECOMENDACIONES)
+        if not separador:
+            logger.warning("La respuesta no incluyó el separador de recomendaciones")
+        self.diagnostico = diagnostico.strip()
+        self.recomendaciones = recomendaciones.strip()
+    
     def _preparar_prompt_diagnostico(self):
         """
         Prepara el prompt para generar el diagnóstico.
@@ -185,20 +374,7 @@ class Diagnostico:
             str: Prompt formateado.
         """
         # Preparar interpretación del IMC si está disponible
-        interpretacion_imc = ""
-        if self.imc:
-            if self.imc < 18.5:
-                interpretacion_imc = "Bajo peso"
-            elif 18.5 <= self.imc < 25:
-                interpretacion_imc = "Peso normal"
-            elif 25 <= self.imc < 30:
-                interpretacion_imc = "Sobrepeso"
-            elif 30 <= self.imc < 35:
-                interpretacion_imc = "Obesidad grado I"
-            elif 35 <= self.imc < 40:
-                interpretacion_imc = "Obesidad grado II"
-            else:
-                interpretacion_imc = "Obesidad grado III"
+        interpretacion_imc = self.interpretar_imc()
         
         # Formatear los síntomas como lista
         if isinstance(self.sintomas, list):
@@ -347,6 +523,69 @@ class Diagnostico:
         """
         return prompt
     
+    def validar(self):
+        """
+        Valida los datos del diagnóstico con las mismas reglas que el formulario web.
+        
+        Returns:
+            list: Mensajes de error; vacía si los datos son válidos
+        """
+        errores = []
+        for campo in CAMPOS_OBLIGATORIOS:
+            if not str(getattr(self, campo, '') or '').strip():
+                errores.append(f"Falta el campo obligatorio '{campo}'")
+        
+        if self.email and '@' not in self.email:
+            errores.append(f"Email no válido: {self.email}")
+        
+        for campo, minimo, maximo in RANGOS_NUMERICOS:
+            valor = str(getattr(self, campo, '') or '').strip()
+            if not valor:
+                continue
+            try:
+                numero = float(valor.replace(',', '.'))
+            except ValueError:
+                errores.append(f"'{campo}' debe ser numérico: {valor}")
+                continue
+            if not minimo <= numero <= maximo:
+                errores.append(f"'{campo}' fuera de rango ({minimo}-{maximo}): {valor}")
+        
+        if self.peso and self.estatura and self.imc is None:
+            errores.append("No se pudo calcular el IMC con el peso y la estatura indicados")
+        
+        return errores
+    
+    def _valores_db(self, diagnostico_id):
+        """Valores de la fila de la tabla diagnosticos, en el orden de SQL_INSERTAR"""
+        return (
+            diagnostico_id,
+            self.nombre,
+            self.apellido,
+            self.email,
+            self.telefono,
+            self.edad,
+            self.genero,
+            self.peso,
+            self.estatura,
+            self.imc,
+            self.presion_arterial,
+            self.pulso,
+            self.nivel_energia,
+            self.habitos_sueno,
+            self.habitos_alimentacion,
+            self.actividad_fisica,
+            self.estres,
+            self.sintomas,
+            self.antecedentes,
+            self.objetivos,
+            self.comentarios,
+            self.diagnostico,
+            self.recomendaciones,
+            self.nombre_encuestador,
+            self.encuestador_id,
+            self.fecha_creacion
+        )
+    
     def guardar_en_db(self, diagnostico_id):
         """
         Guarda el diagnóstico en la base de datos.
@@ -357,88 +596,162 @@ class Diagnostico:
         Returns:
             bool: True si se guardó correctamente, False en caso contrario.
         """
+        if Config.DB_WRITE_BEHIND:
+            try:
+                # El spool local es duradero; el INSERT se agrupa con otros diagnósticos
+                datos = {**self.get_data(), 'id': diagnostico_id}
+                get_buffer_escritura().agregar(diagnostico_id, self._valores_db(diagnostico_id), datos)
+                cache_registros.put(diagnostico_id, datos)
+                logger.info(f"Diagnóstico encolado para escritura diferida: {diagnostico_id}")
+                return True
+            except Exception as e:
+                logger.error(f"Error al encolar diagnóstico {diagnostico_id} en el spool: {str(e)}", exc_info=True)
+        
         try:
-            # Conectar a la base de datos remota
-            conn = pymysql.connect(
-                host=Config.DB_HOST,
-                user=Config.DB_USER,
-                password=Config.DB_PASSWORD,
-                database=Config.DB_NAME,
-                port=Config.DB_PORT,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            with conn.cursor() as cursor:
-                # Crear la consulta SQL
-                sql = """
-                INSERT INTO diagnosticos 
-                (id, nombre, apellido, email, telefono, edad, genero, 
-                peso, estatura, imc, presion_arterial, pulso, nivel_energia,
-                habitos_sueno, habitos_alimentacion, actividad_fisica, estres,
-                sintomas, antecedentes, objetivos, comentarios,
-                diagnostico, recomendaciones,
-                nombre_encuestador, encuestador_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                
+            # Obtener una conexión del pool compartido
+            with get_pool().conexion() as conn, conn.cursor() as cursor:
                 # Ejecutar la consulta
-                cursor.execute(sql, (
-                    diagnostico_id,
-                    self.nombre,
-                    self.apellido,
-                    self.email,
-                    self.telefono,
-                    self.edad,
-                    self.genero,
-                    self.peso,
-                    self.estatura,
-                    self.imc,
-                    self.presion_arterial,
-                    self.pulso,
-                    self.nivel_energia,
-                    self.habitos_sueno,
-                    self.habitos_alimentacion,
-                    self.actividad_fisica,
-                    self.estres,
-                    self.sintomas,
-                    self.antecedentes,
-                    self.objetivos,
-                    self.comentarios,
-                    self.diagnostico,
-                    self.recomendaciones,
-                    self.nombre_encuestador,
-                    self.encuestador_id
-                ))
+                cursor.execute(SQL_INSERTAR, self._valores_db(diagnostico_id))
                 
                 # Confirmar los cambios
                 conn.commit()
                 
+                # Los registros no cambian tras guardarse: poblar la caché de lectura
+                cache_registros.put(diagnostico_id, {**self.get_data(), 'id': diagnostico_id})
+                
                 logger.info(f"Diagnóstico guardado en la base de datos: {diagnostico_id}")
                 return True
                 
+        except pymysql.err.IntegrityError as e:
+            if e.args and e.args[0] == ER_CLAVE_DUPLICADA:
+                # Ya estaba guardado (p. ej. un reintento): la fila existente es la válida
+                cache_registros.invalidar(diagnostico_id)
+                logger.info(f"Diagnóstico {diagnostico_id} ya estaba en la base de datos, se conserva el existente")
+                return True
+            logger.error(f"Error al guardar diagnóstico en la base de datos: {str(e)}", exc_info=True)
+            self._guardar_respaldo_local(diagnostico_id)
+            return False
         except Exception as e:
             logger.error(f"Error al guardar diagnóstico en la base de datos: {str(e)}", exc_info=True)
+            self._guardar_respaldo_local(diagnostico_id)
+            return False
+    
+    @staticmethod
+    def buscar_guardados(diagnostico_ids):
+        """
+        Obtiene los registros ya guardados de varios diagnósticos: en el spool de
+        escritura diferida, en la caché de registros, en MySQL o en el almacén local.
+        Si MySQL no está disponible se consulta el resto; los que no aparecen en
+        ningún sitio se consideran no guardados (volver a insertarlos es idempotente).
+        
+        Args:
+            diagnostico_ids (list): IDs de los diagnósticos
             
-            # Guardar en un archivo JSON local como respaldo en caso de error con la BD
+        Returns:
+            dict: Registro por ID (los que no se guardaron no aparecen)
+        """
+        encontrados = {}
+        for diagnostico_id in diagnostico_ids:
+            registro = get_buffer_escritura().buscar(diagnostico_id) if Config.DB_WRITE_BEHIND else None
+            if registro is None:
+                registro = cache_registros.get(diagnostico_id)
+            if registro is not None:
+                encontrados[diagnostico_id] = registro
+        
+        faltan = [diagnostico_id for diagnostico_id in diagnostico_ids if diagnostico_id not in encontrados]
+        if faltan:
             try:
-                import json
-                import os
-                data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-                os.makedirs(data_dir, exist_ok=True)
-                
-                data_file = os.path.join(data_dir, f"diagnostico_{diagnostico_id}.json")
-                with open(data_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.get_data(), f, ensure_ascii=False, indent=4)
-                
-                logger.warning(f"Diagnóstico guardado localmente como respaldo en {data_file}")
-            except Exception as json_error:
-                logger.error(f"No se pudo guardar el diagnóstico localmente: {str(json_error)}")
+                with get_pool().conexion() as conn, conn.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT * FROM diagnosticos WHERE id IN ({', '.join(['%s'] * len(faltan))})",
+                        tuple(faltan)
+                    )
+                    for fila in cursor.fetchall():
+                        encontrados[fila['id']] = fila
+            except (pymysql.err.MySQLError, PoolAgotadoError) as e:
+                logger.warning(f"No se pudo consultar {len(faltan)} diagnósticos en la base de datos: {str(e)}")
+        
+        for diagnostico_id in diagnostico_ids:
+            if diagnostico_id not in encontrados:
+                registro = get_almacen_local().buscar(diagnostico_id)
+                if registro is not None:
+                    encontrados[diagnostico_id] = registro
+        return encontrados
+    
+    @staticmethod
+    def guardar_lote(diagnosticos):
+        """
+        Guarda varios diagnósticos con inserciones de múltiples filas.
+        
+        Args:
+            diagnosticos (list): Pares (diagnostico_id, Diagnostico)
             
-            return False
-        finally:
-            if 'conn' in locals() and conn is not None:
-                conn.close()
+        Returns:
+            str: Dónde quedaron guardados: 'spool' (escritura diferida), 'db' o 'local' (respaldo)
+        """
+        if not diagnosticos:
+            return 'db'
+        if Config.DB_WRITE_BEHIND:
+            try:
+                registros = [
+                    (diagnostico_id, diagnostico._valores_db(diagnostico_id), {**diagnostico.get_data(), 'id': diagnostico_id})
+                    for diagnostico_id, diagnostico in diagnosticos
+                ]
+                get_buffer_escritura().agregar_varios(registros)
+                for diagnostico_id, _, datos in registros:
+                    cache_registros.put(diagnostico_id, datos)
+                return 'spool'
+            except Exception as e:
+                logger.error(f"Error al encolar lote de {len(diagnosticos)} diagnósticos en el spool: {str(e)}", exc_info=True)
+        try:
+            with get_pool().conexion() as conn, conn.cursor() as cursor:
+                # PyMySQL agrupa executemany de un INSERT ... VALUES en sentencias de varias filas
+                cursor.executemany(
+                    SQL_INSERTAR,
+                    [diagnostico._valores_db(diagnostico_id) for diagnostico_id, diagnostico in diagnosticos]
+                )
+                conn.commit()
+            
+            for diagnostico_id, diagnostico in diagnosticos:
+                cache_registros.put(diagnostico_id, {**diagnostico.get_data(), 'id': diagnostico_id})
+            
+            logger.info(f"Lote de {len(diagnosticos)} diagnósticos guardado en la base de datos")
+            return 'db'
+            
+        except Exception as e:
+            logger.error(f"Error al guardar lote de {len(diagnosticos)} diagnósticos: {str(e)}", exc_info=True)
+            for diagnostico_id, diagnostico in diagnosticos:
+                diagnostico._guardar_respaldo_local(diagnostico_id)
+            return 'local'
+    
+    def _guardar_respaldo_local(self, diagnostico_id):
+        """Guarda el diagnóstico en el almacén local de respaldo en caso de error con la BD"""
+        try:
+            datos = {**self.get_data(), 'id': diagnostico_id}
+            get_almacen_local().guardar(diagnostico_id, self._valores_db(diagnostico_id), datos)
+            cache_registros.put(diagnostico_id, datos)
+            logger.warning(f"Diagnóstico {diagnostico_id} guardado en el almacén local de respaldo")
+        except Exception as local_error:
+            logger.error(f"No se pudo guardar el diagnóstico localmente: {str(local_error)}")
+    
+    @classmethod
+    def desde_registro(cls, datos):
+        """
+        Reconstruye un diagnóstico ya generado a partir de un registro guardado.
+        
+        Args:
+            datos (dict): Registro con los campos de get_data()
+            
+        Returns:
+            Diagnostico: Diagnóstico con el texto y las recomendaciones del registro
+        """
+        diagnostico = cls(datos)
+        diagnostico.diagnostico = datos.get('diagnostico', '')
+        diagnostico.recomendaciones = datos.get('recomendaciones', '')
+        # Importación diferida: el generador de informes carga ReportLab
+        from utils.report_generator import fecha_creacion
+        diagnostico.fecha_creacion = fecha_creacion(datos) or diagnostico.fecha_creacion
+        return diagnostico
     
     def get_data(self):
         """
@@ -472,5 +785,6 @@ class Diagnostico:
             "diagnostico": self.diagnostico,
             "recomendaciones": self.recomendaciones,
             "nombre_encuestador": self.nombre_encuestador,
-            "encuestador_id": self.encuestador_id
+            "encuestador_id": self.encuestador_id,
+            "fecha_creacion": self.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S')
         } 
\ No newline at end of file
@@ -67,4 +67,19 @@ CREATE TABLE IF NOT EXISTS encuestadores (
 -- Insertar encuestador por defecto
 INSERT INTO encuestadores (id, nombre, email, telefono, estado)
 VALUES ('default', 'Encuestador por Defecto', 'default@welltechflow.com', '+1234567890', 'activo')
-ON DUPLICATE KEY UPDATE nombre = VALUES(nombre); 
\ No newline at end of file
+ON DUPLICATE KEY UPDATE nombre = VALUES(nombre); 
+-- Citas de consulta agendadas desde la página de resultados
+-- (sin clave foránea: el diagnóstico puede estar aún en la escritura diferida)
+CREATE TABLE IF NOT EXISTS citas (
+    id VARCHAR(50) PRIMARY KEY,
+    diagnostico_id VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    hora_inicio CHAR(5) NOT NULL,
+    hora_fin CHAR(5) NOT NULL,
+    zona_horaria VARCHAR(64),
+    notas TEXT,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Cada horario se reserva una sola vez y cada diagnóstico tiene una sola cita
+    CONSTRAINT uq_citas_horario UNIQUE (fecha, hora_inicio),
+    CONSTRAINT uq_citas_diagnostico UNIQUE (diagnostico_id)
+);
@@ -0,0 +1,79 @@
+"""
+Configuración común de las pruebas.
+
+Config lee el entorno al importarse, así que antes de importar la aplicación se
+llevan las bases SQLite, el log y los informes a un directorio temporal. MySQL
+se sustituye por utils.mysql_stub en las pruebas que usan el fixture `mysql`.
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_DIRECTORIO = tempfile.mkdtemp(prefix='vitalscan-tests-')
+atexit.register(shutil.rmtree, _DIRECTORIO, ignore_errors=True)
+os.environ.update({
+    'LOG_FILE': os.path.join(_DIRECTORIO, 'app.log'),
+    'JOB_BACKEND': 'thread',
+    'JOB_DB_PATH': os.path.join(_DIRECTORIO, 'jobs.sqlite3'),
+    'OUTBOX_DB_PATH': os.path.join(_DIRECTORIO, 'outbox.sqlite3'),
+    'BATCH_JOB_DB_PATH': os.path.join(_DIRECTORIO, 'batch_jobs.sqlite3'),
+    'STATUS_DB_PATH': os.path.join(_DIRECTORIO, 'status.sqlite3'),
+    'DIAGNOSIS_CACHE_PATH': os.path.join(_DIRECTORIO, 'diagnosis_cache.sqlite3'),
+    'DB_WRITE_SPOOL_PATH': os.path.join(_DIRECTORIO, 'write_spool.sqlite3'),
+    'LOCAL_STORE_PATH': os.path.join(_DIRECTORIO, 'local_store.sqlite3'),
+    'METRICS_DB_PATH': os.path.join(_DIRECTORIO, 'metrics.sqlite3'),
+    'PDF_STORE_DIR': os.path.join(_DIRECTORIO, 'reports', 'store'),
+    'DIAGNOSIS_CACHE_ENABLED': 'False',
+})
+
+# Respuestas mínimas de un formulario válido
+FORMULARIO = {
+    'nombre': 'Ana',
+    'apellido': 'Pérez',
+    'email': 'ana@example.com',
+    'telefono': '0991234567',
+    'edad': '34',
+    'genero': 'femenino',
+    'peso': '62',
+    'estatura': '165',
+    'presion_arterial': '118/76',
+    'pulso': '68',
+    'nivel_energia': '7',
+    'habitos_sueno': 'bueno',
+    'habitos_alimentacion': 'regular',
+    'actividad_fisica': 'moderada',
+    'estres': 'medio',
+    'sintomas': ['cansancio'],
+    'antecedentes': '',
+    'objetivos': 'Dormir mejor',
+    'comentarios': '',
+}
+
+
+@pytest.fixture
+def mysql(tmp_path):
+    """Redirige el pool de MySQL del proceso a una base SQLite vacía con schema.sql"""
+    from utils import mysql_stub
+    ruta = str(tmp_path / 'mysql.sqlite3')
+    pool = mysql_stub.instalar(ruta)
+    yield ruta
+    pool.close()
+
+
+@pytest.fixture
+def diagnostico():
+    """Crea diagnósticos ya generados a partir de FORMULARIO"""
+    from models.diagnostico import Diagnostico
+
+    def crear(**cambios):
+        resultado = Diagnostico({**FORMULARIO, **cambios})
+        resultado.diagnostico = cambios.get('diagnostico', 'Estado general bueno.')
+        resultado.recomendaciones = cambios.get('recomendaciones', 'Mantener la actividad física.')
+        return resultado
+    return crear
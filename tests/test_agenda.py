@@ -0,0 +1,107 @@
+import threading
+import pytest
+from utils.agenda import AgendaCitas, CitaNoValidaError, HorarioOcupadoError, CitaExistenteError
+
+
+@pytest.fixture
+def agendas(mysql):
+    """Dos agendas sobre la misma tabla citas, como dos workers de gunicorn"""
+    return AgendaCitas(feriados=''), AgendaCitas(feriados='')
+
+
+@pytest.fixture
+def horario(agendas):
+    disponibilidad = agendas[0].disponibilidad()
+    return disponibilidad['fechas'][0], disponibilidad['horarios'][0], disponibilidad['horarios'][1]
+
+
+def test_reserva_marca_el_horario_como_ocupado(agendas, horario):
+    agenda, _ = agendas
+    fecha, hora, _ = horario
+
+    cita = agenda.reservar('d1', fecha, hora)
+
+    assert (cita['fecha'], cita['hora']) == (fecha, hora)
+    assert agenda.disponibilidad()['ocupados'] == {fecha: [hora]}
+    assert agenda.stats()['bookings'] == 1
+
+
+def test_horario_fuera_del_calendario_no_es_valido(agendas, horario):
+    agenda, _ = agendas
+    _, hora, _ = horario
+
+    with pytest.raises(CitaNoValidaError):
+        agenda.reservar('d1', '01-01-2000', hora)
+    with pytest.raises(CitaNoValidaError):
+        agenda.reservar('d1', horario[0], '03:00 - 03:30')
+
+
+def test_horario_reservado_en_el_mismo_proceso_se_rechaza_sin_consultar_la_tabla(agendas, horario, monkeypatch):
+    agenda, _ = agendas
+    fecha, hora, _ = horario
+    agenda.reservar('d1', fecha, hora)
+    monkeypatch.setattr('utils.agenda.get_pool', lambda: pytest.fail('no debe consultar MySQL'))
+
+    with pytest.raises(HorarioOcupadoError):
+        agenda.reservar('d2', fecha, hora)
+    assert agenda.stats()['conflicts'] == 1
+
+
+def test_horario_reservado_por_otro_worker_se_rechaza(agendas, horario):
+    agenda, otra = agendas
+    fecha, hora, _ = horario
+    # La segunda agenda cargó la disponibilidad antes de la reserva: su índice está desactualizado
+    otra.disponibilidad()
+    agenda.reservar('d1', fecha, hora)
+
+    with pytest.raises(HorarioOcupadoError):
+        otra.reservar('d2', fecha, hora)
+
+    # Tras el conflicto el índice se sincroniza con la tabla
+    assert otra.disponibilidad()['ocupados'] == {fecha: [hora]}
+
+
+def test_repetir_la_misma_reserva_no_es_un_error(agendas, horario):
+    agenda, otra = agendas
+    fecha, hora, _ = horario
+    cita = agenda.reservar('d1', fecha, hora)
+
+    assert agenda.reservar('d1', fecha, hora) == cita
+    # También si el reintento llega a otro worker
+    assert otra.reservar('d1', fecha, hora) == cita
+
+
+def test_un_diagnostico_solo_tiene_una_cita(agendas, horario):
+    agenda, otra = agendas
+    fecha, hora, otra_hora = horario
+    agenda.reservar('d1', fecha, hora)
+
+    with pytest.raises(CitaExistenteError):
+        agenda.reservar('d1', fecha, otra_hora)
+    with pytest.raises(CitaExistenteError):
+        otra.reservar('d1', fecha, otra_hora)
+    # El horario que no se llegó a reservar sigue libre
+    assert otra.reservar('d2', fecha, otra_hora)['hora'] == otra_hora
+
+
+def test_reservas_simultaneas_del_mismo_horario(agendas, horario):
+    fecha, hora, _ = horario
+    resultados = []
+    barrera = threading.Barrier(8)
+
+    def reservar(n):
+        agenda = agendas[n % 2]
+        barrera.wait()
+        try:
+            agenda.reservar(f'd{n}', fecha, hora)
+            resultados.append('ok')
+        except HorarioOcupadoError:
+            resultados.append('ocupado')
+
+    hilos = [threading.Thread(target=reservar, args=(n,)) for n in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert sorted(resultados) == ['ocupado'] * 7 + ['ok']
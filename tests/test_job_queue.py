@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import socket
+import subprocess
+import sys
+import pytest
+from config import Config
+from utils.job_queue import ColaTrabajos, _propietario
+
+
+def _cola(tmp_path, handler=None, **opciones):
+    return ColaTrabajos(handler or (lambda payload, job_id: None), db_path=str(tmp_path / 'jobs.sqlite3'),
+                        workers=2, **opciones)
+
+
+def _insertar(cola, job_id, payload=None):
+    """Inserta un trabajo pendiente sin arrancar el despachador"""
+    ahora = time.time()
+    conn = cola._connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, payload, status, attempts, next_run, created, updated) "
+            "VALUES (?, ?, 'pending', 0, ?, ?, ?)",
+            (job_id, json.dumps(payload or {}), ahora, ahora, ahora)
+        )
+    finally:
+        conn.close()
+
+
+def _trabajo(cola, job_id):
+    conn = cola._connect()
+    try:
+        return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def _modificar(cola, job_id, **campos):
+    conn = cola._connect()
+    try:
+        conn.execute(
+            f"UPDATE jobs SET {', '.join(f'{campo} = ?' for campo in campos)} WHERE id = ?",
+            (*campos.values(), job_id)
+        )
+    finally:
+        conn.close()
+
+
+def _ejecutar(cola, job):
+    """Ejecuta un trabajo reclamado como lo haría el despachador"""
+    cola._slots.acquire()
+    cola._ejecutar(job)
+
+
+def _pid_terminado():
+    proceso = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proceso.wait()
+    return proceso.pid
+
+
+def test_reclamar_asigna_concesion_y_propietario(tmp_path):
+    cola = _cola(tmp_path, lease=30)
+    _insertar(cola, 'a')
+
+    job = cola._reclamar()
+
+    trabajo = _trabajo(cola, 'a')
+    assert job['id'] == 'a'
+    assert trabajo['status'] == 'running'
+    assert trabajo['attempts'] == 1
+    assert trabajo['owner'] == cola._owner
+    assert trabajo['lease_until'] == pytest.approx(time.time() + 30, abs=2)
+    assert cola._reclamar() is None
+
+
+def test_concesion_expirada_se_recupera(tmp_path):
+    cola = _cola(tmp_path)
+    _insertar(cola, 'a')
+    cola._reclamar()
+    _modificar(cola, 'a', owner='otro-equipo:1:abc', lease_until=time.time() - 1)
+
+    assert cola._recuperar() == 1
+
+    trabajo = _trabajo(cola, 'a')
+    assert trabajo['status'] == 'pending'
+    assert trabajo['owner'] is None
+    assert cola._reclamar()['id'] == 'a'
+
+
+def test_concesion_vigente_de_otro_equipo_no_se_recupera(tmp_path):
+    cola = _cola(tmp_path)
+    _insertar(cola, 'a')
+    cola._reclamar()
+    _modificar(cola, 'a', owner='otro-equipo:1:abc', lease_until=time.time() + 60)
+
+    assert cola._recuperar() == 0
+    assert _trabajo(cola, 'a')['status'] == 'running'
+
+
+def test_trabajo_de_un_proceso_terminado_se_recupera_sin_esperar_la_concesion(tmp_path):
+    cola = _cola(tmp_path)
+    _insertar(cola, 'a')
+    cola._reclamar()
+    _modificar(cola, 'a', owner=f"{socket.gethostname()}:{_pid_terminado()}:abc", lease_until=time.time() + 60)
+
+    assert cola._recuperar() == 1
+    assert _trabajo(cola, 'a')['status'] == 'pending'
+
+
+def test_trabajo_de_una_ejecucion_anterior_con_el_mismo_pid_se_recupera(tmp_path):
+    cola = _cola(tmp_path)
+    _insertar(cola, 'a')
+    _insertar(cola, 'b')
+    cola._reclamar()
+    cola._reclamar()
+    # Tras reiniciar un contenedor el proceso nuevo suele tener el mismo PID
+    _modificar(cola, 'a', owner=f"{socket.gethostname()}:{os.getpid()}:token-anterior",
+               lease_until=time.time() + 60)
+
+    assert cola._recuperar() == 1
+    assert _trabajo(cola, 'a')['status'] == 'pending'
+    assert _trabajo(cola, 'b')['status'] == 'running'
+    assert _trabajo(cola, 'b')['owner'] == _propietario()
+
+
+def test_renovar_extiende_solo_las_concesiones_propias(tmp_path):
+    cola = _cola(tmp_path, lease=30)
+    _insertar(cola, 'a')
+    _insertar(cola, 'b')
+    cola._reclamar()
+    cola._reclamar()
+    _modificar(cola, 'a', lease_until=time.time() + 1)
+    _modificar(cola, 'b', owner='otro-equipo:1:abc', lease_until=time.time() + 1)
+
+    cola._renovar()
+
+    assert _trabajo(cola, 'a')['lease_until'] == pytest.approx(time.time() + 30, abs=2)
+    assert _trabajo(cola, 'b')['lease_until'] < time.time() + 2
+
+
+def test_resultado_no_se_registra_si_otro_proceso_recupero_el_trabajo(tmp_path):
+    ejecutados = []
+    cola = _cola(tmp_path, handler=lambda payload, job_id: ejecutados.append(job_id))
+    _insertar(cola, 'a')
+    job = cola._reclamar()
+    # Mientras tanto otro proceso recuperó el trabajo y lo volvió a reclamar
+    _modificar(cola, 'a', owner='otro-equipo:1:abc')
+
+    _ejecutar(cola, job)
+
+    trabajo = _trabajo(cola, 'a')
+    assert ejecutados == ['a']
+    assert trabajo['status'] == 'running'
+    assert trabajo['owner'] == 'otro-equipo:1:abc'
+
+
+def test_fallo_programa_reintento_con_retroceso_exponencial(tmp_path):
+    fallos = []
+
+    def handler(payload, job_id):
+        raise RuntimeError('servicio no disponible')
+
+    cola = _cola(tmp_path, handler=handler, max_retries=3, backoff=10,
+                 on_failure=lambda payload, job_id, error: fallos.append((job_id, str(error))))
+    _insertar(cola, 'a', {'dato': 1})
+
+    for intento, espera in ((1, 10), (2, 20)):
+        antes = time.time()
+        _ejecutar(cola, cola._reclamar())
+        trabajo = _trabajo(cola, 'a')
+        assert trabajo['status'] == 'pending'
+        assert trabajo['attempts'] == intento
+        assert trabajo['owner'] is None
+        assert trabajo['last_error'] == 'servicio no disponible'
+        # Retroceso exponencial con hasta un 25 % de variación aleatoria
+        assert antes + espera <= trabajo['next_run'] <= time.time() + espera * 1.25
+        assert cola._reclamar() is None
+        _modificar(cola, 'a', next_run=time.time())
+
+    _ejecutar(cola, cola._reclamar())
+
+    trabajo = _trabajo(cola, 'a')
+    assert trabajo['status'] == 'failed'
+    assert trabajo['attempts'] == 3
+    assert fallos == [('a', 'servicio no disponible')]
+
+
+def test_despachador_reintenta_hasta_completar(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'JOB_POLL_INTERVAL', 0.02)
+    intentos = []
+
+    def handler(payload, job_id):
+        intentos.append(job_id)
+        if len(intentos) == 1:
+            raise RuntimeError('fallo transitorio')
+
+    cola = _cola(tmp_path, handler=handler, max_retries=3, backoff=0.05)
+    try:
+        cola.submit('a', {'dato': 1})
+        limite = time.monotonic() + 10
+        while _trabajo(cola, 'a')['status'] != 'done' and time.monotonic() < limite:
+            time.sleep(0.02)
+    finally:
+        cola.stop()
+
+    trabajo = _trabajo(cola, 'a')
+    assert trabajo['status'] == 'done'
+    assert trabajo['attempts'] == 2
+    assert intentos == ['a', 'a']
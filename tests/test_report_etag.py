@@ -0,0 +1,105 @@
+from datetime import datetime
+import pytest
+from utils.report_generator import huella_informe
+
+REGISTRO = {
+    'id': 'abc123',
+    'nombre': 'Ana',
+    'apellido': 'Pérez',
+    'edad': '34',
+    'genero': 'femenino',
+    'diagnostico': 'Estado general bueno.',
+    'recomendaciones': 'Mantener la actividad física.',
+    'fecha_creacion': '2026-03-14 10:20:30',
+}
+
+
+def test_huella_no_depende_de_la_representacion_de_la_fecha():
+    # Spool y almacén local guardan texto; MySQL devuelve datetime; jsonify usa RFC 822
+    huella = huella_informe(REGISTRO)
+
+    assert huella_informe({**REGISTRO, 'fecha_creacion': datetime(2026, 3, 14, 10, 20, 30)}) == huella
+    assert huella_informe({**REGISTRO, 'fecha_creacion': '2026-03-14T10:20:30'}) == huella
+    assert huella_informe({**REGISTRO, 'fecha_creacion': 'Sat, 14 Mar 2026 10:20:30 GMT'}) == huella
+
+
+def test_huella_ignora_campos_que_no_aparecen_en_el_informe():
+    assert huella_informe({**REGISTRO, 'email': 'otro@example.com', 'id': 'otro'}) == huella_informe(REGISTRO)
+
+
+@pytest.mark.parametrize('campo, valor', [
+    ('diagnostico', 'Estado general mejorable.'),
+    ('nombre', 'Ana María'),
+    ('fecha_creacion', '2026-03-15 10:20:30'),
+])
+def test_huella_cambia_con_el_contenido_del_informe(campo, valor):
+    assert huella_informe({**REGISTRO, campo: valor}) != huella_informe(REGISTRO)
+
+
+def test_huella_sin_fecha_no_usa_la_fecha_actual():
+    sin_fecha = {campo: valor for campo, valor in REGISTRO.items() if campo != 'fecha_creacion'}
+    hoy = {**sin_fecha, 'fecha_creacion': datetime.now()}
+
+    assert huella_informe(sin_fecha) == huella_informe(dict(sin_fecha))
+    assert huella_informe(sin_fecha) != huella_informe(hoy)
+
+
+class GeneradorFalso:
+    """Sustituye al generador de informes: cuenta los PDFs solicitados"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.solicitados = 0
+
+    def obtener_pdf(self, datos):
+        self.solicitados += 1
+        return self.ruta
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    import app as aplicacion
+
+    pdf = tmp_path / 'informe.pdf'
+    pdf.write_bytes(b'%PDF-1.4 informe')
+    registro = dict(REGISTRO)
+    generador = GeneradorFalso(str(pdf))
+    monkeypatch.setattr(aplicacion, 'get_diagnostico_by_id', lambda diagnostico_id: registro)
+    monkeypatch.setattr(aplicacion, 'get_report_generator', lambda: generador)
+    return aplicacion.app.test_client(), registro, generador
+
+
+def test_descarga_envia_la_huella_como_etag(cliente):
+    client, registro, generador = cliente
+
+    respuesta = client.get('/download-report/abc123')
+
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] == f'"{huella_informe(registro)}"'
+    assert respuesta.data == b'%PDF-1.4 informe'
+    assert generador.solicitados == 1
+
+
+def test_etag_vigente_responde_304_sin_obtener_el_pdf(cliente):
+    client, registro, generador = cliente
+    etag = f'"{huella_informe(registro)}"'
+
+    respuesta = client.get('/download-report/abc123', headers={'If-None-Match': etag})
+
+    assert respuesta.status_code == 304
+    assert respuesta.headers['ETag'] == etag
+    assert respuesta.data == b''
+    assert generador.solicitados == 0
+
+
+def test_etag_anterior_descarga_el_informe_actualizado(cliente):
+    client, registro, generador = cliente
+    etag = f'"{huella_informe(registro)}"'
+    registro['recomendaciones'] = 'Aumentar las horas de sueño.'
+
+    respuesta = client.get('/download-report/abc123', headers={'If-None-Match': etag})
+
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] == f'"{huella_informe(registro)}"'
+    assert respuesta.headers['ETag'] != etag
+    assert generador.solicitados == 1
@@ -0,0 +1,83 @@
+import sqlite3
+import pymysql
+import pytest
+from models.diagnostico import SQL_INSERTAR
+from utils.write_buffer import BufferEscritura
+
+
+@pytest.fixture
+def buffer(tmp_path, mysql, diagnostico):
+    """Buffer con cinco diagnósticos en el spool (sin hilo de volcado)"""
+    buffer = BufferEscritura(SQL_INSERTAR, spool_path=str(tmp_path / 'spool.sqlite3'), tamano_lote=10)
+    buffer.agregar_varios([
+        (f'id{i}', diagnostico()._valores_db(f'id{i}'), {'id': f'id{i}'})
+        for i in range(5)
+    ])
+    return buffer
+
+
+def _en_mysql(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        return {fila[0] for fila in conn.execute("SELECT id FROM diagnosticos")}
+    finally:
+        conn.close()
+
+
+def _en_spool(buffer):
+    return {fila[0]: fila[1:] for fila in buffer._conn().execute(
+        "SELECT id, dead, attempts, last_error FROM spool"
+    )}
+
+
+def test_volcado_inserta_el_lote_y_vacia_el_spool(buffer, mysql):
+    volcados = []
+    buffer.al_volcar = volcados.extend
+
+    assert buffer.vaciar()
+
+    assert _en_mysql(mysql) == {f'id{i}' for i in range(5)}
+    assert _en_spool(buffer) == {}
+    assert sorted(volcados) == [f'id{i}' for i in range(5)]
+    assert buffer.stats()['batches'] == 1
+
+
+def test_fila_rechazada_no_bloquea_al_resto_del_lote(buffer, mysql, monkeypatch):
+    insertar = buffer._insertar
+
+    def insertar_con_rechazo(lote):
+        if any(registro_id == 'id2' for registro_id, _ in lote):
+            raise pymysql.err.DataError(1406, "Data too long for column 'diagnostico'")
+        insertar(lote)
+    monkeypatch.setattr(buffer, '_insertar', insertar_con_rechazo)
+
+    assert buffer.vaciar()
+
+    assert _en_mysql(mysql) == {'id0', 'id1', 'id3', 'id4'}
+    dead, attempts, error = _en_spool(buffer)['id2']
+    assert list(_en_spool(buffer)) == ['id2']
+    assert (dead, attempts) == (1, 1)
+    assert '1406' in error
+    stats = buffer.stats()
+    assert stats['dead'] == 1
+    assert stats['pending'] == 0
+    # La fila apartada no se vuelve a intentar
+    assert buffer._reclamar() == []
+
+
+def test_mysql_no_disponible_devuelve_el_lote_al_spool(buffer, mysql, monkeypatch):
+    def sin_conexion(lote):
+        raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+    monkeypatch.setattr(buffer, '_insertar', sin_conexion)
+
+    assert not buffer.vaciar()
+
+    assert _en_mysql(mysql) == set()
+    spool = _en_spool(buffer)
+    assert len(spool) == 5
+    assert all(dead == 0 and attempts == 1 for dead, attempts, _ in spool.values())
+    assert buffer.stats()['pending'] == 5
+
+    monkeypatch.undo()
+    assert buffer.vaciar()
+    assert _en_mysql(mysql) == {f'id{i}' for i in range(5)}
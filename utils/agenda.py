@@ -0,0 +1,336 @@
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import pymysql
+from config import Config
+from utils.db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+SQL_RESERVAR = """
+    INSERT INTO citas (id, diagnostico_id, fecha, hora_inicio, hora_fin, zona_horaria, notas)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+SQL_CITAS_PERIODO = "SELECT diagnostico_id, fecha, hora_inicio FROM citas WHERE fecha >= %s AND fecha <= %s"
+SQL_CITA_DIAGNOSTICO = "SELECT fecha, hora_inicio FROM citas WHERE diagnostico_id = %s"
+
+
+class CitaNoValidaError(Exception):
+    """La fecha o el horario solicitados no forman parte del calendario"""
+
+
+class HorarioOcupadoError(Exception):
+    """El horario ya fue reservado por otro diagnóstico"""
+
+
+class CitaExistenteError(Exception):
+    """El diagnóstico ya tiene una cita en otro horario"""
+
+
+def _leer_feriados(valor):
+    """
+    Interpreta la lista de feriados de la configuración.
+
+    Args:
+        valor (str): Fechas separadas por comas: "YYYY-MM-DD" (un día concreto)
+            o "MM-DD" (todos los años)
+
+    Returns:
+        tuple: (set de date concretos, set de (mes, día) anuales)
+    """
+    fechas, anuales = set(), set()
+    for item in (valor or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            if len(item) == 5:
+                mes, dia = (int(x) for x in item.split('-'))
+                anuales.add((mes, dia))
+            else:
+                fechas.add(date.fromisoformat(item))
+        except ValueError:
+            logger.warning(f"Feriado con formato no válido en SCHEDULE_HOLIDAYS: {item}")
+    return fechas, anuales
+
+
+class AgendaCitas:
+    """
+    Calendario de consultas y reservas de horarios.
+
+    Las fechas disponibles y los horarios se calculan una vez por día (en la zona
+    horaria de la consulta) y las reservas se guardan en un índice en memoria
+    (fecha, horario) → diagnóstico, de modo que mostrar la agenda y comprobar un
+    horario son búsquedas en diccionarios. El índice se sincroniza con la tabla
+    citas cada SCHEDULE_REFRESH segundos para reflejar las reservas de otros
+    workers; las restricciones UNIQUE de la tabla garantizan que un horario no se
+    reserve dos veces aunque dos procesos lo intenten a la vez.
+    """
+
+    def __init__(self, dias=None, zona_horaria=None, feriados=None):
+        """
+        Inicializa la agenda.
+
+        Args:
+            dias (int, optional): Días laborables que se ofrecen a partir de mañana
+            zona_horaria (str, optional): Zona horaria de la consulta (IANA)
+            feriados (str, optional): Feriados, con el formato de SCHEDULE_HOLIDAYS
+        """
+        self.dias = dias or Config.SCHEDULE_DAYS_AHEAD
+        nombre_zona = zona_horaria or Config.SCHEDULE_TIMEZONE
+        try:
+            self.zona_horaria = ZoneInfo(nombre_zona)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Zona horaria desconocida {nombre_zona}: se usa la hora local del servidor")
+            self.zona_horaria = None
+        self._feriados, self._feriados_anuales = _leer_feriados(
+            feriados if feriados is not None else Config.SCHEDULE_HOLIDAYS
+        )
+
+        self._lock = threading.Lock()
+        self._calendario = None
+        # (fecha 'DD-MM-YYYY', horario 'HH:MM - HH:MM') → ID del diagnóstico que lo reservó
+        self._ocupados = {}
+        self._por_diagnostico = {}
+        self._sincronizado = 0.0
+        self._sincronizando = False
+        self._metricas = {'bookings': 0, 'conflicts': 0, 'syncs': 0, 'sync_errors': 0, 'calendar_builds': 0}
+
+    def _hoy(self):
+        """Fecha actual en la zona horaria de la consulta"""
+        return datetime.now(self.zona_horaria).date()
+
+    def es_feriado(self, dia):
+        """
+        Indica si una fecha es feriado.
+
+        Args:
+            dia (date): Fecha a comprobar
+
+        Returns:
+            bool: True si está en SCHEDULE_HOLIDAYS
+        """
+        return dia in self._feriados or (dia.month, dia.day) in self._feriados_anuales
+
+    def _construir_calendario(self, hoy):
+        """Calcula las fechas laborables y los horarios de consulta a partir de mañana"""
+        fechas = []
+        dia = hoy + timedelta(days=1)
+        # Límite de seguridad ante configuraciones con demasiados feriados
+        while len(fechas) < self.dias and dia <= hoy + timedelta(days=self.dias * 7 + 60):
+            # Lunes = 0, Domingo = 6
+            if dia.weekday() < 5 and not self.es_feriado(dia):
+                fechas.append(dia)
+            dia += timedelta(days=1)
+
+        # Sesiones de SCHEDULE_SLOT_MINUTES seguidas de SCHEDULE_BREAK_MINUTES de descanso
+        horarios = []
+        inicio = _minutos(Config.SCHEDULE_START)
+        fin = _minutos(Config.SCHEDULE_END)
+        while inicio + Config.SCHEDULE_SLOT_MINUTES <= fin:
+            horarios.append((_hora(inicio), _hora(inicio + Config.SCHEDULE_SLOT_MINUTES)))
+            inicio += Config.SCHEDULE_SLOT_MINUTES + Config.SCHEDULE_BREAK_MINUTES
+
+        textos_fechas = [dia.strftime('%d-%m-%Y') for dia in fechas]
+        textos_horarios = [f"{inicio} - {fin}" for inicio, fin in horarios]
+        self._metricas['calendar_builds'] += 1
+        return {
+            'hoy': hoy,
+            'fechas': textos_fechas,
+            'horarios': textos_horarios,
+            # (fecha, horario) → (fecha ISO, hora de inicio, hora de fin)
+            'claves': {
+                (texto_fecha, texto_horario): (dia.isoformat(), inicio, fin)
+                for dia, texto_fecha in zip(fechas, textos_fechas)
+                for (inicio, fin), texto_horario in zip(horarios, textos_horarios)
+            },
+            'iso': {dia.isoformat(): texto for dia, texto in zip(fechas, textos_fechas)},
+            'horas': {inicio: texto for (inicio, _), texto in zip(horarios, textos_horarios)},
+        }
+
+    def _calendario_vigente(self):
+        """Devuelve el calendario del día, recalculándolo solo al cambiar la fecha"""
+        hoy = self._hoy()
+        calendario = self._calendario
+        if calendario is None or calendario['hoy'] != hoy:
+            calendario = self._construir_calendario(hoy)
+            with self._lock:
+                self._calendario = calendario
+                # Las reservas de días que ya no se ofrecen salen del índice
+                claves = calendario['claves']
+                self._ocupados = {k: v for k, v in self._ocupados.items() if k in claves}
+                self._por_diagnostico = {v: k for k, v in self._ocupados.items()}
+            self._sincronizado = 0.0
+        return calendario
+
+    def _sincronizar(self, calendario, forzar=False):
+        """Carga las reservas del periodo ofrecido, como mucho una vez cada SCHEDULE_REFRESH segundos"""
+        with self._lock:
+            if self._sincronizando or (not forzar and time.time() - self._sincronizado < Config.SCHEDULE_REFRESH):
+                return
+            self._sincronizando = True
+        try:
+            if not calendario['iso']:
+                return
+            periodo = (min(calendario['iso']), max(calendario['iso']))
+            with get_pool().conexion() as conn, conn.cursor() as cursor:
+                cursor.execute(SQL_CITAS_PERIODO, periodo)
+                filas = cursor.fetchall()
+            ocupados = {}
+            for fila in filas:
+                clave = (calendario['iso'].get(str(fila['fecha'])[:10]), calendario['horas'].get(fila['hora_inicio']))
+                if clave in calendario['claves']:
+                    ocupados[clave] = fila['diagnostico_id']
+            with self._lock:
+                # Conservar las reservas en curso de este proceso que aún no están en la tabla
+                for clave, diagnostico_id in self._ocupados.items():
+                    ocupados.setdefault(clave, diagnostico_id)
+                self._ocupados = ocupados
+                self._por_diagnostico = {v: k for k, v in ocupados.items()}
+            self._metricas['syncs'] += 1
+        except Exception as e:
+            self._metricas['sync_errors'] += 1
+            logger.warning(f"No se pudieron cargar las citas reservadas: {str(e)}")
+        finally:
+            self._sincronizado = time.time()
+            self._sincronizando = False
+
+    def disponibilidad(self):
+        """
+        Obtiene el calendario ofrecido y los horarios ya reservados.
+
+        Returns:
+            dict: 'fechas' (DD-MM-YYYY), 'horarios' ('HH:MM - HH:MM') y 'ocupados'
+                (fecha → lista de horarios reservados)
+        """
+        calendario = self._calendario_vigente()
+        self._sincronizar(calendario)
+        ocupados = {}
+        with self._lock:
+            for texto_fecha, texto_horario in self._ocupados:
+                ocupados.setdefault(texto_fecha, []).append(texto_horario)
+        return {'fechas': calendario['fechas'], 'horarios': calendario['horarios'], 'ocupados': ocupados}
+
+    def reservar(self, diagnostico_id, fecha, hora, notas=None):
+        """
+        Reserva un horario para un diagnóstico.
+
+        Repetir la misma reserva (p. ej. un doble clic) no es un error.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            fecha (str): Fecha con formato DD-MM-YYYY, como se muestra en la agenda
+            hora (str): Horario con formato 'HH:MM - HH:MM'
+            notas (str, optional): Notas del usuario para la consulta
+
+        Returns:
+            dict: Fecha, horario y zona horaria de la cita
+
+        Raises:
+            CitaNoValidaError: Si la fecha o el horario no están en el calendario
+            HorarioOcupadoError: Si otro diagnóstico reservó el horario
+            CitaExistenteError: Si el diagnóstico ya tiene otra cita
+        """
+        calendario = self._calendario_vigente()
+        clave = (fecha, hora)
+        datos = calendario['claves'].get(clave)
+        if datos is None:
+            raise CitaNoValidaError("La fecha u horario seleccionados no están disponibles")
+        cita = {'fecha': fecha, 'hora': hora, 'zona_horaria': self._nombre_zona()}
+
+        # Reserva provisional en el índice: las peticiones simultáneas de este proceso
+        # se resuelven aquí sin llegar a la base de datos
+        with self._lock:
+            actual = self._por_diagnostico.get(diagnostico_id)
+            if actual == clave:
+                return cita
+            if actual is not None:
+                self._metricas['conflicts'] += 1
+                raise CitaExistenteError(f"Ya tienes una cita agendada el {actual[0]} a las {actual[1]}")
+            if clave in self._ocupados:
+                self._metricas['conflicts'] += 1
+                raise HorarioOcupadoError("El horario seleccionado ya no está disponible")
+            self._ocupados[clave] = diagnostico_id
+            self._por_diagnostico[diagnostico_id] = clave
+
+        fecha_iso, inicio, fin = datos
+        try:
+            with get_pool().conexion() as conn, conn.cursor() as cursor:
+                cursor.execute(SQL_RESERVAR, (
+                    uuid.uuid4().hex, diagnostico_id, fecha_iso, inicio, fin, self._nombre_zona(), notas or None
+                ))
+                conn.commit()
+        except pymysql.err.IntegrityError:
+            # Otro worker reservó el horario, o el diagnóstico ya tenía cita
+            self._liberar(clave, diagnostico_id)
+            self._metricas['conflicts'] += 1
+            existente = self._cita_de(diagnostico_id)
+            self._sincronizar(calendario, forzar=True)
+            if existente == (fecha_iso, inicio):
+                return cita
+            if existente is not None:
+                raise CitaExistenteError("Ya tienes una cita agendada")
+            raise HorarioOcupadoError("El horario seleccionado ya no está disponible")
+        except Exception:
+            self._liberar(clave, diagnostico_id)
+            raise
+
+        self._metricas['bookings'] += 1
+        logger.info(f"Cita reservada para {diagnostico_id}: {fecha} {hora}")
+        return cita
+
+    def _liberar(self, clave, diagnostico_id):
+        """Deshace una reserva provisional del índice"""
+        with self._lock:
+            if self._ocupados.get(clave) == diagnostico_id:
+                del self._ocupados[clave]
+            if self._por_diagnostico.get(diagnostico_id) == clave:
+                del self._por_diagnostico[diagnostico_id]
+
+    def _cita_de(self, diagnostico_id):
+        """Cita registrada de un diagnóstico como (fecha ISO, hora de inicio), o None"""
+        try:
+            with get_pool().conexion() as conn, conn.cursor() as cursor:
+                cursor.execute(SQL_CITA_DIAGNOSTICO, (diagnostico_id,))
+                fila = cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"No se pudo consultar la cita de {diagnostico_id}: {str(e)}")
+            return None
+        return (str(fila['fecha'])[:10], fila['hora_inicio']) if fila else None
+
+    def _nombre_zona(self):
+        return str(self.zona_horaria) if self.zona_horaria is not None else None
+
+    def stats(self):
+        """
+        Obtiene las métricas de la agenda.
+
+        Returns:
+            dict: Horarios ofrecidos y reservados, reservas, conflictos y sincronizaciones
+        """
+        calendario = self._calendario
+        with self._lock:
+            ocupados = len(self._ocupados)
+        return {
+            'slots': len(calendario['claves']) if calendario else 0,
+            'booked': ocupados,
+            **self._metricas
+        }
+
+
+def _minutos(texto):
+    """Convierte 'HH:MM' en minutos desde medianoche"""
+    hora, minuto = (int(x) for x in texto.split(':'))
+    return hora * 60 + minuto
+
+
+def _hora(minutos):
+    """Convierte minutos desde medianoche en 'HH:MM'"""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+# Agenda compartida del proceso
+agenda_citas = AgendaCitas()
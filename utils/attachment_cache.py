@@ -0,0 +1,182 @@
+import os
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bloque de lectura múltiplo de 57 bytes: cada bloque produce líneas base64 completas de 76 caracteres
+_BLOQUE_LECTURA = 57 * 1024
+
+_firmante = URLSafeTimedSerializer(Config.SECRET_KEY, salt='vitalscan-informe')
+
+
+class EnlaceInvalidoError(Exception):
+    """Se lanza cuando un enlace de descarga firmado no es válido"""
+
+
+class EnlaceExpiradoError(EnlaceInvalidoError):
+    """Se lanza cuando un enlace de descarga firmado ya caducó"""
+
+
+def requiere_enlace(pdf_path):
+    """
+    Indica si un informe debe enviarse como enlace de descarga en lugar de adjunto.
+
+    Args:
+        pdf_path (str): Ruta al archivo PDF
+
+    Returns:
+        bool: True si el archivo supera ATTACHMENT_LINK_THRESHOLD
+    """
+    if not pdf_path or Config.ATTACHMENT_LINK_THRESHOLD < 0:
+        return False
+    try:
+        return os.path.getsize(pdf_path) > Config.ATTACHMENT_LINK_THRESHOLD
+    except OSError:
+        return False
+
+
+def enlace_descarga(diagnostico_id):
+    """
+    Genera un enlace firmado y con caducidad para descargar el informe.
+
+    Args:
+        diagnostico_id (str): ID del diagnóstico
+
+    Returns:
+        str: URL absoluta de descarga
+    """
+    return f"{Config.APP_URL}/report/{_firmante.dumps(diagnostico_id)}"
+
+
+def leer_enlace(token):
+    """
+    Valida un token de descarga firmado.
+
+    Args:
+        token (str): Token incluido en el enlace
+
+    Returns:
+        str: ID del diagnóstico
+
+    Raises:
+        EnlaceExpiradoError: Si el enlace superó ATTACHMENT_LINK_TTL
+        EnlaceInvalidoError: Si la firma no es válida
+    """
+    try:
+        return _firmante.loads(token, max_age=Config.ATTACHMENT_LINK_TTL)
+    except SignatureExpired as e:
+        raise EnlaceExpiradoError("El enlace de descarga caducó") from e
+    except BadSignature as e:
+        raise EnlaceInvalidoError("El enlace de descarga no es válido") from e
+
+
+def _codificar(pdf_path):
+    """
+    Codifica un archivo en base64 con líneas de 76 caracteres.
+
+    El resultado completo queda en memoria (la parte MIME necesita el texto entero
+    y smtplib serializa el mensaje de una vez), con un pico de unas 2,7 veces el
+    tamaño del archivo. Lo que acota la memoria es ATTACHMENT_LINK_THRESHOLD: los
+    informes mayores se envían como enlace de descarga y nunca llegan aquí.
+    """
+    lineas = []
+    with open(pdf_path, 'rb') as f:
+        while True:
+            bloque = f.read(_BLOQUE_LECTURA)
+            if not bloque:
+                break
+            lineas.append(base64.encodebytes(bloque).decode('ascii'))
+    return ''.join(lineas)
+
+
+class CacheAdjuntos:
+    """
+    Caché LRU de adjuntos ya codificados en base64. La clave es la identidad del
+    archivo (dispositivo, inodo, mtime y tamaño), de modo que los enlaces duros
+    del almacén de informes comparten la misma entrada.
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        Inicializa la caché de adjuntos.
+
+        Args:
+            max_bytes (int, optional): Tamaño máximo del contenido codificado en memoria
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else Config.ATTACHMENT_CACHE_MAX_BYTES
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._metricas = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_encoded': 0}
+
+    def codificado(self, pdf_path):
+        """
+        Obtiene el contenido base64 de un archivo, codificándolo solo la primera vez.
+
+        Args:
+            pdf_path (str): Ruta al archivo
+
+        Returns:
+            str: Contenido en base64 con líneas de 76 caracteres
+        """
+        info = os.stat(pdf_path)
+        clave = (info.st_dev, info.st_ino, info.st_mtime_ns, info.st_size)
+        with self._lock:
+            contenido = self._datos.get(clave)
+            if contenido is not None:
+                self._datos.move_to_end(clave)
+                self._metricas['hits'] += 1
+                return contenido
+            self._metricas['misses'] += 1
+
+        contenido = _codificar(pdf_path)
+        with self._lock:
+            self._metricas['bytes_encoded'] += info.st_size
+            # Los archivos muy grandes se codifican pero no desplazan al resto de la caché
+            if len(contenido) > self.max_bytes // 4 or clave in self._datos:
+                return contenido
+            self._datos[clave] = contenido
+            self._bytes += len(contenido)
+            while self._bytes > self.max_bytes:
+                _, expulsado = self._datos.popitem(last=False)
+                self._bytes -= len(expulsado)
+                self._metricas['evictions'] += 1
+        return contenido
+
+    def parte_mime(self, pdf_path, nombre=None):
+        """
+        Construye la parte MIME de un PDF adjunto reutilizando su codificación.
+
+        Args:
+            pdf_path (str): Ruta al archivo PDF
+            nombre (str, optional): Nombre del adjunto; por defecto el del archivo
+
+        Returns:
+            MIMEBase: Parte lista para adjuntar al mensaje
+        """
+        nombre = nombre or os.path.basename(pdf_path)
+        parte = MIMEBase('application', 'octet-stream', name=nombre)
+        parte.set_payload(self.codificado(pdf_path))
+        parte['Content-Transfer-Encoding'] = 'base64'
+        parte['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        return parte
+
+    def stats(self):
+        """
+        Obtiene las métricas de la caché.
+
+        Returns:
+            dict: Entradas, bytes en memoria, aciertos, fallos y bytes codificados
+        """
+        with self._lock:
+            return {'entries': len(self._datos), 'bytes': self._bytes, 'max_bytes': self.max_bytes, **self._metricas}
+
+
+# Caché compartida por todos los envíos del proceso
+cache_adjuntos = CacheAdjuntos()
@@ -0,0 +1,278 @@
+import io
+import csv
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import Config
+from models.diagnostico import Diagnostico
+from utils.job_queue import limitador_etapas
+from utils.notificaciones import entregar_diagnostico, bandeja_salida
+
+logger = logging.getLogger(__name__)
+
+
+def leer_filas(contenido, formato='csv'):
+    """
+    Lee las filas de encuestas de un archivo CSV o JSONL.
+
+    Args:
+        contenido (str): Contenido del archivo
+        formato (str): 'csv' (con cabecera) o 'jsonl' (un objeto JSON por línea)
+
+    Returns:
+        list: Diccionarios con los campos del formulario
+
+    Raises:
+        ValueError: Si el formato no es válido o una línea JSONL no es un objeto JSON
+    """
+    if formato == 'jsonl':
+        filas = []
+        for numero, linea in enumerate(contenido.splitlines(), start=1):
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Línea {numero} no es JSON válido: {str(e)}")
+            if not isinstance(fila, dict):
+                raise ValueError(f"Línea {numero} no es un objeto JSON")
+            filas.append(fila)
+        return filas
+
+    if formato != 'csv':
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    filas = []
+    for fila in csv.DictReader(io.StringIO(contenido.lstrip('\ufeff'))):
+        fila = {campo.strip(): (valor or '').strip() for campo, valor in fila.items() if campo}
+        # En CSV los síntomas van separados por ';' para no chocar con el delimitador
+        if ';' in fila.get('sintomas', ''):
+            fila['sintomas'] = [s.strip() for s in fila['sintomas'].split(';') if s.strip()]
+        filas.append(fila)
+    return filas
+
+
+def formato_de(nombre_archivo):
+    """Deduce el formato de un archivo por su extensión"""
+    return 'jsonl' if nombre_archivo.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def id_fila(lote_id, numero):
+    """
+    Obtiene el ID del diagnóstico de una fila de un lote (estable entre reintentos).
+
+    Args:
+        lote_id (str): ID del lote
+        numero (int): Número de fila (desde 1)
+
+    Returns:
+        str: ID de 16 caracteres hexadecimales
+    """
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"vitalscan:{lote_id}:{numero}").hex[:16]
+
+
+class ImportadorLote:
+    """Procesa un lote de encuestas: validación, generación, guardado agrupado y entrega"""
+
+    def __init__(self, concurrencia=None, tamano_lote=None, notificar=True):
+        """
+        Inicializa el importador.
+
+        Args:
+            concurrencia (int, optional): Diagnósticos generados y entregados a la vez
+            tamano_lote (int, optional): Filas por inserción en la base de datos
+            notificar (bool): Si es False no se generan PDFs ni se envían notificaciones
+        """
+        self.concurrencia = concurrencia or Config.BATCH_CONCURRENCY
+        self.tamano_lote = tamano_lote or Config.BATCH_INSERT_SIZE
+        self.notificar = notificar
+        self._lock = threading.Lock()
+
+    def procesar(self, filas, lote_id=None):
+        """
+        Procesa las filas y devuelve el resultado de cada una.
+
+        Args:
+            filas (list): Diccionarios con los campos del formulario
+            lote_id (str, optional): ID del lote en la cola de trabajos. Los IDs de las
+                filas se derivan de él, de modo que un reintento reutiliza las filas
+                ya guardadas (solo se vuelven a registrar sus notificaciones) en lugar
+                de generarlas y guardarlas de nuevo
+
+        Returns:
+            dict: Resultados por fila y métricas agregadas del lote
+        """
+        inicio = time.monotonic()
+        self._segundos = {'llm': 0.0, 'db': 0.0, 'notify': 0.0}
+        resultados = []
+        validos = []
+
+        # Validar todas las filas antes de gastar llamadas al LLM
+        for numero, fila in enumerate(filas, start=1):
+            diagnostico = Diagnostico(fila)
+            errores = diagnostico.validar()
+            resultado = {'fila': numero, 'id': None, 'status': 'invalid' if errores else 'pending', 'errores': errores}
+            resultados.append(resultado)
+            if not errores:
+                resultado['id'] = id_fila(lote_id, numero) if lote_id else uuid.uuid4().hex[:16]
+                validos.append((resultado, diagnostico))
+
+        guardados = Diagnostico.buscar_guardados([r['id'] for r, _ in validos]) if lote_id and validos else {}
+        reanudados = [(resultado, Diagnostico.desde_registro(guardados[resultado['id']]))
+                      for resultado, _ in validos if resultado['id'] in guardados]
+        validos = [(resultado, diagnostico) for resultado, diagnostico in validos if resultado['id'] not in guardados]
+        for resultado, _ in reanudados:
+            resultado['resumed'] = True
+
+        logger.info(
+            f"Lote recibido: {len(filas)} filas, {len(validos) + len(reanudados)} válidas"
+            + (f", {len(reanudados)} ya guardadas en un intento anterior" if reanudados else "")
+        )
+
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix='lote-llm') as generacion, \
+                ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix='lote-entrega') as entrega:
+            futuros = {generacion.submit(self._generar, diagnostico): (resultado, diagnostico)
+                       for resultado, diagnostico in validos}
+            entregas = self._encolar_entregas(reanudados, entrega)
+            pendientes = []
+
+            # Guardar por bloques a medida que terminan las generaciones
+            for futuro in as_completed(futuros):
+                resultado, diagnostico = futuros[futuro]
+                try:
+                    futuro.result()
+                except Exception as e:
+                    self._fallo(resultado, 'llm', e)
+                    continue
+                pendientes.append((resultado, diagnostico))
+                if len(pendientes) >= self.tamano_lote:
+                    entregas.update(self._guardar(pendientes, entrega))
+                    pendientes = []
+            entregas.update(self._guardar(pendientes, entrega))
+
+            for futuro in as_completed(entregas):
+                resultado = entregas[futuro]
+                try:
+                    resultado['pdf_path'] = futuro.result()
+                    resultado['status'] = 'completed'
+                except Exception as e:
+                    self._fallo(resultado, 'notify', e)
+
+        segundos = time.monotonic() - inicio
+        completados = sum(1 for r in resultados if r['status'] == 'completed')
+        informe = {
+            'total': len(resultados),
+            'completed': completados,
+            'invalid': sum(1 for r in resultados if r['status'] == 'invalid'),
+            'failed': sum(1 for r in resultados if r['status'] == 'error'),
+            'seconds': round(segundos, 2),
+            'rows_per_second': round(completados / segundos, 2) if segundos > 0 else 0.0,
+            'stage_seconds': {etapa: round(valor, 2) for etapa, valor in self._segundos.items()},
+            'rows': resultados,
+        }
+        logger.info(
+            f"Lote procesado: {completados}/{len(resultados)} completados en {informe['seconds']} segundos "
+            f"({informe['rows_per_second']} filas/s)"
+        )
+        return informe
+
+    def _generar(self, diagnostico):
+        """
+        Genera el diagnóstico de una fila.
+
+        Raises:
+            RuntimeError: Si la generación falló y solo se obtuvo el texto genérico
+        """
+        inicio = time.monotonic()
+        try:
+            with limitador_etapas.etapa('llm'):
+                respuesta = diagnostico.generar_diagnostico()
+        finally:
+            self._acumular('llm', inicio)
+        if respuesta.get('error'):
+            # No guardar ni enviar el texto genérico de respaldo como si fuera el diagnóstico
+            raise RuntimeError(f"No se pudo generar el diagnóstico: {respuesta['error']}")
+
+    def _guardar(self, pendientes, entrega):
+        """
+        Guarda un bloque con una inserción de varias filas y encola su entrega.
+
+        Returns:
+            dict: Futuros de entrega y el resultado de la fila correspondiente
+        """
+        if not pendientes:
+            return {}
+        inicio = time.monotonic()
+        with limitador_etapas.etapa('db'):
+            destino = Diagnostico.guardar_lote([(r['id'], d) for r, d in pendientes])
+        self._acumular('db', inicio)
+
+        for resultado, _ in pendientes:
+            resultado['storage'] = destino
+        return self._encolar_entregas(pendientes, entrega)
+
+    def _encolar_entregas(self, guardados, entrega):
+        """
+        Encola la entrega de filas ya guardadas.
+
+        Returns:
+            dict: Futuros de entrega y el resultado de la fila correspondiente
+        """
+        futuros = {}
+        for resultado, diagnostico in guardados:
+            if self.notificar:
+                futuros[entrega.submit(self._entregar, diagnostico, resultado['id'])] = resultado
+            else:
+                resultado['status'] = 'completed'
+        return futuros
+
+    def _entregar(self, diagnostico, diagnostico_id):
+        """Genera el PDF si hace falta y registra las notificaciones del encuestado"""
+        inicio = time.monotonic()
+        try:
+            return entregar_diagnostico(diagnostico, diagnostico_id)
+        finally:
+            self._acumular('notify', inicio)
+
+    def _acumular(self, etapa, inicio):
+        with self._lock:
+            self._segundos[etapa] += time.monotonic() - inicio
+
+    @staticmethod
+    def _fallo(resultado, etapa, error):
+        logger.error(f"Fila {resultado['fila']} falló en la etapa {etapa}: {str(error)}")
+        resultado['status'] = 'error'
+        resultado['errores'].append(f"{etapa}: {str(error)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importa un lote de encuestas desde CSV o JSONL')
+    parser.add_argument('archivo', help='Archivo .csv (con cabecera) o .jsonl')
+    parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Por defecto se deduce de la extensión')
+    parser.add_argument('--concurrencia', type=int, default=None)
+    parser.add_argument('--tamano-lote', type=int, default=None, help='Filas por inserción en la base de datos')
+    parser.add_argument('--sin-notificar', action='store_true', help='No generar PDFs ni enviar notificaciones')
+    parser.add_argument('--salida', help='Guardar el informe completo en este archivo JSON')
+    parser.add_argument('--esperar-entregas', type=float, default=300,
+                        help='Segundos máximos de espera para que se envíen las notificaciones')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    with open(args.archivo, 'r', encoding='utf-8') as f:
+        filas = leer_filas(f.read(), args.formato or formato_de(args.archivo))
+
+    informe = ImportadorLote(args.concurrencia, args.tamano_lote, not args.sin_notificar).procesar(filas)
+    if not args.sin_notificar and not bandeja_salida.esperar(args.esperar_entregas):
+        print("Quedan notificaciones pendientes; se enviarán al iniciar la aplicación web")
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+
+    for fila in informe['rows']:
+        if fila['status'] != 'completed':
+            print(f"Fila {fila['fila']}: {fila['status']} - {'; '.join(fila['errores'])}")
+    print(json.dumps({k: v for k, v in informe.items() if k != 'rows'}, ensure_ascii=False, indent=2))
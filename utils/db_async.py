@@ -0,0 +1,138 @@
+import os
+import asyncio
+import logging
+from config import Config
+from utils.db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolAsincrono:
+    """
+    Consultas a MySQL para el modo ASGI. Con el driver 'aiomysql' las consultas
+    son corrutinas sobre un pool de conexiones asíncronas; con 'thread' se
+    ejecutan en el pool de hilos del bucle sobre el pool síncrono (útil si
+    aiomysql no está instalado o con conexiones simuladas).
+    """
+
+    def __init__(self, driver=None, max_size=None):
+        """
+        Inicializa el pool (las conexiones se abren en la primera consulta).
+
+        Args:
+            driver (str, optional): 'aiomysql' o 'thread'
+            max_size (int, optional): Número máximo de conexiones abiertas
+        """
+        self.driver = driver or Config.DB_ASYNC_DRIVER
+        self.max_size = max_size or Config.DB_POOL_SIZE
+        self._pool = None
+        self._loop = None
+        self._lock = None
+        self._metricas = {'queries': 0, 'errors': 0}
+
+        if self.driver == 'aiomysql':
+            try:
+                import aiomysql  # noqa: F401
+            except ImportError:
+                logger.warning("aiomysql no está instalado: las consultas asíncronas usarán hilos")
+                self.driver = 'thread'
+
+    async def _obtener(self):
+        """Crea el pool de aiomysql en el bucle de eventos actual si no existe"""
+        loop = asyncio.get_running_loop()
+        if self._pool is not None and self._loop is loop:
+            return self._pool
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+            self._pool = None
+        async with self._lock:
+            if self._pool is None:
+                import aiomysql
+                self._pool = await aiomysql.create_pool(
+                    host=Config.DB_HOST,
+                    port=Config.DB_PORT,
+                    user=Config.DB_USER,
+                    password=Config.DB_PASSWORD,
+                    db=Config.DB_NAME,
+                    charset='utf8mb4',
+                    cursorclass=aiomysql.DictCursor,
+                    connect_timeout=Config.DB_CONNECT_TIMEOUT,
+                    autocommit=True,
+                    minsize=0,
+                    maxsize=self.max_size,
+                    pool_recycle=int(Config.DB_POOL_MAX_LIFETIME)
+                )
+                logger.info(f"Pool asíncrono de MySQL creado (máximo {self.max_size} conexiones)")
+        return self._pool
+
+    async def consultar_uno(self, sql, params=()):
+        """
+        Ejecuta una consulta y devuelve la primera fila.
+
+        Args:
+            sql (str): Sentencia con marcadores %s
+            params (tuple): Parámetros de la sentencia
+
+        Returns:
+            dict: Primera fila o None si no hay resultados
+        """
+        self._metricas['queries'] += 1
+        try:
+            if self.driver == 'thread':
+                return await asyncio.to_thread(_consultar_uno, sql, params)
+            pool = await self._obtener()
+            async with pool.acquire() as conn, conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return await cursor.fetchone()
+        except Exception:
+            self._metricas['errors'] += 1
+            raise
+
+    async def close(self):
+        """Cierra las conexiones del pool"""
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def stats(self):
+        """
+        Obtiene las métricas del pool.
+
+        Returns:
+            dict: Driver, conexiones abiertas y libres, consultas y errores
+        """
+        pool = self._pool
+        return {
+            'driver': self.driver,
+            'size': pool.size if pool is not None else 0,
+            'free': pool.freesize if pool is not None else 0,
+            'max_size': self.max_size,
+            **self._metricas
+        }
+
+
+def _consultar_uno(sql, params):
+    """Consulta con el pool síncrono, para el driver 'thread'"""
+    with get_pool().conexion() as conn, conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+_pool = None
+_pool_pid = None
+
+
+def get_pool_async():
+    """
+    Obtiene el pool asíncrono del proceso, creándolo si es necesario.
+
+    Returns:
+        PoolAsincrono: Pool de consultas asíncronas
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = PoolAsincrono()
+        _pool_pid = os.getpid()
+    return _pool
@@ -0,0 +1,245 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PoolAgotadoError(Exception):
+    """Se lanza cuando no hay conexiones disponibles dentro del tiempo de espera"""
+
+
+def _conectar_mysql():
+    """Abre una conexión nueva a MySQL con la configuración de la aplicación"""
+    return pymysql.connect(
+        host=Config.DB_HOST,
+        user=Config.DB_USER,
+        password=Config.DB_PASSWORD,
+        database=Config.DB_NAME,
+        port=Config.DB_PORT,
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor,
+        connect_timeout=Config.DB_CONNECT_TIMEOUT,
+        # Sin autocommit, una conexión reutilizada vería la instantánea de su
+        # transacción anterior; las escrituras siguen llamando a commit()
+        autocommit=True
+    )
+
+
+class PoolConexiones:
+    """Pool de conexiones a MySQL acotado y seguro entre hilos"""
+
+    def __init__(self, connect_fn=None, max_size=None, timeout=None, max_idle=None,
+                 max_lifetime=None, ping_after=None):
+        """
+        Inicializa el pool de conexiones.
+
+        Args:
+            connect_fn (callable, optional): Función que abre una conexión nueva
+            max_size (int, optional): Número máximo de conexiones abiertas
+            timeout (float, optional): Segundos máximos de espera por una conexión libre
+            max_idle (float, optional): Segundos de inactividad tras los que se cierra una conexión
+            max_lifetime (float, optional): Segundos de vida máxima de una conexión
+            ping_after (float, optional): Segundos de inactividad tras los que se verifica
+                la conexión antes de entregarla
+        """
+        self.connect_fn = connect_fn or _conectar_mysql
+        self.max_size = max_size or Config.DB_POOL_SIZE
+        self.timeout = timeout if timeout is not None else Config.DB_POOL_TIMEOUT
+        self.max_idle = max_idle or Config.DB_POOL_MAX_IDLE
+        self.max_lifetime = max_lifetime or Config.DB_POOL_MAX_LIFETIME
+        self.ping_after = ping_after if ping_after is not None else Config.DB_POOL_PING_AFTER
+
+        # Conexiones libres: (conexión, creada, último uso). Se usa como pila para
+        # reutilizar primero las más recientes y dejar envejecer las sobrantes
+        self._libres = deque()
+        self._abiertas = 0
+        self._lock = threading.Lock()
+        self._disponible = threading.Condition(self._lock)
+        self._creadas = {}
+
+        self._metricas = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'exhausted': 0,
+            'max_wait_seconds': 0.0,
+        }
+
+    @contextmanager
+    def conexion(self):
+        """
+        Presta una conexión del pool durante el bloque y la devuelve al salir.
+
+        Raises:
+            PoolAgotadoError: Si no se obtuvo una conexión dentro del tiempo de espera
+        """
+        conn = self._adquirir()
+        try:
+            yield conn
+        except Exception:
+            # Una conexión con un error a medias no debe volver al pool
+            self._descartar(conn)
+            raise
+        else:
+            self._liberar(conn)
+
+    def _adquirir(self):
+        """Obtiene una conexión libre y sana, o abre una nueva si hay capacidad"""
+        inicio = time.time()
+        while True:
+            libre = self._reservar(inicio)
+            if libre is None:
+                break
+            # Verificar y cerrar fuera del lock: son operaciones de red que pueden tardar
+            conn, creada, ultimo_uso = libre
+            ahora = time.time()
+            if ahora - creada > self.max_lifetime or ahora - ultimo_uso > self.max_idle:
+                motivo = 'recycled'
+            elif ahora - ultimo_uso > self.ping_after and not self._sana(conn):
+                motivo = 'failed_health_checks'
+            else:
+                with self._lock:
+                    self._metricas['reused'] += 1
+                return conn
+            with self._lock:
+                self._metricas[motivo] += 1
+                self._retirar(conn)
+                self._disponible.notify()
+            self._cerrar(conn)
+
+        # Abrir la conexión fuera del lock para no bloquear a los demás hilos
+        try:
+            conn = self.connect_fn()
+        except Exception:
+            with self._lock:
+                self._abiertas -= 1
+                self._disponible.notify()
+            raise
+        with self._lock:
+            self._metricas['created'] += 1
+            self._creadas[id(conn)] = time.time()
+        return conn
+
+    def _reservar(self, inicio):
+        """
+        Toma una conexión libre o reserva el cupo de una nueva, esperando si el pool está saturado.
+
+        Returns:
+            tuple: (conexión, creada, último uso) de una conexión libre, o None si se reservó un cupo
+
+        Raises:
+            PoolAgotadoError: Si no se obtuvo una conexión dentro del tiempo de espera
+        """
+        with self._lock:
+            while True:
+                if self._libres:
+                    return self._libres.pop()
+
+                if self._abiertas < self.max_size:
+                    self._abiertas += 1
+                    return None
+
+                # Pool saturado: esperar a que alguien devuelva una conexión
+                restante = self.timeout - (time.time() - inicio)
+                if restante <= 0:
+                    self._metricas['exhausted'] += 1
+                    raise PoolAgotadoError(
+                        f"No hay conexiones disponibles tras {self.timeout} segundos ({self.max_size} en uso)"
+                    )
+                self._metricas['waits'] += 1
+                self._disponible.wait(restante)
+                espera = time.time() - inicio
+                self._metricas['max_wait_seconds'] = max(self._metricas['max_wait_seconds'], espera)
+
+    def _liberar(self, conn):
+        """Devuelve una conexión al pool"""
+        with self._lock:
+            creada = self._creadas.get(id(conn), time.time())
+            self._libres.append((conn, creada, time.time()))
+            self._disponible.notify()
+
+    def _descartar(self, conn):
+        """Cierra una conexión prestada en lugar de devolverla al pool"""
+        with self._lock:
+            self._retirar(conn)
+            self._disponible.notify()
+        self._cerrar(conn)
+
+    def _retirar(self, conn):
+        """Libera el cupo de una conexión que se va a cerrar (requiere tener el lock)"""
+        self._abiertas -= 1
+        self._creadas.pop(id(conn), None)
+
+    def _cerrar(self, conn):
+        """Cierra una conexión ya retirada del pool (sin el lock: puede esperar a la red)"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _sana(self, conn):
+        """Verifica que una conexión siga viva"""
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"Conexión inactiva descartada del pool: {str(e)}")
+            return False
+
+    def close(self):
+        """Cierra todas las conexiones libres del pool"""
+        with self._lock:
+            retiradas = [conn for conn, _, _ in self._libres]
+            self._libres.clear()
+            for conn in retiradas:
+                self._retirar(conn)
+        for conn in retiradas:
+            self._cerrar(conn)
+
+    def stats(self):
+        """
+        Obtiene las métricas del pool.
+
+        Returns:
+            dict: Conexiones abiertas, en uso, libres y contadores de actividad
+        """
+        with self._lock:
+            return {
+                'size': self.max_size,
+                'open': self._abiertas,
+                'idle': len(self._libres),
+                'in_use': self._abiertas - len(self._libres),
+                **self._metricas,
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Obtiene el pool de conexiones del proceso, creándolo si es necesario.
+    Tras un fork (workers de gunicorn) se crea un pool nuevo, ya que los
+    sockets heredados no pueden compartirse entre procesos.
+
+    Returns:
+        PoolConexiones: Pool de conexiones a MySQL
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = PoolConexiones()
+                _pool_pid = os.getpid()
+                logger.info(f"Pool de conexiones MySQL creado (máximo {_pool.max_size} conexiones)")
+    return _pool
@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Campos cuyo valor exacto se reemplaza al personalizar un diagnóstico en caché
+CAMPOS_PERSONALIZABLES = ('peso', 'estatura', 'imc', 'presion_arterial', 'pulso', 'edad')
+
+# Campos de texto libre (forman parte de la clave salvo que se active DIAGNOSIS_CACHE_IGNORE_FREE_TEXT)
+CAMPOS_TEXTO_LIBRE = ('antecedentes', 'objetivos', 'comentarios')
+
+# Respuestas libres (normalizadas) que no aportan información del encuestado
+_SIN_CONTENIDO = {'', 'na', 'n a', 'no', 'nada', 'no aplica', 'ninguno', 'ninguna', 'ningunos', 'ningunas', 'sin antecedentes'}
+
+
+def _normalizar_texto(valor):
+    """Normaliza texto libre: minúsculas, sin tildes y con espacios colapsados"""
+    texto = unicodedata.normalize('NFKD', str(valor or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(texto.lower().split())
+
+
+def _palabras(valor):
+    """Divide un texto normalizado en palabras, sin signos de puntuación"""
+    return _normalizar_texto(re.sub(r'[^\w\s]', ' ', str(valor or ''))).split()
+
+
+def _numero(valor):
+    """Convierte un valor del formulario a número, o None si no es posible"""
+    try:
+        return float(str(valor).replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _banda(valor, ancho):
+    """Agrupa un número en bandas del ancho indicado"""
+    numero = _numero(valor)
+    if numero is None:
+        return None
+    return int(numero // ancho * ancho)
+
+
+def _categoria_presion(presion):
+    """Clasifica la presión arterial 'sistólica/diastólica' según las guías habituales"""
+    partes = re.findall(r'\d+', str(presion or ''))
+    if len(partes) < 2:
+        return None
+    sistolica, diastolica = int(partes[0]), int(partes[1])
+    if sistolica < 90 or diastolica < 60:
+        return 'baja'
+    if sistolica < 120 and diastolica < 80:
+        return 'normal'
+    if sistolica < 130 and diastolica < 80:
+        return 'elevada'
+    if sistolica < 140 and diastolica < 90:
+        return 'hipertension_1'
+    return 'hipertension_2'
+
+
+def clave_canonica(diagnostico, personalizar=False):
+    """
+    Construye la clave canónica de un diagnóstico a partir de sus respuestas
+    estructuradas. Sin personalización la clave incluye los valores exactos que
+    el texto puede citar (peso, estatura, IMC, presión, pulso, edad), por lo que
+    solo se reutiliza entre respuestas idénticas; con personalización los
+    valores numéricos se agrupan en bandas y se sustituyen en la plantilla.
+
+    Args:
+        diagnostico (Diagnostico): Diagnóstico con los datos del formulario
+        personalizar (bool): Si la entrada se guarda como plantilla
+
+    Returns:
+        str: Hash SHA-256 de la clave canónica
+    """
+    sintomas = diagnostico.sintomas
+    if isinstance(sintomas, str):
+        sintomas = sintomas.split(',')
+    campos = {
+        'edad': _banda(diagnostico.edad, 5),
+        'genero': _normalizar_texto(diagnostico.genero),
+        'imc': diagnostico.interpretar_imc(),
+        'presion': _categoria_presion(diagnostico.presion_arterial),
+        'pulso': _banda(diagnostico.pulso, 10),
+        'energia': _banda(diagnostico.nivel_energia, 1),
+        'sueno': _normalizar_texto(diagnostico.habitos_sueno),
+        'alimentacion': _normalizar_texto(diagnostico.habitos_alimentacion),
+        'actividad': _normalizar_texto(diagnostico.actividad_fisica),
+        'estres': _normalizar_texto(diagnostico.estres),
+        'sintomas': sorted({_normalizar_texto(s) for s in sintomas if _normalizar_texto(s)}),
+    }
+    if personalizar:
+        campos['modo'] = 'plantilla'
+    else:
+        campos['modo'] = 'exacta'
+        campos['valores'] = {campo: str(getattr(diagnostico, campo, '') or '').strip() for campo in CAMPOS_PERSONALIZABLES}
+    if not Config.DIAGNOSIS_CACHE_IGNORE_FREE_TEXT:
+        # El texto libre solo coincide si es idéntico tras normalizarlo
+        campos.update({campo: _normalizar_texto(getattr(diagnostico, campo, '')) for campo in CAMPOS_TEXTO_LIBRE})
+    campos['modelo'] = Config.OPENAI_MODEL
+    return hashlib.sha256(json.dumps(campos, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _valores_personalizables(diagnostico):
+    """Obtiene los valores exactos que se sustituyen en las plantillas"""
+    valores = {}
+    for campo in CAMPOS_PERSONALIZABLES:
+        valor = str(getattr(diagnostico, campo, '') or '').strip()
+        # Valores muy cortos (p. ej. '7') aparecerían en cualquier parte del texto
+        if len(valor) >= 2:
+            valores[campo] = valor
+    return valores
+
+
+def a_plantilla(texto, diagnostico):
+    """
+    Reemplaza los valores exactos del encuestado por marcadores. Solo se obtiene
+    una plantilla si el reemplazo es inequívoco y completo: si dos campos tienen
+    el mismo valor (p. ej. peso 70 y pulso 70) o queda algún número en el texto
+    (un valor reformateado como "1,75 m" o un IMC redondeado), se devuelve None
+    para no trasladar datos de un encuestado al informe de otro.
+
+    Args:
+        texto (str): Texto generado
+        diagnostico (Diagnostico): Diagnóstico que originó el texto
+
+    Returns:
+        str: Texto con marcadores ⟦campo⟧, o None si no se puede convertir con seguridad
+    """
+    valores = _valores_personalizables(diagnostico)
+    if len(set(valores.values())) < len(valores):
+        return None
+    for campo, valor in sorted(valores.items(), key=lambda item: -len(item[1])):
+        texto = re.sub(rf'(?<![\w.,/]){re.escape(valor)}(?![\w/]|[.,]\d)', f'⟦{campo}⟧', texto)
+    if re.search(r'\d', re.sub(r'⟦\w+⟧', '', texto)):
+        return None
+    return texto
+
+
+def sin_texto_libre(diagnostico):
+    """
+    Indica si el encuestado dejó vacías (o sin contenido, p. ej. "ninguno") todas
+    las respuestas libres. Cuando DIAGNOSIS_CACHE_IGNORE_FREE_TEXT está activo
+    solo se guardan textos de estos encuestados: el modelo no recibió ningún
+    antecedente, objetivo ni comentario, así que no hay nada que trasladar al
+    informe de otro.
+
+    Args:
+        diagnostico (Diagnostico): Diagnóstico con los datos del formulario
+
+    Returns:
+        bool: True si ninguna respuesta libre tiene contenido
+    """
+    return all(' '.join(_palabras(getattr(diagnostico, campo, ''))) in _SIN_CONTENIDO
+               for campo in CAMPOS_TEXTO_LIBRE)
+
+
+def desde_plantilla(plantilla, diagnostico):
+    """
+    Rellena los marcadores de una plantilla con los valores de otro encuestado.
+
+    Args:
+        plantilla (str): Texto con marcadores ⟦campo⟧
+        diagnostico (Diagnostico): Diagnóstico del nuevo encuestado
+
+    Returns:
+        str: Texto personalizado
+    """
+    for campo in CAMPOS_PERSONALIZABLES:
+        plantilla = plantilla.replace(f'⟦{campo}⟧', str(getattr(diagnostico, campo, '') or ''))
+    return plantilla
+
+
+class CacheDiagnosticos:
+    """Caché en disco de diagnósticos generados, indexada por las respuestas normalizadas"""
+
+    def __init__(self, db_path=None, max_entries=None, personalizar=None):
+        """
+        Inicializa la caché de diagnósticos.
+
+        Args:
+            db_path (str, optional): Ruta al archivo SQLite de la caché
+            max_entries (int, optional): Número máximo de diagnósticos almacenados
+            personalizar (bool, optional): Si es True, se guardan plantillas y se
+                rellenan con los valores exactos del nuevo encuestado
+        """
+        self.db_path = db_path or Config.DIAGNOSIS_CACHE_PATH
+        self.max_entries = max_entries or Config.DIAGNOSIS_CACHE_MAX_ENTRIES
+        self.personalizar = Config.DIAGNOSIS_CACHE_PERSONALIZE if personalizar is None else personalizar
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._metricas = {'hits': 0, 'misses': 0, 'stores': 0, 'skipped': 0, 'evictions': 0, 'seconds_saved': 0.0}
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS diagnosis_cache (
+                key TEXT PRIMARY KEY,
+                diagnostico TEXT NOT NULL,
+                recomendaciones TEXT NOT NULL,
+                generation_seconds REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON diagnosis_cache(last_used)")
+
+    def _conn(self):
+        """Obtiene la conexión SQLite del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, diagnostico):
+        """
+        Busca un diagnóstico previo para respuestas equivalentes.
+
+        Args:
+            diagnostico (Diagnostico): Diagnóstico con los datos del formulario
+
+        Returns:
+            dict: Diagnóstico y recomendaciones, o None si no hay coincidencia
+        """
+        key = clave_canonica(diagnostico, self.personalizar)
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT diagnostico, recomendaciones, generation_seconds FROM diagnosis_cache WHERE key = ?",
+            (key,)
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self._metricas['misses'] += 1
+                return None
+            self._metricas['hits'] += 1
+            self._metricas['seconds_saved'] += row[2]
+
+        conn.execute(
+            "UPDATE diagnosis_cache SET hits = hits + 1, last_used = ? WHERE key = ?",
+            (time.time(), key)
+        )
+        texto_diagnostico, texto_recomendaciones = row[0], row[1]
+        if self.personalizar:
+            texto_diagnostico = desde_plantilla(texto_diagnostico, diagnostico)
+            texto_recomendaciones = desde_plantilla(texto_recomendaciones, diagnostico)
+        return {'diagnostico': texto_diagnostico, 'recomendaciones': texto_recomendaciones}
+
+    def put(self, diagnostico, generation_seconds):
+        """
+        Guarda el diagnóstico generado para reutilizarlo con respuestas equivalentes.
+        Los textos que no se pueden reutilizar sin exponer datos del encuestado no se guardan.
+
+        Args:
+            diagnostico (Diagnostico): Diagnóstico ya generado
+            generation_seconds (float): Segundos que tomó la generación
+        """
+        texto_diagnostico, texto_recomendaciones = diagnostico.diagnostico, diagnostico.recomendaciones
+        if Config.DIAGNOSIS_CACHE_IGNORE_FREE_TEXT and not sin_texto_libre(diagnostico):
+            # La clave no incluye el texto libre: el texto podría usarlo y servirse a otro encuestado
+            with self._lock:
+                self._metricas['skipped'] += 1
+            return
+        if self.personalizar:
+            texto_diagnostico = a_plantilla(texto_diagnostico, diagnostico)
+            texto_recomendaciones = a_plantilla(texto_recomendaciones, diagnostico)
+            if texto_diagnostico is None or texto_recomendaciones is None:
+                with self._lock:
+                    self._metricas['skipped'] += 1
+                return
+
+        ahora = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO diagnosis_cache "
+            "(key, diagnostico, recomendaciones, generation_seconds, hits, created, last_used) "
+            "VALUES (?, ?, ?, ?, 0, ?, ?)",
+            (clave_canonica(diagnostico, self.personalizar), texto_diagnostico, texto_recomendaciones,
+             generation_seconds, ahora, ahora)
+        )
+        # Expulsar las entradas usadas hace más tiempo si se superó el límite
+        expulsadas = conn.execute(
+            "DELETE FROM diagnosis_cache WHERE key IN ("
+            "SELECT key FROM diagnosis_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        with self._lock:
+            self._metricas['stores'] += 1
+            self._metricas['evictions'] += expulsadas
+
+    def stats(self):
+        """
+        Obtiene las métricas de la caché.
+
+        Returns:
+            dict: Entradas, aciertos, fallos, tasa de aciertos y segundos ahorrados
+        """
+        entradas = self._conn().execute("SELECT COUNT(*) FROM diagnosis_cache").fetchone()[0]
+        with self._lock:
+            consultas = self._metricas['hits'] + self._metricas['misses']
+            return {
+                'entries': entradas,
+                'max_entries': self.max_entries,
+                'hit_ratio': round(self._metricas['hits'] / consultas, 4) if consultas else 0.0,
+                **self._metricas,
+                'seconds_saved': round(self._metricas['seconds_saved'], 2),
+            }
+
+
+# Caché compartida por los diagnósticos del proceso (None si está deshabilitada)
+cache_diagnosticos = CacheDiagnosticos() if Config.DIAGNOSIS_CACHE_ENABLED else None
@@ -1,10 +1,10 @@
 import os
 import logging
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
 from config import Config
+from utils.smtp_pool import get_smtp_pool
+from utils.attachment_cache import cache_adjuntos
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +20,7 @@ class EmailSender:
         self.sender_email = Config.MAIL_DEFAULT_SENDER
         self.use_tls = Config.MAIL_USE_TLS
     
-    def send_email(self, to_email, subject, nombre, diagnostico_id, pdf_path=None):
+    def send_email(self, to_email, subject, nombre, diagnostico_id, pdf_path=None, enlace_pdf=None):
         """
         Envía un correo electrónico con el diagnóstico.
         
@@ -30,65 +30,67 @@ class EmailSender:
             nombre (str): Nombre del destinatario
             diagnostico_id (str): ID del diagnóstico
             pdf_path (str, optional): Ruta al archivo PDF para adjuntar
+            enlace_pdf (str, optional): Enlace de descarga firmado que sustituye al adjunto
             
         Returns:
             bool: True si el correo se envió correctamente, False en caso contrario
         """
         try:
-            # Crear mensaje
-            msg = MIMEMultipart()
-            msg['From'] = f'"{Config.COMPANY_NAME}" <{self.sender_email}>'
-            msg['To'] = to_email
-            msg['Subject'] = subject
+            msg = self._crear_mensaje(to_email, subject, nombre, diagnostico_id, pdf_path, enlace_pdf)
             
-            # Cuerpo del mensaje HTML
-            html_content = self._generar_plantilla_email(nombre, diagnostico_id)
-            msg.attach(MIMEText(html_content, 'html'))
-            
-            # Adjuntar PDF si existe
-            if pdf_path and os.path.exists(pdf_path):
-                with open(pdf_path, 'rb') as file:
-                    pdf_part = MIMEApplication(file.read(), Name=os.path.basename(pdf_path))
-                
-                pdf_part['Content-Disposition'] = f'attachment; filename="{os.path.basename(pdf_path)}"'
-                msg.attach(pdf_part)
-                logger.info(f"PDF adjuntado: {pdf_path}")
-            
-            # Conectar al servidor SMTP
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.ehlo()
-            
-            if self.use_tls:
-                server.starttls()
-                server.ehlo()
-            
-            # Iniciar sesión
-            server.login(self.smtp_user, self.smtp_password)
-            
-            # Enviar correo
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info(f"Correo enviado exitosamente a {to_email}")
-            return True
+            # Enviar por una sesión SMTP ya autenticada del pool
+            enviado = get_smtp_pool().enviar(msg)
+            if enviado:
+                logger.info(f"Correo enviado exitosamente a {to_email}")
+            return enviado
             
         except Exception as e:
             logger.error(f"Error al enviar correo electrónico: {str(e)}", exc_info=True)
             return False
     
-    def _generar_plantilla_email(self, nombre, diagnostico_id):
+    def _crear_mensaje(self, to_email, subject, nombre, diagnostico_id, pdf_path=None, enlace_pdf=None):
+        """
+        Construye el mensaje MIME con el cuerpo HTML y el PDF adjunto o su enlace de descarga.
+        
+        Returns:
+            MIMEMultipart: Mensaje listo para enviar
+        """
+        # Crear mensaje
+        msg = MIMEMultipart()
+        msg['From'] = f'"{Config.COMPANY_NAME}" <{self.sender_email}>'
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # Cuerpo del mensaje HTML
+        html_content = self._generar_plantilla_email(nombre, diagnostico_id, enlace_pdf)
+        msg.attach(MIMEText(html_content, 'html'))
+        
+        # Adjuntar PDF si existe (codificado una sola vez y compartido entre envíos)
+        if not enlace_pdf and pdf_path and os.path.exists(pdf_path):
+            msg.attach(cache_adjuntos.parte_mime(pdf_path))
+            logger.info(f"PDF adjuntado: {pdf_path}")
+        
+        return msg
+    
+    def _generar_plantilla_email(self, nombre, diagnostico_id, enlace_pdf=None):
         """
         Genera la plantilla HTML para el correo electrónico.
         
         Args:
             nombre (str): Nombre del destinatario
             diagnostico_id (str): ID del diagnóstico
+            enlace_pdf (str, optional): Enlace de descarga del PDF cuando no se adjunta
             
         Returns:
             str: Contenido HTML del correo
         """
         # URL base de la aplicación (ajustar según configuración)
-        base_url = os.environ.get('APP_URL', 'http://localhost:5000')
+        base_url = Config.APP_URL
+        
+        if enlace_pdf:
+            nota_pdf = f'Puedes descargar una copia del informe en formato PDF desde <a href="{enlace_pdf}">este enlace</a>.'
+        else:
+            nota_pdf = 'También hemos adjuntado una copia del informe en formato PDF para tu comodidad.'
         
         # Crear la plantilla HTML
         html = f"""
@@ -176,7 +178,7 @@ class EmailSender:
                     <a href="{base_url}/view-report/{diagnostico_id}" class="button">Ver mi diagnóstico</a>
                 </p>
                 
-                <p>También hemos adjuntado una copia del informe en formato PDF para tu comodidad.</p>
+                <p>{nota_pdf}</p>
                 
                 <p>Si deseas programar una sesión de consulta para discutir los resultados en detalle, puedes hacerlo a través de este enlace:</p>
                 
@@ -0,0 +1,547 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import uuid
+import socket
+import threading
+import importlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ColaLlenaError(Exception):
+    """Se lanza cuando la cola alcanzó el máximo de trabajos pendientes"""
+
+
+class LimitadorEtapas:
+    """Limita la concurrencia de cada etapa del procesamiento (LLM, BD, PDF, notificaciones)"""
+
+    # Funciones (etapa, segundos de espera, segundos de ejecución) que se llaman al
+    # terminar cada etapa de cualquier limitador, p. ej. para medir el pipeline
+    observadores = []
+
+    def __init__(self, limites=None):
+        """
+        Inicializa los semáforos por etapa.
+
+        Args:
+            limites (dict, optional): Máximo de ejecuciones simultáneas por etapa.
+        """
+        limites = limites if limites is not None else Config.JOB_STAGE_LIMITS
+        self._semaforos = {
+            etapa: threading.BoundedSemaphore(max(1, int(limite)))
+            for etapa, limite in limites.items()
+        }
+
+    @contextmanager
+    def etapa(self, nombre):
+        """
+        Ejecuta un bloque respetando el límite de concurrencia de la etapa.
+        Las etapas sin límite configurado se ejecutan sin restricción.
+
+        Args:
+            nombre (str): Nombre de la etapa
+        """
+        semaforo = self._semaforos.get(nombre)
+        inicio = time.monotonic()
+        if semaforo is not None:
+            semaforo.acquire()
+        comienzo = time.monotonic()
+        try:
+            yield
+        finally:
+            if semaforo is not None:
+                semaforo.release()
+            if self.observadores:
+                self._notificar(nombre, comienzo - inicio, time.monotonic() - comienzo)
+
+    def _notificar(self, nombre, espera, duracion):
+        """Entrega la medición de una etapa a los observadores registrados"""
+        for observador in list(self.observadores):
+            try:
+                observador(nombre, espera, duracion)
+            except Exception as e:
+                logger.warning(f"Error en un observador de la etapa {nombre}: {str(e)}")
+
+
+class ColaTrabajos:
+    """Cola de trabajos persistente en SQLite con un pool acotado de workers"""
+
+    def __init__(self, handler, on_failure=None, db_path=None, workers=None,
+                 max_retries=None, backoff=None, max_pending=None, lease=None, retention=None):
+        """
+        Inicializa la cola de trabajos.
+
+        Args:
+            handler (callable): Función que procesa un trabajo, recibe (payload, job_id)
+            on_failure (callable, optional): Se llama con (payload, job_id, error) cuando
+                un trabajo agota sus reintentos
+            db_path (str, optional): Ruta al archivo SQLite de la cola
+            workers (int, optional): Número máximo de trabajos simultáneos
+            max_retries (int, optional): Intentos máximos por trabajo
+            backoff (float, optional): Segundos base para el retroceso exponencial
+            max_pending (int, optional): Máximo de trabajos pendientes antes de rechazar
+            lease (float, optional): Segundos tras los que un trabajo en ejecución
+                se considera abandonado y se recupera
+            retention (float, optional): Segundos que se conservan los trabajos terminados
+        """
+        self.handler = handler
+        self.on_failure = on_failure
+        self.db_path = db_path or Config.JOB_DB_PATH
+        self.workers = workers or Config.JOB_WORKERS
+        self.max_retries = max_retries or Config.JOB_MAX_RETRIES
+        self.backoff = backoff if backoff is not None else Config.JOB_RETRY_BACKOFF
+        self.max_pending = max_pending or Config.JOB_MAX_PENDING
+        self.lease = lease or Config.JOB_LEASE_SECONDS
+        self.retention = retention or 86400
+
+        self._executor = None
+        self._dispatcher = None
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._owner = _propietario()
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._crear_tabla()
+
+    def _connect(self):
+        """Abre una conexión a la base de datos SQLite de la cola"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _crear_tabla(self):
+        """Crea la tabla de trabajos si no existe"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_run REAL NOT NULL,
+                    lease_until REAL,
+                    owner TEXT,
+                    last_error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, next_run)")
+        finally:
+            conn.close()
+
+    def start(self):
+        """Recupera trabajos inconclusos e inicia el despachador (idempotente)"""
+        with self._start_lock:
+            if self._dispatcher is not None:
+                return
+            # El PID puede cambiar si el módulo se importó antes de un fork (gunicorn --preload)
+            self._owner = _propietario()
+            recuperados = self._recuperar()
+            if recuperados:
+                logger.warning(f"Recuperados {recuperados} trabajos inconclusos de una ejecución anterior")
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='diagnostico')
+            self._dispatcher = threading.Thread(target=self._despachar, name='job-dispatcher', daemon=True)
+            self._dispatcher.start()
+            logger.info(f"Cola de trabajos iniciada con {self.workers} workers ({self.db_path})")
+
+    def stop(self, wait=True):
+        """Detiene el despachador y espera a que terminen los trabajos en curso"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def submit(self, job_id, payload):
+        """
+        Encola un trabajo de forma persistente.
+
+        Args:
+            job_id (str): Identificador único del trabajo
+            payload (dict): Datos serializables en JSON para el handler
+
+        Raises:
+            ColaLlenaError: Si se superó el máximo de trabajos pendientes
+        """
+        ahora = time.time()
+        conn = self._connect()
+        try:
+            # Conteo e inserción en la misma transacción para no superar el límite
+            # con envíos simultáneos
+            conn.execute("BEGIN IMMEDIATE")
+            pendientes = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()[0]
+            if pendientes >= self.max_pending:
+                raise ColaLlenaError(f"La cola tiene {pendientes} trabajos pendientes")
+
+            conn.execute(
+                "INSERT INTO jobs (id, payload, status, attempts, next_run, created, updated) "
+                "VALUES (?, ?, 'pending', 0, ?, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), ahora, ahora, ahora)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        self.start()
+        self._wakeup.set()
+        logger.info(f"Trabajo encolado: {job_id}")
+
+    def stats(self):
+        """
+        Obtiene el número de trabajos por estado.
+
+        Returns:
+            dict: Conteo de trabajos por estado
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+            return {row['status']: row['total'] for row in rows}
+        finally:
+            conn.close()
+
+    def consultar(self, job_ids):
+        """
+        Obtiene el estado de varios trabajos.
+
+        Args:
+            job_ids (list): Identificadores de los trabajos
+
+        Returns:
+            dict: Estado, intentos, último error y última actualización por ID
+                (los trabajos inexistentes no aparecen)
+        """
+        if not job_ids:
+            return {}
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT id, status, attempts, last_error, updated FROM jobs "
+                f"WHERE id IN ({', '.join('?' * len(job_ids))})",
+                tuple(job_ids)
+            ).fetchall()
+            return {
+                row['id']: {
+                    'status': row['status'],
+                    'attempts': row['attempts'],
+                    'last_error': row['last_error'],
+                    'updated': row['updated'],
+                }
+                for row in rows
+            }
+        finally:
+            conn.close()
+
+    def _recuperar(self):
+        """
+        Devuelve a pendientes los trabajos abandonados: los que tienen la concesión
+        expirada y los que pertenecían a un proceso de este equipo que ya no existe.
+
+        Returns:
+            int: Número de trabajos recuperados
+        """
+        ahora = time.time()
+        conn = self._connect()
+        try:
+            huerfanos = [
+                row['id'] for row in conn.execute(
+                    "SELECT id, owner FROM jobs WHERE status = 'running' AND owner LIKE ?",
+                    (f"{socket.gethostname()}:%",)
+                ).fetchall()
+                if not _propietario_vivo(row['owner'])
+            ]
+            recuperados = conn.execute(
+                "UPDATE jobs SET status = 'pending', lease_until = NULL, owner = NULL, updated = ? "
+                "WHERE status = 'running' AND lease_until < ?",
+                (ahora, ahora)
+            ).rowcount
+            for job_id in huerfanos:
+                recuperados += conn.execute(
+                    "UPDATE jobs SET status = 'pending', lease_until = NULL, owner = NULL, updated = ? "
+                    "WHERE id = ? AND status = 'running'",
+                    (ahora, job_id)
+                ).rowcount
+            # Purgar trabajos terminados fuera del periodo de retención
+            conn.execute("DELETE FROM jobs WHERE status = 'done' AND updated < ?", (ahora - self.retention,))
+            return recuperados
+        finally:
+            conn.close()
+
+    def _reclamar(self):
+        """
+        Reclama atómicamente el siguiente trabajo listo para ejecutarse.
+
+        Returns:
+            sqlite3.Row: Trabajo reclamado o None si no hay trabajos listos
+        """
+        ahora = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' AND next_run <= ? "
+                "ORDER BY next_run LIMIT 1",
+                (ahora,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "lease_until = ?, owner = ?, updated = ? WHERE id = ?",
+                (ahora + self.lease, self._owner, ahora, row['id'])
+            )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _renovar(self):
+        """Extiende la concesión de los trabajos que este proceso tiene en ejecución"""
+        ahora = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE status = 'running' AND owner = ?",
+                (ahora + self.lease, ahora, self._owner)
+            )
+        finally:
+            conn.close()
+
+    def _despachar(self):
+        """Bucle del despachador: entrega trabajos al pool mientras haya capacidad"""
+        ultima_recuperacion = time.time()
+        ultima_renovacion = time.time()
+        while not self._stop.is_set():
+            # Los trabajos largos (p. ej. llamadas al LLM) no deben perder su concesión
+            # mientras se ejecutan, o otro proceso los recuperaría y ejecutaría a la vez
+            if time.time() - ultima_renovacion > self.lease / 3:
+                try:
+                    self._renovar()
+                except Exception as e:
+                    logger.error(f"Error al renovar la concesión de los trabajos: {str(e)}")
+                ultima_renovacion = time.time()
+
+            if not self._slots.acquire(timeout=min(1, self.lease / 3)):
+                continue
+            try:
+                job = self._reclamar()
+            except Exception as e:
+                logger.error(f"Error al reclamar trabajo: {str(e)}", exc_info=True)
+                job = None
+
+            if job is None:
+                self._slots.release()
+                self._wakeup.wait(timeout=min(Config.JOB_POLL_INTERVAL, self.lease / 3))
+                self._wakeup.clear()
+                # Recuperar periódicamente trabajos abandonados por otros procesos
+                if time.time() - ultima_recuperacion > self.lease:
+                    self._recuperar()
+                    ultima_recuperacion = time.time()
+                continue
+
+            self._executor.submit(self._ejecutar, job)
+
+    def _ejecutar(self, job):
+        """Ejecuta un trabajo y registra su resultado o programa un reintento"""
+        job_id = job['id']
+        payload = json.loads(job['payload'])
+        intento = job['attempts'] + 1
+        try:
+            logger.info(f"Ejecutando trabajo {job_id} (intento {intento}/{self.max_retries})")
+            self.handler(payload, job_id)
+            self._actualizar(job_id, "status = 'done', lease_until = NULL, owner = NULL")
+        except Exception as e:
+            if intento < self.max_retries:
+                espera = self.backoff * (2 ** (intento - 1)) * (1 + random.random() * 0.25)
+                logger.warning(f"Trabajo {job_id} falló ({str(e)}), reintento en {espera:.1f} segundos")
+                self._actualizar(
+                    job_id, "status = 'pending', lease_until = NULL, owner = NULL, next_run = ?, last_error = ?",
+                    (time.time() + espera, str(e))
+                )
+            else:
+                logger.error(f"Trabajo {job_id} falló definitivamente: {str(e)}", exc_info=True)
+                self._actualizar(job_id, "status = 'failed', lease_until = NULL, owner = NULL, last_error = ?", (str(e),))
+                if self.on_failure:
+                    try:
+                        self.on_failure(payload, job_id, e)
+                    except Exception as callback_error:
+                        logger.error(f"Error en on_failure del trabajo {job_id}: {str(callback_error)}")
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+    def _actualizar(self, job_id, campos, params=()):
+        """Actualiza campos de un trabajo que este proceso tiene reclamado"""
+        conn = self._connect()
+        try:
+            actualizados = conn.execute(
+                f"UPDATE jobs SET {campos}, updated = ? WHERE id = ? AND owner = ?",
+                (*params, time.time(), job_id, self._owner)
+            ).rowcount
+            if not actualizados:
+                logger.warning(f"El trabajo {job_id} ya no pertenece a este proceso, no se actualiza")
+        finally:
+            conn.close()
+
+
+class ColaCelery:
+    """Cola de trabajos respaldada por Celery/Redis para despliegues con varios nodos"""
+
+    def __init__(self, handler, on_failure=None):
+        """
+        Inicializa la cola sobre Celery.
+
+        Args:
+            handler (callable): Función que procesa un trabajo, recibe (payload, job_id).
+                Debe ser importable por nombre desde el worker de Celery.
+            on_failure (callable, optional): Se llama con (payload, job_id, error) cuando
+                un trabajo agota sus reintentos
+        """
+        self.handler_path = f"{handler.__module__}:{handler.__qualname__}"
+        self.on_failure_path = f"{on_failure.__module__}:{on_failure.__qualname__}" if on_failure else None
+
+    def start(self):
+        """Celery gestiona sus propios workers y la recuperación de trabajos"""
+
+    def stop(self, wait=True):
+        """Celery gestiona el ciclo de vida de sus workers"""
+
+    def submit(self, job_id, payload):
+        """
+        Encola un trabajo en el broker de Celery.
+
+        Args:
+            job_id (str): Identificador único del trabajo
+            payload (dict): Datos serializables en JSON para el handler
+        """
+        ejecutar_trabajo.apply_async(
+            args=(self.handler_path, self.on_failure_path, payload, job_id),
+            task_id=job_id
+        )
+        logger.info(f"Trabajo encolado en Celery: {job_id}")
+
+    def stats(self):
+        """Las estadísticas de Celery se consultan con sus propias herramientas"""
+        return {}
+
+
+_token = None
+_token_pid = None
+
+
+def _propietario():
+    """
+    Identificador de este proceso como propietario de trabajos: equipo, PID y un
+    token aleatorio de la ejecución actual (se renueva tras un fork).
+
+    Returns:
+        str: 'equipo:pid:token'
+    """
+    global _token, _token_pid
+    if _token_pid != os.getpid():
+        _token = uuid.uuid4().hex[:12]
+        _token_pid = os.getpid()
+    return f"{socket.gethostname()}:{os.getpid()}:{_token}"
+
+
+def _propietario_vivo(owner):
+    """
+    Indica si sigue en ejecución el proceso de este equipo que reclamó un trabajo.
+
+    Un PID igual al propio con otro token es una ejecución anterior: tras reiniciar
+    un contenedor el proceso nuevo suele recibir el mismo PID (p. ej. 1).
+    """
+    pid = int(owner.split(':')[1])
+    if pid == os.getpid():
+        return owner == _propietario()
+    return _proceso_vivo(pid)
+
+
+def _proceso_vivo(pid):
+    """Indica si existe un proceso con el PID dado en este equipo"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _importar(ruta):
+    """Importa un objeto a partir de una ruta 'modulo:nombre'"""
+    modulo, nombre = ruta.split(':')
+    return getattr(importlib.import_module(modulo), nombre)
+
+
+celery_app = None
+ejecutar_trabajo = None
+
+if Config.JOB_BACKEND == 'celery':
+    from celery import Celery
+
+    celery_app = Celery('vitalscan', broker=Config.CELERY_BROKER_URL)
+    celery_app.conf.update(
+        task_serializer='json',
+        accept_content=['json'],
+        # Confirmar al terminar para que los trabajos se reencolen si el worker muere
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        worker_prefetch_multiplier=1,
+        worker_concurrency=Config.JOB_WORKERS,
+    )
+
+    @celery_app.task(bind=True, name='vitalscan.ejecutar_trabajo')
+    def ejecutar_trabajo(self, handler_path, on_failure_path, payload, job_id):
+        """Tarea de Celery que ejecuta el handler con reintentos y retroceso exponencial"""
+        try:
+            _importar(handler_path)(payload, job_id)
+        except Exception as e:
+            if self.request.retries + 1 < Config.JOB_MAX_RETRIES:
+                espera = Config.JOB_RETRY_BACKOFF * (2 ** self.request.retries) * (1 + random.random() * 0.25)
+                raise self.retry(exc=e, countdown=espera)
+            logger.error(f"Trabajo {job_id} falló definitivamente: {str(e)}", exc_info=True)
+            if on_failure_path:
+                _importar(on_failure_path)(payload, job_id, e)
+
+
+def crear_cola(handler, on_failure=None):
+    """
+    Crea la cola de trabajos según el backend configurado.
+
+    Args:
+        handler (callable): Función que procesa un trabajo, recibe (payload, job_id)
+        on_failure (callable, optional): Se llama cuando un trabajo agota sus reintentos
+
+    Returns:
+        ColaTrabajos | ColaCelery: Cola de trabajos lista para usarse
+    """
+    if Config.JOB_BACKEND == 'celery':
+        return ColaCelery(handler, on_failure=on_failure)
+    return ColaTrabajos(handler, on_failure=on_failure)
+
+
+# Limitador compartido por todas las etapas del procesamiento
+limitador_etapas = LimitadorEtapas()
@@ -0,0 +1,64 @@
+import os
+import logging
+import threading
+import httpx
+import openai
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _crear_cliente():
+    """
+    Crea un cliente de OpenAI con un transporte HTTP compartido y conexiones persistentes.
+
+    Returns:
+        openai.OpenAI: Cliente configurado
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=Config.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            Config.OPENAI_TIMEOUT,
+            connect=Config.OPENAI_CONNECT_TIMEOUT,
+            # Tiempo máximo de espera por una conexión libre del pool
+            pool=Config.OPENAI_TIMEOUT
+        )
+    )
+    return openai.OpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.OPENAI_BASE_URL,
+        http_client=http_client,
+        # Los reintentos los gestiona utils.rate_limiter, que además respeta los límites globales
+        max_retries=0,
+        timeout=Config.OPENAI_TIMEOUT
+    )
+
+
+def get_openai_client():
+    """
+    Obtiene el cliente de OpenAI del proceso, creándolo si es necesario.
+    El cliente es seguro entre hilos y reutiliza las conexiones TLS entre
+    diagnósticos. Tras un fork se crea uno nuevo.
+
+    Returns:
+        openai.OpenAI: Cliente compartido
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = _crear_cliente()
+                _client_pid = os.getpid()
+                logger.info(
+                    f"Cliente de OpenAI creado ({Config.OPENAI_BASE_URL}, "
+                    f"máximo {Config.OPENAI_MAX_CONNECTIONS} conexiones)"
+                )
+    return _client
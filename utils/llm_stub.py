@@ -0,0 +1,191 @@
+"""
+Servidor local que imita la API de chat de OpenAI para pruebas de carga sin conexión.
+
+Uso:
+    python -m utils.llm_stub --port 8089 --latency 2 --tokens-per-second 50
+
+y en el entorno de la aplicación:
+    OPENAI_BASE_URL=http://localhost:8089/v1
+    OPENAI_API_KEY=stub
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+TEXTO_BASE = (
+    "Según los datos proporcionados, el estado general de bienestar es aceptable, aunque "
+    "existen oportunidades de mejora en los hábitos de sueño, la alimentación y la actividad "
+    "física. Se recomienda mantener una rutina constante y consultar con un profesional de "
+    "la salud para una evaluación completa."
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Atiende POST /v1/chat/completions con respuestas sintéticas"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._responder_json(404, {'error': {'message': 'Ruta no encontrada'}})
+            return
+
+        longitud = int(self.headers.get('Content-Length', 0))
+        peticion = json.loads(self.rfile.read(longitud) or b'{}')
+        config = self.server.stub_config
+
+        if random.random() < config['error_rate']:
+            self._responder_json(429, {'error': {'message': 'Rate limit simulado'}}, {'Retry-After': '1'})
+            return
+
+        palabras = self._generar_palabras(peticion)
+        tokens_prompt = sum(len(m.get('content', '').split()) for m in peticion.get('messages', []))
+        time.sleep(max(0, random.gauss(config['latency'], config['latency'] * 0.1)))
+
+        if peticion.get('stream'):
+            self._responder_stream(peticion, palabras)
+        else:
+            time.sleep(len(palabras) / config['tokens_per_second'])
+            self._responder_json(200, {
+                'id': f"chatcmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': peticion.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ' '.join(palabras)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': tokens_prompt,
+                    'completion_tokens': len(palabras),
+                    'total_tokens': tokens_prompt + len(palabras)
+                }
+            })
+
+    def _generar_palabras(self, peticion):
+        """Genera un texto sintético de longitud acorde a max_tokens"""
+        palabras = TEXTO_BASE.split()
+        objetivo = min(int(peticion.get('max_tokens') or 200), self.server.stub_config['max_words'])
+        resultado = (palabras * (objetivo // len(palabras) + 1))[:objetivo]
+        # En el modo de una sola llamada se incluye la marca que separa las secciones
+        prompt = ' '.join(m.get('content', '') for m in peticion.get('messages', []))
+        if '===RECOMENDACIONES===' in prompt:
+            mitad = len(resultado) // 2
+            resultado = resultado[:mitad] + ['\n===RECOMENDACIONES===\n'] + resultado[mitad:]
+        return resultado
+
+    def _responder_json(self, codigo, cuerpo, headers=None):
+        data = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for nombre, valor in (headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _responder_stream(self, peticion, palabras):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pausa = 1 / self.server.stub_config['tokens_per_second']
+        for i, palabra in enumerate(palabras):
+            self._enviar_evento({
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': peticion.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': palabra if i == 0 else f" {palabra}"},
+                    'finish_reason': None
+                }]
+            })
+            time.sleep(pausa)
+        self._enviar_evento({
+            'id': chunk_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': peticion.get('model', 'stub'),
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+        })
+        self._escribir_chunk(b"data: [DONE]\n\n")
+        self._escribir_chunk(b"")
+
+    def _enviar_evento(self, cuerpo):
+        self._escribir_chunk(f"data: {json.dumps(cuerpo)}\n\n".encode('utf-8'))
+
+    def _escribir_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+def crear_servidor(host='127.0.0.1', port=8089, latency=1.0, tokens_per_second=100.0,
+                   max_words=300, error_rate=0.0):
+    """
+    Crea el servidor simulado de OpenAI.
+
+    Args:
+        host (str): Interfaz de escucha
+        port (int): Puerto de escucha (0 para uno libre)
+        latency (float): Segundos de latencia antes del primer token
+        tokens_per_second (float): Velocidad de generación simulada
+        max_words (int): Máximo de palabras por respuesta
+        error_rate (float): Proporción de peticiones que responden 429
+
+    Returns:
+        ThreadingHTTPServer: Servidor listo para serve_forever()
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.stub_config = {
+        'latency': latency,
+        'tokens_per_second': tokens_per_second,
+        'max_words': max_words,
+        'error_rate': error_rate,
+    }
+    return server
+
+
+def iniciar_en_segundo_plano(**kwargs):
+    """
+    Inicia el servidor simulado en un hilo daemon.
+
+    Returns:
+        ThreadingHTTPServer: Servidor en ejecución; su URL base es
+            f"http://{host}:{server.server_port}/v1"
+    """
+    server = crear_servidor(**kwargs)
+    threading.Thread(target=server.serve_forever, name='llm-stub', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor simulado de la API de OpenAI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=1.0, help='Segundos antes del primer token')
+    parser.add_argument('--tokens-per-second', type=float, default=100.0)
+    parser.add_argument('--max-words', type=int, default=300)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proporción de respuestas 429')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = crear_servidor(args.host, args.port, args.latency, args.tokens_per_second,
+                            args.max_words, args.error_rate)
+    logger.info(f"Servidor simulado de OpenAI en http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
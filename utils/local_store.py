@@ -0,0 +1,307 @@
+import os
+import glob
+import json
+import time
+import logging
+import argparse
+import sqlite3
+import threading
+from datetime import datetime
+import pymysql
+from config import Config
+from utils.db_pool import get_pool
+from utils.record_cache import cache_registros
+from utils.write_buffer import completar_valores
+
+logger = logging.getLogger(__name__)
+
+
+class AlmacenLocal:
+    """
+    Almacén local de respaldo para registros que no se pudieron guardar en MySQL.
+    Los registros se añaden en orden (tabla de solo inserción con índice por ID);
+    la reproducción marca lo volcado (o lo que MySQL rechaza) y la compactación
+    elimina lo volcado.
+    """
+
+    def __init__(self, sql, db_path=None, al_volcar=None):
+        """
+        Inicializa el almacén.
+
+        Args:
+            sql (str): Sentencia INSERT ... VALUES (%s, ...) de una fila
+            db_path (str, optional): Ruta al archivo SQLite del almacén
+            al_volcar (callable, optional): Recibe los IDs ya insertados en MySQL
+        """
+        # Idempotente: una reproducción interrumpida se puede repetir sin duplicar filas
+        self.sql = f"{sql.strip()} ON DUPLICATE KEY UPDATE id = id"
+        self._columnas = sql.count('%s')
+        self.db_path = db_path or Config.LOCAL_STORE_PATH
+        self.al_volcar = al_volcar
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS registros (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                valores TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                created REAL NOT NULL,
+                replayed REAL,
+                rejected REAL,
+                last_error TEXT
+            )
+        """)
+        columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(registros)")}
+        for columna, tipo in (('rejected', 'REAL'), ('last_error', 'TEXT')):
+            # Almacenes creados antes de apartar los registros rechazados
+            if columna not in columnas:
+                conn.execute(f"ALTER TABLE registros ADD COLUMN {columna} {tipo}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_pendientes ON registros(replayed, seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+
+    def _conn(self):
+        """Obtiene la conexión SQLite del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def guardar(self, registro_id, valores, datos):
+        """
+        Añade un registro al almacén (si ya existía, se reemplaza y vuelve a quedar pendiente,
+        aunque MySQL lo hubiera rechazado).
+
+        Args:
+            registro_id (str): ID del registro
+            valores (tuple): Valores para la sentencia INSERT de MySQL
+            datos (dict): Registro completo para servir lecturas
+        """
+        self._conn().execute(
+            "INSERT OR REPLACE INTO registros (id, valores, datos, created) VALUES (?, ?, ?, ?)",
+            (registro_id, json.dumps(list(valores), ensure_ascii=False, default=str),
+             json.dumps(datos, ensure_ascii=False, default=str), time.time())
+        )
+
+    def buscar(self, registro_id):
+        """
+        Busca un registro por su ID (consulta por índice).
+
+        Args:
+            registro_id (str): ID del registro
+
+        Returns:
+            dict: Registro o None si no existe
+        """
+        row = self._conn().execute("SELECT datos FROM registros WHERE id = ?", (registro_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def reproducir(self, tamano_lote=None, limite=None):
+        """
+        Vuelca a MySQL los registros pendientes, en orden y por lotes. Cada lote
+        se marca como volcado al confirmarse, por lo que una reproducción
+        interrumpida continúa donde se quedó. Si MySQL rechaza un lote por sus
+        datos, se reintenta fila a fila y las filas rechazadas quedan apartadas
+        (con su error) para que la reproducción siga con las demás.
+
+        Args:
+            tamano_lote (int, optional): Filas por inserción
+            limite (int, optional): Máximo de registros a volcar en esta ejecución
+
+        Returns:
+            int: Registros volcados
+
+        Raises:
+            pymysql.err.OperationalError: Si MySQL no está disponible
+        """
+        tamano_lote = tamano_lote or Config.LOCAL_STORE_REPLAY_BATCH
+        conn = self._conn()
+        volcados = 0
+        while limite is None or volcados < limite:
+            n = tamano_lote if limite is None else min(tamano_lote, limite - volcados)
+            rows = conn.execute(
+                "SELECT seq, id, valores, created FROM registros WHERE replayed IS NULL AND rejected IS NULL "
+                "ORDER BY seq LIMIT ?", (n,)
+            ).fetchall()
+            if not rows:
+                break
+
+            inicio = time.monotonic()
+            insertados = rows
+            try:
+                self._insertar(rows)
+            except pymysql.err.OperationalError:
+                raise
+            except Exception as e:
+                # Error de datos: aislar las filas problemáticas insertándolas una a una
+                logger.error(f"Error al reproducir lote de {len(rows)} registros, se reintenta fila a fila: {str(e)}")
+                insertados = []
+                for row in rows:
+                    try:
+                        self._insertar([row])
+                        insertados.append(row)
+                    except pymysql.err.OperationalError:
+                        self._marcar_volcados(insertados)
+                        raise
+                    except Exception as e_fila:
+                        self._apartar(row, str(e_fila))
+            self._marcar_volcados(insertados)
+
+            volcados += len(insertados)
+            logger.info(f"Reproducidos {len(insertados)} registros en MySQL en {time.monotonic() - inicio:.3f} segundos")
+        return volcados
+
+    def _insertar(self, rows):
+        """Inserta las filas con una sola sentencia de varias filas y un solo commit"""
+        with get_pool().conexion() as mysql, mysql.cursor() as cursor:
+            cursor.executemany(self.sql, [completar_valores(tuple(json.loads(valores)), self._columnas, creado)
+                                          for _, _, valores, creado in rows])
+            mysql.commit()
+
+    def _marcar_volcados(self, rows):
+        """Marca como volcados los registros ya insertados en MySQL"""
+        if not rows:
+            return
+        self._conn().executemany("UPDATE registros SET replayed = ? WHERE seq = ?", [(time.time(), seq) for seq, *_ in rows])
+        if self.al_volcar is not None:
+            try:
+                self.al_volcar([registro_id for _, registro_id, *_ in rows])
+            except Exception as e:
+                logger.warning(f"Error al notificar {len(rows)} registros reproducidos: {str(e)}")
+
+    def _apartar(self, row, error):
+        """Aparta un registro que MySQL rechaza; se conserva en el almacén para revisarlo"""
+        seq, registro_id, *_ = row
+        self._conn().execute("UPDATE registros SET rejected = ?, last_error = ? WHERE seq = ?", (time.time(), error, seq))
+        logger.error(f"Diagnóstico {registro_id} rechazado por MySQL, queda apartado en el almacén local: {error}")
+
+    def compactar(self):
+        """
+        Elimina los registros ya volcados y recupera el espacio del archivo.
+
+        Returns:
+            int: Registros eliminados
+        """
+        conn = self._conn()
+        eliminados = conn.execute("DELETE FROM registros WHERE replayed IS NOT NULL").rowcount
+        conn.execute("VACUUM")
+        logger.info(f"Almacén local compactado: {eliminados} registros eliminados")
+        return eliminados
+
+    def migrar_json(self, data_dir, construir_valores):
+        """
+        Importa los archivos diagnostico_<id>.json del respaldo anterior (una sola vez).
+
+        Args:
+            data_dir (str): Directorio de los archivos JSON
+            construir_valores (callable): Recibe (registro_id, datos) y devuelve los valores del INSERT
+
+        Returns:
+            int: Registros importados
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE clave = 'json_migrado'").fetchone():
+            return 0
+
+        importados = 0
+        for ruta in sorted(glob.glob(os.path.join(data_dir, 'diagnostico_*.json'))):
+            registro_id = os.path.basename(ruta)[len('diagnostico_'):-len('.json')]
+            try:
+                creado = os.path.getmtime(ruta)
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    # Los archivos antiguos no guardaban la fecha de creación: usar la de modificación
+                    datos = {'fecha_creacion': datetime.fromtimestamp(int(creado)).strftime('%Y-%m-%d %H:%M:%S'),
+                             **json.load(f), 'id': registro_id}
+                conn.execute(
+                    "INSERT OR IGNORE INTO registros (id, valores, datos, created) VALUES (?, ?, ?, ?)",
+                    (registro_id, json.dumps(list(construir_valores(registro_id, datos)), ensure_ascii=False, default=str),
+                     json.dumps(datos, ensure_ascii=False, default=str), creado)
+                )
+                importados += 1
+            except Exception as e:
+                logger.error(f"No se pudo importar {ruta}: {str(e)}")
+
+        conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('json_migrado', ?)", (str(time.time()),))
+        if importados:
+            logger.info(f"Importados {importados} diagnósticos de archivos JSON al almacén local")
+        return importados
+
+    def stats(self):
+        """
+        Obtiene las métricas del almacén.
+
+        Returns:
+            dict: Registros pendientes de volcar, ya volcados y rechazados por MySQL
+        """
+        pendientes, volcados, rechazados = self._conn().execute(
+            "SELECT COUNT(*) - COUNT(replayed) - COUNT(rejected), COUNT(replayed), COUNT(rejected) FROM registros"
+        ).fetchone()
+        return {'pending': pendientes, 'replayed': volcados, 'rejected': rechazados}
+
+
+_almacen = None
+_almacen_pid = None
+_almacen_lock = threading.Lock()
+
+
+def almacen_local_existente():
+    """
+    Obtiene el almacén local del proceso solo si ya se creó (p. ej. para estadísticas).
+
+    Returns:
+        AlmacenLocal: Almacén local o None
+    """
+    return _almacen if _almacen_pid == os.getpid() else None
+
+
+def get_almacen_local():
+    """
+    Obtiene el almacén local de diagnósticos del proceso. Al crearlo se importan
+    los archivos JSON que dejó el respaldo anterior.
+
+    Returns:
+        AlmacenLocal: Almacén local
+    """
+    global _almacen, _almacen_pid
+    if _almacen is None or _almacen_pid != os.getpid():
+        with _almacen_lock:
+            if _almacen is None or _almacen_pid != os.getpid():
+                # Importación diferida: models.diagnostico importa este módulo
+                from models.diagnostico import SQL_INSERTAR, Diagnostico
+                # Tras la reproducción la fila de MySQL sustituye a la copia en caché
+                _almacen = AlmacenLocal(SQL_INSERTAR, al_volcar=cache_registros.invalidar_varios)
+                _almacen.migrar_json(
+                    os.path.dirname(_almacen.db_path),
+                    lambda registro_id, datos: Diagnostico.desde_registro(datos)._valores_db(registro_id)
+                )
+                _almacen_pid = os.getpid()
+    return _almacen
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gestiona el almacén local de diagnósticos')
+    parser.add_argument('accion', choices=['replay', 'compact', 'stats'],
+                        help='replay: volcar a MySQL; compact: eliminar lo ya volcado; stats: mostrar métricas')
+    parser.add_argument('--tamano-lote', type=int, default=None, help='Filas por inserción')
+    parser.add_argument('--limite', type=int, default=None, help='Máximo de registros a volcar')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    almacen = get_almacen_local()
+    codigo = 0
+    if args.accion == 'replay':
+        try:
+            total = almacen.reproducir(args.tamano_lote, args.limite)
+            print(f"Registros volcados a MySQL: {total}")
+        except Exception as e:
+            # Lo ya confirmado queda marcado; la siguiente ejecución continúa desde ahí
+            print(f"Reproducción interrumpida: {str(e)}")
+            codigo = 1
+    elif args.accion == 'compact':
+        print(f"Registros eliminados: {almacen.compactar()}")
+    print(json.dumps(almacen.stats(), indent=2))
+    raise SystemExit(codigo)
@@ -0,0 +1,665 @@
+"""
+Métricas en el formato de texto de Prometheus, sin dependencias externas.
+
+Cada proceso acumula sus métricas en memoria y las vuelca periódicamente a un
+archivo SQLite compartido (METRICS_DB_PATH); /metrics suma los contadores e
+histogramas de todos los procesos del equipo, de modo que la respuesta no
+depende del worker de gunicorn que atienda la consulta. Las estadísticas
+instantáneas de los recolectores se exponen por worker (etiqueta worker).
+"""
+import os
+import json
+import math
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from multiprocessing import util as mp_util
+from config import Config
+from utils.job_queue import LimitadorEtapas
+
+logger = logging.getLogger(__name__)
+
+# Límites (en segundos) de los histogramas de duración: de milisegundos a minutos
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    """Escapa el valor de una etiqueta según el formato de exposición"""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres, valores, extra=None):
+    """Construye el bloque {a="1",b="2"} de una muestra"""
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _formatear_valor(valor):
+    """Representa un número como lo espera Prometheus"""
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _combinar(a, b):
+    """Suma dos valores de una métrica: números (contadores) o histogramas con los mismos buckets"""
+    if isinstance(a, dict):
+        if len(a['buckets']) != len(b['buckets']):
+            return a
+        return {
+            'buckets': [x + y for x, y in zip(a['buckets'], b['buckets'])],
+            'sum': a['sum'] + b['sum'],
+            'count': a['count'] + b['count'],
+        }
+    return a + b
+
+
+def _proceso_vivo(pid):
+    """Comprueba si existe un proceso con el PID indicado"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Metrica:
+    """Base de las métricas con etiquetas"""
+
+    tipo = 'untyped'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+        # Lo asigna el registro: se llama antes de cada cambio (arranque del volcado por proceso)
+        self.al_cambiar = None
+
+    def _antes_de_cambiar(self):
+        if self.al_cambiar is not None:
+            self.al_cambiar()
+
+    def instantanea(self):
+        """
+        Copia los valores actuales.
+
+        Returns:
+            dict: Valor por tupla de etiquetas
+        """
+        with self._lock:
+            return {clave: json.loads(json.dumps(valor)) for clave, valor in self._valores.items()}
+
+    def reiniciar(self):
+        """Descarta los valores (p. ej. los heredados del proceso padre tras un fork)"""
+        with self._lock:
+            self._valores.clear()
+
+    def _clave(self, etiquetas):
+        """Ordena los valores de las etiquetas según su declaración"""
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"La métrica {self.nombre} requiere las etiquetas {self.etiquetas}")
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def exponer(self, valores=None):
+        """
+        Genera las líneas de la métrica en el formato de exposición.
+
+        Args:
+            valores (dict, optional): Valores agregados de todos los procesos;
+                por defecto los del proceso actual
+
+        Returns:
+            list: Líneas de texto
+        """
+        valores = self.instantanea() if valores is None else valores
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for clave, valor in sorted(valores.items()):
+            lineas.extend(self._muestras(clave, valor))
+        return lineas
+
+    def _muestras(self, clave, valor):
+        return [f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_valor(valor)}"]
+
+
+class Contador(_Metrica):
+    """Valor acumulado que solo crece"""
+
+    tipo = 'counter'
+
+    def inc(self, valor=1, **etiquetas):
+        """
+        Incrementa el contador.
+
+        Args:
+            valor (float): Cantidad a sumar (no negativa)
+            **etiquetas: Valor de cada etiqueta declarada
+        """
+        if valor < 0:
+            raise ValueError("Un contador no puede decrecer")
+        clave = self._clave(etiquetas)
+        self._antes_de_cambiar()
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+
+class Histograma(_Metrica):
+    """Distribución de observaciones en buckets acumulados, con suma y conteo"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valor, **etiquetas):
+        """
+        Registra una observación.
+
+        Args:
+            valor (float): Valor observado (p. ej. segundos)
+            **etiquetas: Valor de cada etiqueta declarada
+        """
+        clave = self._clave(etiquetas)
+        self._antes_de_cambiar()
+        with self._lock:
+            datos = self._valores.get(clave)
+            if datos is None:
+                datos = self._valores[clave] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    datos['buckets'][i] += 1
+            datos['sum'] += valor
+            datos['count'] += 1
+
+    def _muestras(self, clave, datos):
+        lineas = []
+        for limite, total in zip(self.buckets, datos['buckets']):
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave, f'le="{_formatear_valor(limite)}"')
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {total}")
+        etiquetas = _formatear_etiquetas(self.etiquetas, clave, 'le="+Inf"')
+        lineas.append(f"{self.nombre}_bucket{etiquetas} {datos['count']}")
+        etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+        lineas.append(f"{self.nombre}_sum{etiquetas} {_formatear_valor(datos['sum'])}")
+        lineas.append(f"{self.nombre}_count{etiquetas} {datos['count']}")
+        return lineas
+
+
+class AlmacenMetricas:
+    """
+    Archivo SQLite donde cada proceso guarda la última copia de sus métricas.
+    Los contadores e histogramas de los procesos que terminaron se suman en una
+    fila acumulada, para que los totales no retrocedan al reiniciarse un worker.
+    """
+
+    # Propietario de los valores acumulados de procesos terminados
+    ACUMULADO = '*'
+
+    def __init__(self, db_path, intervalo):
+        """
+        Inicializa el almacén.
+
+        Args:
+            db_path (str): Ruta al archivo SQLite
+            intervalo (float): Segundos entre volcados de cada proceso
+        """
+        self.db_path = db_path
+        self.intervalo = intervalo
+        # Un proceso sin volcar durante este tiempo se considera detenido
+        self.vencimiento = max(60.0, self.intervalo * 6)
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS muestras (
+                    owner TEXT NOT NULL,
+                    nombre TEXT NOT NULL,
+                    clave TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    ayuda TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    PRIMARY KEY (owner, nombre, clave)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS procesos (
+                    owner TEXT PRIMARY KEY,
+                    host TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """Abre una conexión a la base de datos SQLite de métricas"""
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def volcar(self, owner, filas, instantaneas):
+        """
+        Guarda la copia de las métricas de un proceso.
+
+        Args:
+            owner (str): Identificador del proceso (equipo:pid:token)
+            filas (list): Tuplas (nombre, clave, tipo, ayuda, valor) de contadores e histogramas
+            instantaneas (list): Tuplas con el mismo formato de los recolectores (se reemplazan)
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM muestras WHERE owner = ? AND tipo = 'gauge'", (owner,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO muestras (owner, nombre, clave, tipo, ayuda, valor) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(owner, nombre, clave, tipo, ayuda, json.dumps(valor))
+                     for nombre, clave, tipo, ayuda, valor in [*filas, *instantaneas]]
+                )
+                host, pid, _ = owner.rsplit(':', 2)
+                conn.execute(
+                    "INSERT OR REPLACE INTO procesos (owner, host, pid, updated) VALUES (?, ?, ?, ?)",
+                    (owner, host, int(pid), time.time())
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def leer(self):
+        """
+        Lee las métricas de todos los procesos.
+
+        Returns:
+            tuple: (filas (owner, nombre, clave, tipo, ayuda, valor), procesos activos {owner: pid})
+        """
+        conn = self._connect()
+        try:
+            activos = dict(conn.execute(
+                "SELECT owner, pid FROM procesos WHERE updated >= ?", (time.time() - self.vencimiento,)
+            ).fetchall())
+            filas = conn.execute("SELECT owner, nombre, clave, tipo, ayuda, valor FROM muestras").fetchall()
+            return [(o, n, c, t, a, json.loads(v)) for o, n, c, t, a, v in filas], activos
+        finally:
+            conn.close()
+
+    def compactar(self):
+        """
+        Suma en la fila acumulada los valores de los procesos de este equipo que
+        ya no existen y elimina sus filas.
+
+        Returns:
+            int: Procesos compactados
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                terminados = [
+                    owner for owner, pid in conn.execute(
+                        "SELECT owner, pid FROM procesos WHERE host = ? AND updated < ?",
+                        (socket.gethostname(), time.time() - self.vencimiento)
+                    ).fetchall()
+                    if not _proceso_vivo(pid)
+                ]
+                for owner in terminados:
+                    for nombre, clave, tipo, ayuda, valor in conn.execute(
+                        "SELECT nombre, clave, tipo, ayuda, valor FROM muestras WHERE owner = ? AND tipo != 'gauge'",
+                        (owner,)
+                    ).fetchall():
+                        previo = conn.execute(
+                            "SELECT valor FROM muestras WHERE owner = ? AND nombre = ? AND clave = ?",
+                            (self.ACUMULADO, nombre, clave)
+                        ).fetchone()
+                        total = json.loads(valor) if previo is None else _combinar(json.loads(previo[0]), json.loads(valor))
+                        conn.execute(
+                            "INSERT OR REPLACE INTO muestras (owner, nombre, clave, tipo, ayuda, valor) VALUES (?, ?, ?, ?, ?, ?)",
+                            (self.ACUMULADO, nombre, clave, tipo, ayuda, json.dumps(total))
+                        )
+                    conn.execute("DELETE FROM muestras WHERE owner = ?", (owner,))
+                    conn.execute("DELETE FROM procesos WHERE owner = ?", (owner,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if terminados:
+                logger.info(f"Métricas de {len(terminados)} procesos terminados sumadas al acumulado")
+            return len(terminados)
+        finally:
+            conn.close()
+
+
+class RegistroMetricas:
+    """
+    Registro de las métricas. Además de contadores e histogramas admite
+    recolectores: funciones que devuelven valores instantáneos (profundidad de
+    colas, conexiones del pool, cachés).
+
+    Con un almacén compartido, un hilo de cada proceso vuelca sus métricas (y
+    evalúa los recolectores) cada intervalo, y exponer() agrega las de todos los
+    procesos. Sin almacén cada proceso expone solo sus propias métricas.
+    """
+
+    def __init__(self, prefijo='vitalscan', almacen=None):
+        """
+        Inicializa el registro.
+
+        Args:
+            prefijo (str): Prefijo de los nombres de las métricas
+            almacen (AlmacenMetricas, optional): Almacén compartido entre procesos
+        """
+        self.prefijo = prefijo
+        self.almacen = almacen
+        self._metricas = {}
+        self._recolectores = []
+        self._lock = threading.Lock()
+        self._volcado_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._owner = None
+        self._hilo = None
+
+    def _propietario(self):
+        """Identificador del proceso en el almacén (cambia tras un fork)"""
+        if self._owner is None:
+            self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        return self._owner
+
+    def _asegurar_proceso(self):
+        """
+        Tras un fork descarta los valores heredados del proceso padre (ya los vuelca
+        él) y arranca el hilo de volcado del proceso actual.
+        """
+        if self.almacen is None or (self._hilo is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._hilo is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                for metrica in self._metricas.values():
+                    metrica.reiniciar()
+                self._pid = os.getpid()
+                self._owner = None
+            self._hilo = threading.Thread(target=self._bucle_volcado, name='metrics-flush', daemon=True)
+            self._hilo.start()
+            # Finalize de multiprocessing también se ejecuta al salir los workers del pool de PDF
+            mp_util.Finalize(None, self._volcar_al_salir, exitpriority=10)
+
+    def _bucle_volcado(self):
+        """Vuelca las métricas del proceso cada intervalo"""
+        ciclos = 0
+        while True:
+            time.sleep(self.almacen.intervalo)
+            try:
+                self.volcar()
+                ciclos += 1
+                if ciclos % 12 == 0:
+                    self.almacen.compactar()
+            except Exception as e:
+                logger.warning(f"No se pudieron volcar las métricas: {str(e)}")
+
+    def _volcar_al_salir(self):
+        """Último volcado del proceso; al salir el almacén puede no estar disponible"""
+        try:
+            # Sin recolectores: los valores instantáneos de un proceso que termina no se exponen
+            self.volcar(recolectar=False)
+        except Exception as e:
+            logger.debug(f"No se pudieron volcar las métricas al salir: {str(e)}")
+
+    def volcar(self, recolectar=True):
+        """
+        Guarda en el almacén compartido la copia actual de las métricas del proceso.
+
+        Args:
+            recolectar (bool): Si es True también se evalúan y guardan los recolectores
+        """
+        if self.almacen is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            metricas = list(self._metricas.values())
+        filas = [
+            (metrica.nombre, json.dumps(list(clave)), metrica.tipo, metrica.ayuda, valor)
+            for metrica in metricas
+            for clave, valor in metrica.instantanea().items()
+        ]
+        instantaneas = [
+            (nombre, json.dumps(sorted(etiquetas.items())), tipo, ayuda, valor)
+            for nombre, tipo, ayuda, muestras in (self._recolectar() if recolectar else [])
+            for etiquetas, valor in muestras
+        ]
+        with self._volcado_lock:
+            self.almacen.volcar(self._propietario(), filas, instantaneas)
+
+    def _registrar(self, clase, nombre, *args, **kwargs):
+        nombre = f"{self.prefijo}_{nombre}"
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, *args, **kwargs)
+                metrica.al_cambiar = self._asegurar_proceso
+            elif not isinstance(metrica, clase):
+                raise ValueError(f"La métrica {nombre} ya está registrada con otro tipo")
+            return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        """
+        Obtiene (o registra) un contador.
+
+        Args:
+            nombre (str): Nombre sin prefijo; por convención termina en _total
+            ayuda (str): Descripción de la métrica
+            etiquetas (tuple): Nombres de las etiquetas
+
+        Returns:
+            Contador: Contador registrado
+        """
+        return self._registrar(Contador, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        """
+        Obtiene (o registra) un histograma.
+
+        Args:
+            nombre (str): Nombre sin prefijo
+            ayuda (str): Descripción de la métrica
+            etiquetas (tuple): Nombres de las etiquetas
+            buckets (tuple): Límites superiores de los buckets
+
+        Returns:
+            Histograma: Histograma registrado
+        """
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, buckets=buckets)
+
+    def recolector(self, funcion):
+        """
+        Registra una función que aporta métricas instantáneas en cada consulta.
+
+        Args:
+            funcion (callable): Devuelve una lista de tuplas
+                (nombre sin prefijo, tipo, ayuda, [(dict de etiquetas, valor), ...])
+        """
+        with self._lock:
+            self._recolectores.append(funcion)
+
+    def _recolectar(self):
+        """
+        Evalúa los recolectores.
+
+        Returns:
+            list: Tuplas (nombre con prefijo, tipo, ayuda, [(dict de etiquetas, valor), ...])
+        """
+        with self._lock:
+            recolectores = list(self._recolectores)
+        familias = {}
+        for funcion in recolectores:
+            try:
+                for nombre, tipo, ayuda, muestras in funcion():
+                    familia = familias.setdefault(f"{self.prefijo}_{nombre}", (tipo, ayuda, []))
+                    familia[2].extend(muestras)
+            except Exception as e:
+                logger.warning(f"Error en un recolector de métricas: {str(e)}")
+        return [(nombre, tipo, ayuda, muestras) for nombre, (tipo, ayuda, muestras) in familias.items()]
+
+    def _agregar(self):
+        """
+        Vuelca las métricas propias y suma las de todos los procesos del almacén.
+
+        Returns:
+            tuple: (valores por métrica {nombre: {clave: valor}}, familias de los recolectores)
+        """
+        self._asegurar_proceso()
+        self.volcar()
+        filas, activos = self.almacen.leer()
+        valores = {}
+        familias = {}
+        for owner, nombre, clave, tipo, ayuda, valor in filas:
+            if tipo == 'gauge':
+                # Los valores instantáneos solo de los procesos activos, uno por worker
+                if owner in activos:
+                    familia = familias.setdefault(nombre, (tipo, ayuda, []))
+                    familia[2].append(({**dict(json.loads(clave)), 'worker': activos[owner]}, valor))
+                continue
+            por_clave = valores.setdefault(nombre, {})
+            clave = tuple(json.loads(clave))
+            por_clave[clave] = valor if clave not in por_clave else _combinar(por_clave[clave], valor)
+        return valores, [(nombre, tipo, ayuda, muestras) for nombre, (tipo, ayuda, muestras) in familias.items()]
+
+    def exponer(self):
+        """
+        Genera el documento completo en el formato de exposición de Prometheus.
+
+        Returns:
+            str: Texto listo para servir en /metrics
+        """
+        with self._lock:
+            metricas = list(self._metricas.values())
+
+        if self.almacen is not None:
+            valores, familias = self._agregar()
+        else:
+            valores, familias = None, self._recolectar()
+
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exponer(None if valores is None else valores.get(metrica.nombre, {})))
+
+        for nombre, tipo, ayuda, muestras in familias:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                nombres = sorted(etiquetas)
+                bloque = _formatear_etiquetas(nombres, [etiquetas[n] for n in nombres])
+                lineas.append(f"{nombre}{bloque} {_formatear_valor(valor)}")
+        return '\n'.join(lineas) + '\n'
+
+
+# Registro compartido del proceso; con METRICS_DB_PATH agrega las métricas de todos los workers
+registro = RegistroMetricas(
+    almacen=AlmacenMetricas(Config.METRICS_DB_PATH, Config.METRICS_FLUSH_INTERVAL) if Config.METRICS_DB_PATH else None
+)
+
+duracion_etapas = registro.histograma(
+    'stage_duration_seconds', 'Duración de cada etapa del procesamiento', ('stage', 'outcome')
+)
+espera_etapas = registro.histograma(
+    'stage_wait_seconds', 'Tiempo de espera por el límite de concurrencia de cada etapa', ('stage',)
+)
+tokens_llm = registro.contador(
+    'llm_tokens_total', 'Tokens consumidos en las llamadas al LLM (estimados si la respuesta no los informa)',
+    ('call', 'kind', 'source')
+)
+
+
+@contextmanager
+def span(etapa, **contexto):
+    """
+    Mide la duración de una etapa y la registra en vitalscan_stage_duration_seconds.
+
+    Args:
+        etapa (str): Nombre de la etapa (form_parse, llm_call, db_write, ...)
+        **contexto: Datos adicionales que solo se incluyen en el log (p. ej. el ID del diagnóstico)
+    """
+    if not Config.METRICS_ENABLED:
+        yield
+        return
+    inicio = time.perf_counter()
+    resultado = 'error'
+    try:
+        yield
+        resultado = 'ok'
+    finally:
+        duracion = time.perf_counter() - inicio
+        duracion_etapas.observe(duracion, stage=etapa, outcome=resultado)
+        detalles = ''.join(f" {clave}={valor}" for clave, valor in contexto.items())
+        logger.debug(f"span etapa={etapa} resultado={resultado} duracion={duracion:.4f}s{detalles}")
+
+
+def registrar_tokens(llamada, prompt, completion, origen='api'):
+    """
+    Suma los tokens de una llamada al LLM.
+
+    Args:
+        llamada (str): Tipo de llamada (diagnostico, recomendaciones, completo)
+        prompt (int): Tokens de entrada
+        completion (int): Tokens generados
+        origen (str): 'api' si los informó la respuesta o 'estimado'
+    """
+    if not Config.METRICS_ENABLED:
+        return
+    tokens_llm.inc(prompt, call=llamada, kind='prompt', source=origen)
+    tokens_llm.inc(completion, call=llamada, kind='completion', source=origen)
+
+
+def _observar_etapa(nombre, espera, duracion):
+    """Observador de LimitadorEtapas: espera por concurrencia de cada etapa"""
+    if Config.METRICS_ENABLED:
+        espera_etapas.observe(espera, stage=nombre)
+
+
+def muestras_de_estadisticas(componente, stats):
+    """
+    Convierte el diccionario stats() de un componente en muestras numéricas.
+
+    Los valores anidados se aplanan uniendo las claves con '_' y se ignoran los
+    que no son numéricos.
+
+    Args:
+        componente (str): Nombre del componente (se usa como etiqueta)
+        stats (dict): Estadísticas del componente
+
+    Returns:
+        list: Tuplas (dict de etiquetas, valor)
+    """
+    muestras = []
+
+    def aplanar(prefijo, valor):
+        if isinstance(valor, dict):
+            for clave, interno in valor.items():
+                aplanar(f"{prefijo}_{clave}" if prefijo else str(clave), interno)
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool) and math.isfinite(valor):
+            muestras.append(({'component': componente, 'stat': prefijo}, valor))
+
+    aplanar('', stats or {})
+    return muestras
+
+
+# La espera de cada etapa limitada (LLM, BD, PDF, canales) se mide en todos los limitadores
+if _observar_etapa not in LimitadorEtapas.observadores:
+    LimitadorEtapas.observadores.append(_observar_etapa)
@@ -0,0 +1,187 @@
+"""
+Sustituto de MySQL sobre SQLite para pruebas y benchmarks sin servidor de base de datos.
+
+Implementa la parte de la interfaz de PyMySQL que usa la aplicación (cursores
+como diccionarios, execute/executemany, commit y ping) y traduce los marcadores
+%s y las cláusulas ON DUPLICATE KEY UPDATE. Se conecta al pool existente:
+
+    from utils.mysql_stub import instalar
+    instalar('/tmp/vitalscan.sqlite3', latency=0.002)
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import pymysql
+from config import Config
+from utils.db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA_SQL = os.path.join(Config.BASE_DIR, 'schema.sql')
+
+_DUPLICADO_IGNORAR = re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(\w+)\s*=\s*\1\s*;?\s*$', re.IGNORECASE)
+_DUPLICADO = re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+.*$', re.IGNORECASE | re.DOTALL)
+
+
+def traducir(sql):
+    """
+    Traduce una sentencia de MySQL al dialecto de SQLite.
+
+    Args:
+        sql (str): Sentencia con marcadores %s
+
+    Returns:
+        str: Sentencia equivalente para SQLite
+    """
+    sql = sql.strip()
+    if _DUPLICADO_IGNORAR.search(sql):
+        sql = re.sub(r'^INSERT\s+INTO', 'INSERT OR IGNORE INTO', _DUPLICADO_IGNORAR.sub('', sql), flags=re.IGNORECASE)
+    elif _DUPLICADO.search(sql):
+        sql = re.sub(r'^INSERT\s+INTO', 'INSERT OR REPLACE INTO', _DUPLICADO.sub('', sql), flags=re.IGNORECASE)
+    return sql.replace('%s', '?')
+
+
+def crear_esquema(db_path, esquema=ESQUEMA_SQL):
+    """
+    Crea las tablas de schema.sql en una base SQLite.
+
+    Args:
+        db_path (str): Ruta al archivo SQLite
+        esquema (str, optional): Ruta al script de MySQL con las tablas
+    """
+    with open(esquema, encoding='utf-8') as f:
+        script = re.sub(r'--[^\n]*', '', f.read())
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for sentencia in script.split(';'):
+            sentencia = sentencia.strip()
+            if not sentencia or re.match(r'^(CREATE\s+DATABASE|USE)\b', sentencia, re.IGNORECASE):
+                continue
+            sentencia = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', '', sentencia, flags=re.IGNORECASE)
+            sentencia = re.sub(r'^CREATE\s+INDEX\s+', 'CREATE INDEX IF NOT EXISTS ', sentencia, flags=re.IGNORECASE)
+            conn.execute(traducir(sentencia))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _error_mysql(error):
+    """Convierte un error de SQLite en la excepción equivalente de PyMySQL"""
+    if isinstance(error, sqlite3.IntegrityError):
+        return pymysql.err.IntegrityError(1062, str(error))
+    if isinstance(error, sqlite3.OperationalError):
+        return pymysql.err.OperationalError(2013, str(error))
+    return pymysql.err.DatabaseError(1105, str(error))
+
+
+class CursorSimulado:
+    """Cursor que devuelve las filas como diccionarios, como pymysql.cursors.DictCursor"""
+
+    def __init__(self, conexion):
+        self._conexion = conexion
+        self._cursor = conexion._conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, sql, params=None):
+        self._conexion._esperar_latencia()
+        try:
+            self._cursor.execute(traducir(sql), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _error_mysql(e) from e
+        return self._cursor.rowcount
+
+    def executemany(self, sql, seq_params):
+        self._conexion._esperar_latencia()
+        try:
+            self._cursor.executemany(traducir(sql), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise _error_mysql(e) from e
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        fila = self._cursor.fetchone()
+        return dict(fila) if fila is not None else None
+
+    def fetchall(self):
+        return [dict(fila) for fila in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSimulada:
+    """Conexión con la interfaz de pymysql.connections.Connection respaldada por SQLite"""
+
+    def __init__(self, db_path, latency=0.0):
+        """
+        Abre la conexión.
+
+        Args:
+            db_path (str): Ruta al archivo SQLite
+            latency (float): Segundos simulados de ida y vuelta por sentencia
+        """
+        self.latency = latency
+        # Autocommit como la conexión real; check_same_thread=False porque el pool la presta entre hilos
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._abierta = True
+
+    def _esperar_latencia(self):
+        if not self._abierta:
+            raise pymysql.err.InterfaceError(0, 'Conexión cerrada')
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def cursor(self):
+        return CursorSimulado(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        self._esperar_latencia()
+
+    def close(self):
+        if self._abierta:
+            self._abierta = False
+            self._conn.close()
+
+
+def instalar(db_path, latency=0.0):
+    """
+    Hace que el pool de conexiones del proceso use la base SQLite en lugar de MySQL.
+
+    Args:
+        db_path (str): Ruta al archivo SQLite (se crea con schema.sql si no existe)
+        latency (float): Segundos simulados de ida y vuelta por sentencia
+
+    Returns:
+        PoolConexiones: Pool del proceso ya redirigido
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    crear_esquema(db_path)
+    pool = get_pool()
+    pool.close()
+    pool.connect_fn = lambda: ConexionSimulada(db_path, latency)
+    logger.info(f"Pool de conexiones redirigido a SQLite ({db_path}, latencia {latency * 1000:.1f} ms)")
+    return pool
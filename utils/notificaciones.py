@@ -0,0 +1,224 @@
+import time
+import sqlite3
+import logging
+from config import Config
+from utils.report_generator import get_report_generator
+from utils.email_sender import EmailSender
+from utils.whatsapp_sender import WhatsappSender
+from utils.attachment_cache import requiere_enlace, enlace_descarga
+from utils.job_queue import ColaTrabajos, LimitadorEtapas, limitador_etapas
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+CANALES = ('email', 'whatsapp')
+
+
+class EntregaFallidaError(Exception):
+    """Se lanza cuando un canal no pudo entregar la notificación (se reintentará)"""
+
+
+def _pdf(payload):
+    """Obtiene el informe PDF del diagnóstico (renderizado una vez y compartido entre canales)"""
+    with limitador_etapas.etapa('pdf'):
+        return get_report_generator().generate_pdf(payload['datos'], payload['diagnostico_id'])
+
+
+def _adjunto(payload):
+    """
+    Decide cómo se entrega el informe: adjunto o, si supera el umbral, enlace firmado.
+
+    Returns:
+        tuple: (ruta del PDF a adjuntar o None, enlace de descarga o None)
+    """
+    pdf_path = _pdf(payload)
+    if requiere_enlace(pdf_path):
+        return None, enlace_descarga(payload['diagnostico_id'])
+    return pdf_path, None
+
+
+def _enviar_email(payload):
+    """Envía el diagnóstico por correo electrónico"""
+    datos = payload['datos']
+    pdf_path, enlace = _adjunto(payload)
+    with span('email_send', diagnostico_id=payload['diagnostico_id']):
+        enviado = EmailSender().send_email(
+            to_email=datos['email'],
+            subject="Tu diagnóstico de bienestar está listo",
+            nombre=datos.get('nombre', ''),
+            diagnostico_id=payload['diagnostico_id'],
+            pdf_path=pdf_path,
+            enlace_pdf=enlace
+        )
+        if not enviado:
+            raise EntregaFallidaError(f"No se pudo enviar el correo a {datos['email']}")
+
+
+def _enviar_whatsapp(payload):
+    """Envía el diagnóstico por WhatsApp"""
+    datos = payload['datos']
+    pdf_path, enlace = _adjunto(payload)
+    with span('whatsapp_send', diagnostico_id=payload['diagnostico_id']):
+        respuesta = WhatsappSender().send_message(
+            para=datos['telefono'],
+            datos=datos,
+            pdf_path=pdf_path,
+            enlace_pdf=enlace,
+            # Los reintentos de la bandeja reutilizan la clave: el servicio no duplica el mensaje
+            idempotency_key=f"{payload['diagnostico_id']}:whatsapp"
+        )
+        if not isinstance(respuesta, dict) or respuesta.get('status') == 'error':
+            raise EntregaFallidaError(f"No se pudo enviar el WhatsApp a {datos['telefono']}: {respuesta}")
+
+
+_ENVIOS = {
+    'email': _enviar_email,
+    'whatsapp': _enviar_whatsapp,
+}
+
+
+class BandejaSalida:
+    """
+    Bandeja de salida de notificaciones. Cada envío (diagnóstico y canal) es un
+    trabajo persistente con reintentos; el ID del trabajo evita envíos duplicados.
+    """
+
+    def __init__(self, db_path=None, limites=None):
+        """
+        Inicializa la bandeja de salida.
+
+        Args:
+            db_path (str, optional): Ruta al archivo SQLite de la bandeja
+            limites (dict, optional): Envíos simultáneos máximos por canal
+        """
+        self._limitador = LimitadorEtapas(limites if limites is not None else Config.OUTBOX_CHANNEL_LIMITS)
+        self._cola = ColaTrabajos(
+            self._entregar,
+            on_failure=self._fallo_definitivo,
+            db_path=db_path or Config.OUTBOX_DB_PATH,
+            workers=Config.OUTBOX_WORKERS,
+            max_retries=Config.OUTBOX_MAX_RETRIES,
+            backoff=Config.OUTBOX_RETRY_BACKOFF,
+            max_pending=Config.OUTBOX_MAX_PENDING,
+            retention=Config.OUTBOX_RETENTION_DAYS * 86400
+        )
+
+    def encolar(self, diagnostico_id, datos):
+        """
+        Registra las notificaciones de un diagnóstico según los datos de contacto.
+        Volver a encolar el mismo diagnóstico no duplica los envíos.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            datos (dict): Datos del diagnóstico (get_data())
+
+        Returns:
+            list: Canales encolados en esta llamada
+        """
+        encolados = []
+        for canal in CANALES:
+            destino = datos.get('email') if canal == 'email' else datos.get('telefono')
+            if not destino:
+                continue
+            try:
+                self._cola.submit(
+                    _id_envio(diagnostico_id, canal),
+                    {'canal': canal, 'diagnostico_id': diagnostico_id, 'datos': datos}
+                )
+                encolados.append(canal)
+            except sqlite3.IntegrityError:
+                logger.info(f"Notificación por {canal} de {diagnostico_id} ya registrada, se omite")
+        return encolados
+
+    def estado(self, diagnostico_id):
+        """
+        Obtiene el estado de entrega de las notificaciones de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+
+        Returns:
+            dict: Estado por canal (solo los canales registrados)
+        """
+        trabajos = self._cola.consultar([_id_envio(diagnostico_id, canal) for canal in CANALES])
+        return {
+            canal: trabajos[_id_envio(diagnostico_id, canal)]
+            for canal in CANALES
+            if _id_envio(diagnostico_id, canal) in trabajos
+        }
+
+    def start(self):
+        """Inicia los workers de envío"""
+        self._cola.start()
+
+    def stop(self, wait=True):
+        """Detiene los workers de envío"""
+        self._cola.stop(wait)
+
+    def esperar(self, timeout):
+        """
+        Espera a que no queden envíos pendientes ni en curso.
+
+        Args:
+            timeout (float): Segundos máximos de espera
+
+        Returns:
+            bool: True si la bandeja quedó vacía dentro del tiempo indicado
+        """
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            estados = self.stats()
+            if not estados.get('pending') and not estados.get('running'):
+                return True
+            time.sleep(Config.JOB_POLL_INTERVAL)
+        return False
+
+    def stats(self):
+        """
+        Obtiene el número de envíos por estado.
+
+        Returns:
+            dict: Conteo de envíos por estado
+        """
+        return self._cola.stats()
+
+    def _entregar(self, payload, job_id):
+        """Entrega una notificación respetando el límite de envíos simultáneos de su canal"""
+        canal = payload['canal']
+        with self._limitador.etapa(canal), limitador_etapas.etapa('notify'):
+            _ENVIOS[canal](payload)
+        logger.info(f"Notificación entregada: {job_id}")
+
+    @staticmethod
+    def _fallo_definitivo(payload, job_id, error):
+        logger.error(f"Notificación {job_id} descartada tras agotar los reintentos: {str(error)}")
+
+
+def _id_envio(diagnostico_id, canal):
+    """ID del trabajo de envío: uno por diagnóstico y canal"""
+    return f"{diagnostico_id}:{canal}"
+
+
+# Bandeja compartida del proceso; la aplicación web inicia sus workers
+bandeja_salida = BandejaSalida()
+
+
+def entregar_diagnostico(diagnostico, diagnostico_id):
+    """
+    Registra las notificaciones del diagnóstico en la bandeja de salida. El
+    envío ocurre en segundo plano, fuera del tiempo de respuesta del usuario.
+
+    Args:
+        diagnostico (Diagnostico): Diagnóstico ya generado y guardado
+        diagnostico_id (str): ID del diagnóstico
+
+    Returns:
+        str: Ruta al informe PDF si se generó por adelantado, o None
+    """
+    pdf_path = None
+    if not Config.PDF_LAZY:
+        with limitador_etapas.etapa('pdf'):
+            pdf_path = get_report_generator().generate_pdf(diagnostico.get_data(), diagnostico_id)
+
+    bandeja_salida.encolar(diagnostico_id, {**diagnostico.get_data(), 'id': diagnostico_id})
+    return pdf_path
@@ -0,0 +1,202 @@
+import os
+import sys
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Veces que se reenvía un informe interrumpido por el reinicio del pool
+_REENVIOS = 1
+
+
+class PoolSaturadoError(Exception):
+    """Se lanza cuando el pool de renderizado no acepta más trabajos"""
+
+
+def _renderizar_en_worker(diagnostico_data, pdf_path):
+    """
+    Renderiza un informe dentro de un proceso del pool.
+
+    Args:
+        diagnostico_data (dict): Datos del diagnóstico
+        pdf_path (str): Ruta de salida para el PDF
+
+    Returns:
+        str: Ruta al archivo PDF generado o None si falló
+    """
+    from utils.report_generator import get_report_generator
+    return get_report_generator().render_to_path(diagnostico_data, pdf_path)
+
+
+def _inicializar_worker():
+    """Precalienta el worker: importa ReportLab y construye los estilos antes del primer informe"""
+    from utils.report_generator import get_report_generator
+    get_report_generator()
+
+
+class PoolRenderizado:
+    """Pool de procesos para generar PDFs fuera del GIL del worker web"""
+
+    def __init__(self, workers=None, timeout=None, max_pending=None):
+        """
+        Inicializa el pool de renderizado.
+
+        Args:
+            workers (int, optional): Número de procesos de renderizado
+            timeout (float, optional): Segundos máximos por informe
+            max_pending (int, optional): Informes admitidos a la vez (en curso y en cola)
+                antes de aplicar contrapresión
+        """
+        self.workers = workers or Config.PDF_POOL_WORKERS
+        self.timeout = timeout or Config.PDF_RENDER_TIMEOUT
+        self.max_pending = max_pending or Config.PDF_POOL_MAX_PENDING or self.workers * 2
+
+        self._cupos = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._metricas = {'rendered': 0, 'failed': 0, 'timeouts': 0, 'crashes': 0, 'rejected': 0, 'restarts': 0, 'resubmitted': 0}
+
+    def _get_executor(self):
+        """Obtiene el executor, creándolo si no existe o si se reinició"""
+        with self._lock:
+            if self._executor is None:
+                # 'forkserver' evita heredar hilos y locks del proceso web
+                metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                opciones = {}
+                if sys.version_info >= (3, 11) and Config.PDF_WORKER_MAX_TASKS > 0:
+                    # Reciclar los workers tras N informes para acotar la memoria
+                    opciones['max_tasks_per_child'] = Config.PDF_WORKER_MAX_TASKS
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(metodo),
+                    initializer=_inicializar_worker,
+                    **opciones
+                )
+            return self._executor
+
+    def _reiniciar(self, executor):
+        """
+        Descarta un executor dañado o con procesos colgados.
+
+        Returns:
+            bool: False si otro hilo ya lo había reiniciado
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return False
+            self._executor = None
+            self._metricas['restarts'] += 1
+        # Terminar los procesos colgados (p. ej. wkhtmltopdf bloqueado) antes de cerrar el executor
+        for proceso in list(getattr(executor, '_processes', {}).values()):
+            try:
+                proceso.terminate()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def renderizar(self, diagnostico_data, pdf_path):
+        """
+        Envía un informe al pool y espera el resultado. ProcessPoolExecutor no
+        permite terminar un solo proceso, así que un informe colgado reinicia
+        todo el pool; los informes que estaban en curso o en cola se reenvían
+        al pool nuevo en lugar de darse por fallidos.
+
+        Args:
+            diagnostico_data (dict): Datos del diagnóstico (serializables con pickle)
+            pdf_path (str): Ruta de salida para el PDF
+
+        Returns:
+            str: Ruta al archivo PDF generado o None si falló
+
+        Raises:
+            PoolSaturadoError: Si el pool está saturado durante más de PDF_POOL_QUEUE_TIMEOUT
+        """
+        if not self._cupos.acquire(timeout=Config.PDF_POOL_QUEUE_TIMEOUT):
+            with self._lock:
+                self._metricas['rejected'] += 1
+            raise PoolSaturadoError(f"El pool de renderizado tiene {self.max_pending} informes pendientes")
+
+        try:
+            for intento in range(_REENVIOS + 1):
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(_renderizar_en_worker, diagnostico_data, pdf_path)
+                    resultado = future.result(timeout=self.timeout)
+                except FuturesTimeoutError:
+                    logger.error(f"El renderizado de {pdf_path} superó {self.timeout} segundos, se reinicia el pool")
+                    self._contar('timeouts')
+                    self._reiniciar(executor)
+                    return None
+                except (BrokenProcessPool, CancelledError, RuntimeError) as e:
+                    # RuntimeError: el executor ya estaba cerrado al enviar el informe
+                    if self._reiniciar(executor) and isinstance(e, BrokenProcessPool):
+                        logger.error(f"Un proceso de renderizado terminó inesperadamente con {pdf_path}, se reinicia el pool")
+                        self._contar('crashes')
+                    if intento < _REENVIOS:
+                        logger.warning(f"El renderizado de {pdf_path} se interrumpió por el reinicio del pool, se reenvía")
+                        self._contar('resubmitted')
+                        continue
+                    return None
+
+                self._contar('rendered' if resultado else 'failed')
+                return resultado
+        finally:
+            self._cupos.release()
+
+    def _contar(self, metrica):
+        with self._lock:
+            self._metricas[metrica] += 1
+
+    def stats(self):
+        """
+        Obtiene las métricas del pool.
+
+        Returns:
+            dict: Procesos configurados y contadores de informes
+        """
+        with self._lock:
+            return {'workers': self.workers, 'max_pending': self.max_pending, **self._metricas}
+
+    def shutdown(self):
+        """Cierra el pool y sus procesos"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def pdf_pool_existente():
+    """
+    Obtiene el pool de renderizado del proceso solo si ya se creó (p. ej. para estadísticas).
+
+    Returns:
+        PoolRenderizado: Pool de renderizado o None
+    """
+    return _pool if _pool_pid == os.getpid() else None
+
+
+def get_pdf_pool():
+    """
+    Obtiene el pool de renderizado del proceso, creándolo si es necesario.
+
+    Returns:
+        PoolRenderizado: Pool de renderizado
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = PoolRenderizado()
+                _pool_pid = os.getpid()
+                logger.info(f"Pool de renderizado PDF creado con {_pool.workers} procesos")
+    return _pool
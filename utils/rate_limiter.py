@@ -0,0 +1,242 @@
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+import openai
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ReintentosAgotadosError(Exception):
+    """Se lanza cuando una llamada al LLM sigue fallando tras todos los reintentos"""
+
+
+class _Cubeta:
+    """Cubeta de tokens que se rellena de forma continua a una tasa por minuto"""
+
+    def __init__(self, por_minuto):
+        self.capacidad = float(por_minuto)
+        self.disponibles = float(por_minuto)
+        self.ultimo_relleno = time.monotonic()
+
+    def espera(self, cantidad, factor):
+        """
+        Consume la cantidad si hay saldo o calcula cuánto hay que esperar (requiere el lock).
+
+        Args:
+            cantidad (float): Unidades a consumir
+            factor (float): Fracción de la tasa nominal vigente
+
+        Returns:
+            float: 0 si se consumió, o segundos a esperar antes de reintentar
+        """
+        tasa = self.capacidad * factor / 60
+        ahora = time.monotonic()
+        self.disponibles = min(self.capacidad * factor, self.disponibles + (ahora - self.ultimo_relleno) * tasa)
+        self.ultimo_relleno = ahora
+        # Una petición mayor que la capacidad no debe bloquearse para siempre
+        cantidad = min(cantidad, self.capacidad * factor)
+        if self.disponibles >= cantidad:
+            self.disponibles -= cantidad
+            return 0
+        return (cantidad - self.disponibles) / tasa
+
+
+class ControladorTasa:
+    """Limita la concurrencia y la tasa de peticiones/tokens hacia la API de OpenAI"""
+
+    def __init__(self, rpm=None, tpm=None, max_concurrent=None, max_retries=None, max_wait=None):
+        """
+        Inicializa el controlador.
+
+        Args:
+            rpm (int, optional): Peticiones por minuto permitidas
+            tpm (int, optional): Tokens por minuto permitidos
+            max_concurrent (int, optional): Llamadas simultáneas permitidas
+            max_retries (int, optional): Reintentos ante 429, 5xx o errores de conexión
+            max_wait (float, optional): Segundos máximos en cola antes de desistir
+        """
+        self.rpm = rpm or Config.OPENAI_RPM
+        self.tpm = tpm or Config.OPENAI_TPM
+        self.max_retries = max_retries if max_retries is not None else Config.OPENAI_MAX_RETRIES
+        self.max_wait = max_wait or Config.OPENAI_MAX_QUEUE_WAIT
+
+        self._semaforo = threading.BoundedSemaphore(max_concurrent or Config.OPENAI_MAX_CONCURRENT)
+        self._peticiones = _Cubeta(self.rpm)
+        self._tokens = _Cubeta(self.tpm)
+        self._lock = threading.Lock()
+        # Fracción de la tasa nominal: se reduce ante 429 y se recupera con cada éxito
+        self._factor = 1.0
+        self._pausa_hasta = 0.0
+        self._metricas = {
+            'requests': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'server_errors': 0,
+            'failures': 0,
+            'queued': 0,
+            'in_flight': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def ejecutar(self, llamada, tokens_estimados):
+        """
+        Ejecuta una llamada al LLM respetando los límites y reintentando los errores transitorios.
+
+        Args:
+            llamada (callable): Función sin argumentos que realiza la petición completa
+            tokens_estimados (int): Tokens de entrada y salida previstos para la petición
+
+        Returns:
+            Resultado de la llamada
+
+        Raises:
+            ReintentosAgotadosError: Si la petición sigue fallando tras los reintentos
+        """
+        intento = 0
+        while True:
+            self._esperar_turno(tokens_estimados)
+            try:
+                with self._lock:
+                    self._metricas['in_flight'] += 1
+                try:
+                    resultado = llamada()
+                finally:
+                    with self._lock:
+                        self._metricas['in_flight'] -= 1
+                    self._semaforo.release()
+
+                with self._lock:
+                    self._metricas['requests'] += 1
+                    self._factor = min(1.0, self._factor + 0.05)
+                return resultado
+
+            except (openai.RateLimitError, openai.InternalServerError,
+                    openai.APIConnectionError, openai.APITimeoutError) as e:
+                intento += 1
+                espera = self._registrar_fallo(e, intento)
+                if intento > self.max_retries:
+                    with self._lock:
+                        self._metricas['failures'] += 1
+                    raise ReintentosAgotadosError(
+                        f"La API de OpenAI no respondió tras {self.max_retries} reintentos: {str(e)}"
+                    ) from e
+                logger.warning(f"Error transitorio de OpenAI ({str(e)}), reintento {intento} en {espera:.1f} segundos")
+                time.sleep(espera)
+
+    def _esperar_turno(self, tokens_estimados):
+        """Bloquea hasta obtener un cupo de concurrencia y saldo en ambas cubetas"""
+        inicio = time.monotonic()
+        with self._lock:
+            self._metricas['queued'] += 1
+        try:
+            if not self._semaforo.acquire(timeout=self.max_wait):
+                raise ReintentosAgotadosError(f"Sin cupo para llamar a OpenAI tras {self.max_wait} segundos")
+            try:
+                while True:
+                    with self._lock:
+                        espera = max(0.0, self._pausa_hasta - time.time())
+                        if espera == 0:
+                            espera = self._peticiones.espera(1, self._factor)
+                        if espera == 0:
+                            espera = self._tokens.espera(tokens_estimados, self._factor)
+                            if espera > 0:
+                                # Devolver la petición consumida para no desperdiciar saldo
+                                self._peticiones.disponibles += 1
+                    if espera == 0:
+                        return
+                    if time.monotonic() - inicio + espera > self.max_wait:
+                        raise ReintentosAgotadosError(
+                            f"Límite de tasa de OpenAI saturado durante más de {self.max_wait} segundos"
+                        )
+                    time.sleep(espera)
+            except Exception:
+                self._semaforo.release()
+                raise
+        finally:
+            with self._lock:
+                self._metricas['queued'] -= 1
+                self._metricas['wait_seconds'] += time.monotonic() - inicio
+
+    def _registrar_fallo(self, error, intento):
+        """
+        Ajusta la tasa ante un error y calcula la espera antes del siguiente intento.
+
+        Returns:
+            float: Segundos a esperar
+        """
+        espera = min(Config.OPENAI_RETRY_MAX_BACKOFF, Config.OPENAI_RETRY_BACKOFF * (2 ** (intento - 1)))
+        # Jitter completo para que los reintentos simultáneos no se sincronicen
+        espera = random.uniform(espera / 2, espera)
+
+        retry_after = _retry_after(error)
+        with self._lock:
+            self._metricas['retries'] += 1
+            if isinstance(error, openai.RateLimitError):
+                self._metricas['rate_limited'] += 1
+                self._factor = max(0.1, self._factor * 0.5)
+                if retry_after is not None:
+                    # Pausar a todos los llamadores, no solo al que recibió el 429
+                    self._pausa_hasta = max(self._pausa_hasta, time.time() + retry_after)
+            elif isinstance(error, openai.InternalServerError):
+                self._metricas['server_errors'] += 1
+        return max(espera, retry_after or 0)
+
+    def stats(self):
+        """
+        Obtiene las métricas del controlador.
+
+        Returns:
+            dict: Contadores de peticiones, reintentos, cola y tasa efectiva
+        """
+        with self._lock:
+            return {
+                **self._metricas,
+                'wait_seconds': round(self._metricas['wait_seconds'], 2),
+                'rate_factor': round(self._factor, 3),
+                'effective_rpm': round(self.rpm * self._factor, 1),
+                'effective_tpm': round(self.tpm * self._factor, 1),
+            }
+
+
+def _retry_after(error):
+    """Obtiene los segundos indicados por la cabecera Retry-After, si existe"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    valor = response.headers.get('retry-after-ms')
+    if valor:
+        try:
+            return float(valor) / 1000
+        except ValueError:
+            pass
+    valor = response.headers.get('retry-after')
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def estimar_tokens(messages, max_tokens):
+    """
+    Estima los tokens de una petición (aprox. 4 caracteres por token en la entrada).
+
+    Args:
+        messages (list): Mensajes de la conversación
+        max_tokens (int): Máximo de tokens a generar
+
+    Returns:
+        int: Tokens estimados
+    """
+    return sum(len(m.get('content', '')) for m in messages) // 4 + max_tokens
+
+
+# Controlador compartido por todas las llamadas al LLM del proceso
+controlador_llm = ControladorTasa()
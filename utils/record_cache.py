@@ -0,0 +1,164 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CacheRegistros:
+    """Caché LRU con expiración para registros de diagnósticos, con segundo nivel opcional en Redis"""
+
+    def __init__(self, max_size=None, ttl=None, redis_url=None):
+        """
+        Inicializa la caché de registros.
+
+        Args:
+            max_size (int, optional): Número máximo de registros en memoria
+            ttl (float, optional): Segundos de validez de cada registro
+            redis_url (str, optional): URL de Redis para el segundo nivel compartido
+        """
+        self.max_size = max_size or Config.RECORD_CACHE_SIZE
+        self.ttl = ttl or Config.RECORD_CACHE_TTL
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._metricas = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'evictions': 0, 'invalidations': 0}
+
+        self._redis = None
+        redis_url = redis_url if redis_url is not None else Config.RECORD_CACHE_REDIS_URL
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url)
+            except Exception as e:
+                logger.warning(f"No se pudo configurar el segundo nivel de caché en Redis: {str(e)}")
+
+    def _key(self, diagnostico_id):
+        """Clave de Redis para un registro"""
+        return f"vitalscan:registro:{diagnostico_id}"
+
+    def get(self, diagnostico_id):
+        """
+        Obtiene un registro de la caché.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+
+        Returns:
+            dict: Copia del registro o None si no está en caché
+        """
+        with self._lock:
+            entrada = self._datos.get(diagnostico_id)
+            if entrada is not None:
+                if entrada[0] >= time.time():
+                    self._datos.move_to_end(diagnostico_id)
+                    self._metricas['hits'] += 1
+                    return dict(entrada[1])
+                del self._datos[diagnostico_id]
+
+        registro = self._get_compartido(diagnostico_id)
+        with self._lock:
+            if registro is None:
+                self._metricas['misses'] += 1
+                return None
+            self._metricas['shared_hits'] += 1
+            self._guardar_local(diagnostico_id, registro)
+        return dict(registro)
+
+    def put(self, diagnostico_id, registro):
+        """
+        Guarda un registro en la caché.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            registro (dict): Datos del diagnóstico
+        """
+        with self._lock:
+            self._guardar_local(diagnostico_id, dict(registro))
+        if self._redis is not None:
+            try:
+                self._redis.set(
+                    self._key(diagnostico_id),
+                    json.dumps(registro, ensure_ascii=False, default=str),
+                    ex=int(self.ttl)
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo guardar el registro {diagnostico_id} en Redis: {str(e)}")
+
+    def invalidar(self, diagnostico_id):
+        """
+        Elimina un registro de ambos niveles de la caché tras una actualización.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+        """
+        with self._lock:
+            self._datos.pop(diagnostico_id, None)
+            self._metricas['invalidations'] += 1
+        if self._redis is not None:
+            try:
+                self._redis.delete(self._key(diagnostico_id))
+            except Exception as e:
+                logger.warning(f"No se pudo invalidar el registro {diagnostico_id} en Redis: {str(e)}")
+
+    def invalidar_varios(self, diagnostico_ids):
+        """
+        Elimina varios registros de ambos niveles de la caché.
+
+        Args:
+            diagnostico_ids (list): IDs de los diagnósticos
+        """
+        diagnostico_ids = list(diagnostico_ids)
+        if not diagnostico_ids:
+            return
+        with self._lock:
+            for diagnostico_id in diagnostico_ids:
+                self._datos.pop(diagnostico_id, None)
+            self._metricas['invalidations'] += len(diagnostico_ids)
+        if self._redis is not None:
+            try:
+                self._redis.delete(*[self._key(diagnostico_id) for diagnostico_id in diagnostico_ids])
+            except Exception as e:
+                logger.warning(f"No se pudieron invalidar {len(diagnostico_ids)} registros en Redis: {str(e)}")
+
+    def _guardar_local(self, diagnostico_id, registro):
+        """Guarda en el nivel de memoria expulsando los menos usados (requiere el lock)"""
+        self._datos[diagnostico_id] = (time.time() + self.ttl, registro)
+        self._datos.move_to_end(diagnostico_id)
+        while len(self._datos) > self.max_size:
+            self._datos.popitem(last=False)
+            self._metricas['evictions'] += 1
+
+    def _get_compartido(self, diagnostico_id):
+        """Consulta el segundo nivel en Redis"""
+        if self._redis is None:
+            return None
+        try:
+            data = self._redis.get(self._key(diagnostico_id))
+            return json.loads(data) if data else None
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el registro {diagnostico_id} en Redis: {str(e)}")
+            return None
+
+    def stats(self):
+        """
+        Obtiene las métricas de la caché.
+
+        Returns:
+            dict: Tamaño actual, aciertos, fallos y tasa de aciertos
+        """
+        with self._lock:
+            consultas = self._metricas['hits'] + self._metricas['shared_hits'] + self._metricas['misses']
+            aciertos = self._metricas['hits'] + self._metricas['shared_hits']
+            return {
+                'size': len(self._datos),
+                'max_size': self.max_size,
+                'hit_ratio': round(aciertos / consultas, 4) if consultas else 0.0,
+                **self._metricas,
+            }
+
+
+# Caché compartida por los modelos y las rutas del proceso
+cache_registros = CacheRegistros()
@@ -1,10 +1,15 @@
 import os
+import json
+import hashlib
 import logging
 import tempfile
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 import pdfkit
 import shutil
 import subprocess
+import threading
+from functools import lru_cache
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -13,9 +18,125 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from jinja2 import Template
 from config import Config
+from utils.metrics import span
 
 logger = logging.getLogger(__name__)
 
+# Campos del diagnóstico que aparecen en el informe; solo ellos determinan su contenido
+CAMPOS_INFORME = ('nombre', 'apellido', 'edad', 'genero', 'diagnostico', 'recomendaciones')
+
+# Plantilla HTML del informe para wkhtmltopdf
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Diagnóstico de Bienestar</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            padding: 20px;
+        }
+        .header {
+            text-align: center;
+            margin-bottom: 30px;
+        }
+        .title {
+            font-size: 24px;
+            font-weight: bold;
+            color: #2563eb;
+            margin-bottom: 10px;
+        }
+        .section {
+            margin-bottom: 30px;
+        }
+        .section-title {
+            font-size: 18px;
+            font-weight: bold;
+            color: #1e40af;
+            margin-bottom: 15px;
+            border-bottom: 1px solid #e5e7eb;
+            padding-bottom: 5px;
+        }
+        .info-table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-bottom: 20px;
+        }
+        .info-table th, .info-table td {
+            padding: 10px;
+            border: 1px solid #e5e7eb;
+        }
+        .info-table th {
+            background-color: #f3f4f6;
+            text-align: left;
+            width: 30%;
+        }
+        .diagnostico, .recomendaciones {
+            background-color: #f9fafb;
+            padding: 15px;
+            border-radius: 5px;
+            border-left: 4px solid #2563eb;
+        }
+        .footer {
+            text-align: center;
+            font-size: 12px;
+            color: #6b7280;
+            margin-top: 40px;
+            padding-top: 10px;
+            border-top: 1px solid #e5e7eb;
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <div class="title">DIAGNÓSTICO DE BIENESTAR</div>
+        <div>Fecha: {{ fecha }}</div>
+    </div>
+
+    <div class="section">
+        <div class="section-title">DATOS PERSONALES</div>
+        <table class="info-table">
+            <tr>
+                <th>Nombre</th>
+                <td>{{ diagnostico.nombre }} {{ diagnostico.apellido }}</td>
+            </tr>
+            <tr>
+                <th>Edad</th>
+                <td>{{ diagnostico.edad }}</td>
+            </tr>
+            <tr>
+                <th>Género</th>
+                <td>{{ diagnostico.genero }}</td>
+            </tr>
+        </table>
+    </div>
+
+    <div class="section">
+        <div class="section-title">DIAGNÓSTICO</div>
+        <div class="diagnostico">
+            {{ diagnostico.diagnostico|replace('\n', '<br>') }}
+        </div>
+    </div>
+
+    <div class="section">
+        <div class="section-title">RECOMENDACIONES</div>
+        <div class="recomendaciones">
+            {{ diagnostico.recomendaciones|replace('\n', '<br>') }}
+        </div>
+    </div>
+
+    <div class="footer">
+        <div>{{ company_name }} - {{ contact_email }} - {{ contact_phone }}</div>
+        <div>Este diagnóstico es informativo y no sustituye la consulta con un profesional de la salud.</div>
+    </div>
+</body>
+</html>
+"""
+
 class ReportGenerator:
     """Clase para generar informes PDF de diagnósticos"""
     
@@ -26,47 +147,14 @@ class ReportGenerator:
         # Asegurar que el directorio existe
         os.makedirs(self.reports_dir, exist_ok=True)
         
-        # Configurar estilos para ReportLab
-        self.styles = getSampleStyleSheet()
-        self._configurar_estilos()
-        
-        # Verificar si wkhtmltopdf está instalado
-        self.has_wkhtmltopdf = self._check_wkhtmltopdf()
-    
-    def _check_wkhtmltopdf(self):
-        """Verifica si wkhtmltopdf está instalado en el sistema."""
-        logger.info("Verificando instalación de wkhtmltopdf")
-        wkhtmltopdf_path = None
-        
-        # Buscar en PATH
-        try:
-            wkhtmltopdf_path = shutil.which('wkhtmltopdf')
-            if wkhtmltopdf_path:
-                logger.info(f"wkhtmltopdf encontrado en: {wkhtmltopdf_path}")
-                return True
-        except Exception as e:
-            logger.warning(f"Error al buscar wkhtmltopdf en PATH: {str(e)}")
-        
-        # Intentar ejecutar para verificar
-        try:
-            result = subprocess.run(['wkhtmltopdf', '--version'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE,
-                                   text=True)
-            if result.returncode == 0:
-                logger.info(f"wkhtmltopdf encontrado, versión: {result.stdout.strip()}")
-                return True
-            else:
-                logger.warning(f"wkhtmltopdf encontrado pero con error: {result.stderr}")
-        except Exception as e:
-            logger.warning(f"wkhtmltopdf no está disponible: {str(e)}")
-            logger.info("Se usará ReportLab como alternativa para generar PDFs")
-        
-        return False
+        # Estilos de ReportLab y detección de wkhtmltopdf, calculados una vez por proceso
+        self.styles = _estilos()
+        self.has_wkhtmltopdf = _check_wkhtmltopdf()
     
     def generate_pdf(self, diagnostico_data, diagnostico_id):
         """
-        Genera un informe PDF con el diagnóstico.
+        Genera un informe PDF con el diagnóstico y lo publica como
+        reports/diagnostico_<id>.pdf (enlace al informe almacenado por contenido).
         
         Args:
             diagnostico_data (dict): Datos del diagnóstico
@@ -76,31 +164,108 @@ class ReportGenerator:
             str: Ruta al archivo PDF generado
         """
         try:
+            almacenado = self.obtener_pdf(diagnostico_data)
+            if not almacenado:
+                return None
+            
             # Definir ruta del archivo
             pdf_path = os.path.join(self.reports_dir, f"diagnostico_{diagnostico_id}.pdf")
             
-            # Intentar generar con pdfkit si está disponible
-            if self.has_wkhtmltopdf:
-                logger.info("Generando PDF con pdfkit (wkhtmltopdf)")
-                success = self._generate_with_pdfkit(diagnostico_data, pdf_path)
-                if success:
-                    return pdf_path
-                else:
-                    logger.warning("Fallback a ReportLab después de error con pdfkit")
+            # Ya publicado (p. ej. por otro canal de notificación)
+            if os.path.exists(pdf_path) and os.path.samefile(pdf_path, almacenado):
+                return pdf_path
             
-            # Generar con ReportLab si pdfkit no está disponible o falló
-            logger.info("Generando PDF con ReportLab")
-            success = self._generate_with_reportlab(diagnostico_data, pdf_path)
+            # Un enlace duro evita copiar el archivo; se reemplaza de forma atómica
+            tmp_path = f"{pdf_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                try:
+                    os.link(almacenado, tmp_path)
+                except OSError:
+                    shutil.copyfile(almacenado, tmp_path)
+                os.replace(tmp_path, pdf_path)
+            finally:
+                # rename() no hace nada si ambos nombres ya apuntan al mismo archivo
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return pdf_path
             
+        except Exception as e:
+            logger.error(f"Error al generar informe PDF: {str(e)}", exc_info=True)
+            return None
+    
+    def obtener_pdf(self, diagnostico_data):
+        """
+        Obtiene el informe PDF almacenado por el hash de su contenido,
+        renderizándolo solo si no existe. Si el pool de renderizado está
+        habilitado, el trabajo se ejecuta en un proceso aparte.
+        
+        Args:
+            diagnostico_data (dict): Datos del diagnóstico
+            
+        Returns:
+            str: Ruta al archivo PDF almacenado o None si falló
+        """
+        huella = huella_informe(diagnostico_data)
+        pdf_path = ruta_almacenada(huella)
+        if os.path.exists(pdf_path):
+            return pdf_path
+        
+        # Evitar que dos peticiones simultáneas rendericen el mismo informe
+        with _lock_huella(huella):
+            if os.path.exists(pdf_path):
+                return pdf_path
+            
+            os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+            # Renderizar a un archivo temporal y publicarlo solo si está completo
+            tmp_path = f"{pdf_path[:-4]}.{os.getpid()}.tmp.pdf"
+            try:
+                with span('pdf_render', huella=huella[:12]):
+                    if Config.PDF_POOL_WORKERS > 0:
+                        # Importación diferida: pdf_pool importa este módulo en sus workers
+                        from utils.pdf_pool import get_pdf_pool
+                        resultado = get_pdf_pool().renderizar(dict(diagnostico_data), tmp_path)
+                    else:
+                        resultado = self.render_to_path(diagnostico_data, tmp_path)
+                
+                if not resultado:
+                    return None
+                os.replace(tmp_path, pdf_path)
+                logger.info(f"Informe PDF almacenado: {pdf_path}")
+                return pdf_path
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    
+    def render_to_path(self, diagnostico_data, pdf_path):
+        """
+        Renderiza el informe en el proceso actual, con wkhtmltopdf si está
+        disponible y ReportLab como alternativa.
+        
+        Args:
+            diagnostico_data (dict): Datos del diagnóstico
+            pdf_path (str): Ruta de salida para el PDF
+            
+        Returns:
+            str: Ruta al archivo PDF generado o None si falló
+        """
+        # Intentar generar con pdfkit si está disponible
+        if self.has_wkhtmltopdf:
+            logger.info("Generando PDF con pdfkit (wkhtmltopdf)")
+            success = self._generate_with_pdfkit(diagnostico_data, pdf_path)
             if success:
-                logger.info(f"Informe PDF generado: {pdf_path}")
                 return pdf_path
             else:
-                logger.error("Error al generar el PDF con ambos métodos")
-                return None
-            
-        except Exception as e:
-            logger.error(f"Error al generar informe PDF: {str(e)}", exc_info=True)
+                logger.warning("Fallback a ReportLab después de error con pdfkit")
+        
+        # Generar con ReportLab si pdfkit no está disponible o falló
+        logger.info("Generando PDF con ReportLab")
+        success = self._generate_with_reportlab(diagnostico_data, pdf_path)
+        
+        if success:
+            logger.info(f"Informe PDF generado: {pdf_path}")
+            return pdf_path
+        else:
+            logger.error("Error al generar el PDF con ambos métodos")
             return None
     
     def _generate_with_pdfkit(self, diagnostico_data, pdf_path):
@@ -130,8 +295,13 @@ class ReportGenerator:
                 'quiet': ''
             }
             
-            # Generar PDF
-            pdfkit.from_string(html_content, pdf_path, options=options)
+            # Reutilizar un proceso de wkhtmltopdf ya inicializado si está habilitado
+            if Config.PDF_PERSISTENT_RENDERER:
+                from utils.wkhtmltopdf_renderer import get_renderer
+                return get_renderer().renderizar(html_content, pdf_path)
+            
+            # Generar PDF (la configuración de pdfkit localiza el binario una sola vez)
+            pdfkit.from_string(html_content, pdf_path, options=options, configuration=_configuracion_pdfkit())
             
             return os.path.exists(pdf_path)
             
@@ -149,124 +319,12 @@ class ReportGenerator:
         Returns:
             str: Contenido HTML del informe
         """
-        # Plantilla básica
-        html_template = """
-        <!DOCTYPE html>
-        <html lang="es">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Diagnóstico de Bienestar</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    padding: 20px;
-                }
-                .header {
-                    text-align: center;
-                    margin-bottom: 30px;
-                }
-                .title {
-                    font-size: 24px;
-                    font-weight: bold;
-                    color: #2563eb;
-                    margin-bottom: 10px;
-                }
-                .section {
-                    margin-bottom: 30px;
-                }
-                .section-title {
-                    font-size: 18px;
-                    font-weight: bold;
-                    color: #1e40af;
-                    margin-bottom: 15px;
-                    border-bottom: 1px solid #e5e7eb;
-                    padding-bottom: 5px;
-                }
-                .info-table {
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin-bottom: 20px;
-                }
-                .info-table th, .info-table td {
-                    padding: 10px;
-                    border: 1px solid #e5e7eb;
-                }
-                .info-table th {
-                    background-color: #f3f4f6;
-                    text-align: left;
-                    width: 30%;
-                }
-                .diagnostico, .recomendaciones {
-                    background-color: #f9fafb;
-                    padding: 15px;
-                    border-radius: 5px;
-                    border-left: 4px solid #2563eb;
-                }
-                .footer {
-                    text-align: center;
-                    font-size: 12px;
-                    color: #6b7280;
-                    margin-top: 40px;
-                    padding-top: 10px;
-                    border-top: 1px solid #e5e7eb;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <div class="title">DIAGNÓSTICO DE BIENESTAR</div>
-                <div>Fecha: {{ fecha }}</div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">DATOS PERSONALES</div>
-                <table class="info-table">
-                    <tr>
-                        <th>Nombre</th>
-                        <td>{{ diagnostico.nombre }} {{ diagnostico.apellido }}</td>
-                    </tr>
-                    <tr>
-                        <th>Edad</th>
-                        <td>{{ diagnostico.edad }}</td>
-                    </tr>
-                    <tr>
-                        <th>Género</th>
-                        <td>{{ diagnostico.genero }}</td>
-                    </tr>
-                </table>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">DIAGNÓSTICO</div>
-                <div class="diagnostico">
-                    {{ diagnostico.diagnostico|replace('\n', '<br>') }}
-                </div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">RECOMENDACIONES</div>
-                <div class="recomendaciones">
-                    {{ diagnostico.recomendaciones|replace('\n', '<br>') }}
-                </div>
-            </div>
-            
-            <div class="footer">
-                <div>{{ company_name }} - {{ contact_email }} - {{ contact_phone }}</div>
-                <div>Este diagnóstico es informativo y no sustituye la consulta con un profesional de la salud.</div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Renderizar plantilla con Jinja2
-        template = Template(html_template)
+        # La plantilla se compila una sola vez por proceso
+        template = _plantilla_html()
         
         # Datos para la plantilla
         context = {
-            'fecha': datetime.now().strftime("%d/%m/%Y"),
+            'fecha': fecha_informe(diagnostico_data),
             'diagnostico': diagnostico_data,
             'company_name': Config.COMPANY_NAME,
             'contact_email': Config.CONTACT_EMAIL,
@@ -324,67 +382,6 @@ class ReportGenerator:
             logger.error(f"Error al generar PDF con ReportLab: {str(e)}", exc_info=True)
             return False
     
-    def _configurar_estilos(self):
-        """Configura los estilos para el documento PDF"""
-        # Estilo para títulos
-        self.styles.add(ParagraphStyle(
-            name='Titulo',
-            parent=self.styles['Heading1'],
-            fontSize=18,
-            fontName='Helvetica-Bold',
-            alignment=1,  # Centro
-            spaceAfter=12
-        ))
-        
-        # Estilo para subtítulos
-        self.styles.add(ParagraphStyle(
-            name='Subtitulo',
-            parent=self.styles['Heading2'],
-            fontSize=14,
-            fontName='Helvetica-Bold',
-            spaceBefore=12,
-            spaceAfter=6
-        ))
-        
-        # Estilo para secciones
-        self.styles.add(ParagraphStyle(
-            name='Seccion',
-            parent=self.styles['Heading3'],
-            fontSize=12,
-            fontName='Helvetica-Bold',
-            spaceBefore=8,
-            spaceAfter=4
-        ))
-        
-        # Estilo para texto normal (modificamos el nombre para evitar conflictos)
-        self.styles.add(ParagraphStyle(
-            name='TextoNormal',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            spaceBefore=4,
-            spaceAfter=4
-        ))
-        
-        # Estilo para texto resaltado
-        self.styles.add(ParagraphStyle(
-            name='Resaltado',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            fontName='Helvetica-Bold',
-            backColor=colors.lightgrey,
-            spaceBefore=4,
-            spaceAfter=4
-        ))
-        
-        # Estilo para pie de página
-        self.styles.add(ParagraphStyle(
-            name='PiePagina',
-            parent=self.styles['Normal'],
-            fontSize=8,
-            alignment=1,  # Centro
-            textColor=colors.darkgrey
-        ))
-    
     def _agregar_encabezado(self, story, diagnostico_data):
         """Agrega el encabezado al informe"""
         # Logo (placeholder para este ejemplo)
@@ -397,8 +394,7 @@ class ReportGenerator:
         story.append(Paragraph("DIAGNÓSTICO DE BIENESTAR", self.styles['Titulo']))
         
         # Fecha
-        fecha_actual = datetime.now().strftime("%d/%m/%Y")
-        story.append(Paragraph(f"Fecha: {fecha_actual}", self.styles['TextoNormal']))
+        story.append(Paragraph(f"Fecha: {fecha_informe(diagnostico_data)}", self.styles['TextoNormal']))
         
         # Separador
         story.append(Spacer(1, 20))
@@ -470,4 +466,237 @@ class ReportGenerator:
         story.append(Paragraph(
             "Este diagnóstico es informativo y no sustituye la consulta con un profesional de la salud.",
             self.styles['PiePagina']
-        )) 
\ No newline at end of file
+        ))
+
+
+def fecha_creacion(diagnostico_data):
+    """
+    Obtiene la fecha de creación de un registro. Según su origen (MySQL, caché,
+    spool, bandeja de salida o almacén local) llega como datetime o como texto.
+    
+    Args:
+        diagnostico_data (dict): Datos del diagnóstico
+        
+    Returns:
+        datetime: Fecha de creación o None si el registro no la tiene
+    """
+    fecha = diagnostico_data.get('fecha_creacion')
+    if isinstance(fecha, datetime) or not fecha:
+        return fecha or None
+    try:
+        return datetime.fromisoformat(str(fecha))
+    except ValueError:
+        pass
+    try:
+        # Formato de las fechas serializadas por jsonify (RFC 822)
+        return parsedate_to_datetime(str(fecha)).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        logger.warning(f"Fecha de creación no reconocida: {fecha}")
+        return None
+
+
+def fecha_informe(diagnostico_data):
+    """
+    Obtiene la fecha que figura en el informe: la de creación del diagnóstico,
+    para que renderizados posteriores produzcan el mismo documento. Solo los
+    registros sin fecha (p. ej. simulados) muestran la fecha actual.
+    
+    Args:
+        diagnostico_data (dict): Datos del diagnóstico
+        
+    Returns:
+        str: Fecha con formato dd/mm/aaaa
+    """
+    return (fecha_creacion(diagnostico_data) or datetime.now()).strftime("%d/%m/%Y")
+
+
+def huella_informe(diagnostico_data):
+    """
+    Calcula el hash del contenido de un informe: campos mostrados, fecha,
+    datos de contacto y versión de la plantilla.
+    
+    Args:
+        diagnostico_data (dict): Datos del diagnóstico
+        
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    contenido = {campo: str(diagnostico_data.get(campo) or '') for campo in CAMPOS_INFORME}
+    fecha = fecha_creacion(diagnostico_data)
+    contenido.update({
+        # Nunca la fecha actual: el hash de un mismo registro no debe cambiar cada día
+        'fecha': fecha.strftime("%d/%m/%Y") if fecha else '',
+        'contacto': [Config.COMPANY_NAME, Config.CONTACT_EMAIL, Config.CONTACT_PHONE],
+        'plantilla': _version_plantilla(),
+    })
+    return hashlib.sha256(json.dumps(contenido, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def ruta_almacenada(huella):
+    """
+    Obtiene la ruta del informe almacenado para un hash de contenido.
+    
+    Args:
+        huella (str): Hash del contenido del informe
+        
+    Returns:
+        str: Ruta al archivo PDF (puede no existir todavía)
+    """
+    return os.path.join(Config.PDF_STORE_DIR, huella[:2], f"{huella}.pdf")
+
+
+_locks_huella = {}
+_locks_huella_lock = threading.Lock()
+
+
+def _lock_huella(huella):
+    """Obtiene el lock de renderizado de un hash (se descarta al no quedar esperas)"""
+    with _locks_huella_lock:
+        if len(_locks_huella) > 1000:
+            # Conservar solo los locks en uso
+            for clave in [c for c, l in _locks_huella.items() if not l.locked()]:
+                del _locks_huella[clave]
+        return _locks_huella.setdefault(huella, threading.Lock())
+
+
+@lru_cache(maxsize=None)
+def _version_plantilla():
+    """Hash de la plantilla HTML; cambiarla invalida los informes almacenados"""
+    return hashlib.sha256(HTML_TEMPLATE.encode('utf-8')).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def _check_wkhtmltopdf():
+    """Verifica si wkhtmltopdf está instalado en el sistema."""
+    logger.info("Verificando instalación de wkhtmltopdf")
+    wkhtmltopdf_path = None
+
+    # Buscar en PATH
+    try:
+        wkhtmltopdf_path = shutil.which('wkhtmltopdf')
+        if wkhtmltopdf_path:
+            logger.info(f"wkhtmltopdf encontrado en: {wkhtmltopdf_path}")
+            return True
+    except Exception as e:
+        logger.warning(f"Error al buscar wkhtmltopdf en PATH: {str(e)}")
+
+    # Intentar ejecutar para verificar
+    try:
+        result = subprocess.run(['wkhtmltopdf', '--version'], 
+                               stdout=subprocess.PIPE, 
+                               stderr=subprocess.PIPE,
+                               text=True)
+        if result.returncode == 0:
+            logger.info(f"wkhtmltopdf encontrado, versión: {result.stdout.strip()}")
+            return True
+        else:
+            logger.warning(f"wkhtmltopdf encontrado pero con error: {result.stderr}")
+    except Exception as e:
+        logger.warning(f"wkhtmltopdf no está disponible: {str(e)}")
+        logger.info("Se usará ReportLab como alternativa para generar PDFs")
+
+    return False
+
+
+@lru_cache(maxsize=None)
+def _configuracion_pdfkit():
+    """Localiza el binario de wkhtmltopdf una sola vez por proceso"""
+    return pdfkit.configuration()
+
+
+@lru_cache(maxsize=None)
+def _estilos():
+    """
+    Construye la hoja de estilos para el documento PDF. Los estilos no se
+    modifican al generar informes, por lo que se comparten entre hilos.
+    
+    Returns:
+        StyleSheet1: Hoja de estilos con los estilos personalizados
+    """
+    styles = getSampleStyleSheet()
+    
+    # Estilo para títulos
+    styles.add(ParagraphStyle(
+        name='Titulo',
+        parent=styles['Heading1'],
+        fontSize=18,
+        fontName='Helvetica-Bold',
+        alignment=1,  # Centro
+        spaceAfter=12
+    ))
+
+    # Estilo para subtítulos
+    styles.add(ParagraphStyle(
+        name='Subtitulo',
+        parent=styles['Heading2'],
+        fontSize=14,
+        fontName='Helvetica-Bold',
+        spaceBefore=12,
+        spaceAfter=6
+    ))
+
+    # Estilo para secciones
+    styles.add(ParagraphStyle(
+        name='Seccion',
+        parent=styles['Heading3'],
+        fontSize=12,
+        fontName='Helvetica-Bold',
+        spaceBefore=8,
+        spaceAfter=4
+    ))
+
+    # Estilo para texto normal (modificamos el nombre para evitar conflictos)
+    styles.add(ParagraphStyle(
+        name='TextoNormal',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceBefore=4,
+        spaceAfter=4
+    ))
+
+    # Estilo para texto resaltado
+    styles.add(ParagraphStyle(
+        name='Resaltado',
+        parent=styles['Normal'],
+        fontSize=10,
+        fontName='Helvetica-Bold',
+        backColor=colors.lightgrey,
+        spaceBefore=4,
+        spaceAfter=4
+    ))
+
+    # Estilo para pie de página
+    styles.add(ParagraphStyle(
+        name='PiePagina',
+        parent=styles['Normal'],
+        fontSize=8,
+        alignment=1,  # Centro
+        textColor=colors.darkgrey
+    ))
+    
+    return styles
+
+
+@lru_cache(maxsize=None)
+def _plantilla_html():
+    """Compila la plantilla HTML del informe una sola vez por proceso"""
+    return Template(HTML_TEMPLATE)
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_report_generator():
+    """
+    Obtiene el generador de informes compartido del proceso.
+    
+    Returns:
+        ReportGenerator: Generador de informes
+    """
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = ReportGenerator()
+    return _generator
@@ -0,0 +1,156 @@
+import os
+import ssl
+import smtplib
+import logging
+import threading
+from config import Config
+from utils.db_pool import PoolConexiones
+
+logger = logging.getLogger(__name__)
+
+# Errores tras los que la sesión SMTP ya no es utilizable
+_ERRORES_CONEXION = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def _conectar_smtp():
+    """Abre una sesión SMTP nueva: EHLO, STARTTLS y LOGIN según la configuración"""
+    smtp = smtplib.SMTP(Config.MAIL_SERVER, Config.MAIL_PORT, timeout=Config.MAIL_TIMEOUT)
+    try:
+        smtp.ehlo()
+        if Config.MAIL_USE_TLS:
+            smtp.starttls(context=ssl.create_default_context())
+            smtp.ehlo()
+        if Config.MAIL_USERNAME:
+            smtp.login(Config.MAIL_USERNAME, Config.MAIL_PASSWORD)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+class PoolSMTP(PoolConexiones):
+    """
+    Pool de sesiones SMTP autenticadas. Reutiliza la lógica del pool de MySQL:
+    las sesiones inactivas se verifican con NOOP y se reciclan al superar el
+    tiempo de inactividad o el máximo de mensajes por conexión.
+    """
+
+    def __init__(self, connect_fn=None, max_size=None, timeout=None, max_idle=None,
+                 ping_after=None, max_mensajes=None):
+        """
+        Inicializa el pool SMTP.
+
+        Args:
+            connect_fn (callable, optional): Función que abre una sesión nueva
+            max_size (int, optional): Número máximo de sesiones abiertas
+            timeout (float, optional): Segundos máximos de espera por una sesión libre
+            max_idle (float, optional): Segundos de inactividad tras los que se cierra una sesión
+            ping_after (float, optional): Segundos de inactividad tras los que se envía NOOP
+            max_mensajes (int, optional): Mensajes tras los que se abre una sesión nueva
+        """
+        super().__init__(
+            connect_fn=connect_fn or _conectar_smtp,
+            max_size=max_size or Config.MAIL_POOL_SIZE,
+            timeout=timeout if timeout is not None else Config.MAIL_POOL_TIMEOUT,
+            max_idle=max_idle or Config.MAIL_POOL_MAX_IDLE,
+            ping_after=ping_after if ping_after is not None else Config.MAIL_POOL_PING_AFTER
+        )
+        self.max_mensajes = max_mensajes or Config.MAIL_MAX_MESSAGES_PER_CONNECTION
+        self._mensajes = {}
+        self._metricas.update({'sent': 0, 'rejected': 0, 'reconnects': 0})
+
+    def enviar(self, mensaje):
+        """
+        Envía un mensaje con una sesión del pool, sin repetir el saludo, STARTTLS
+        ni la autenticación de envíos anteriores. Si el servidor cortó la sesión
+        se reintenta una vez con una sesión nueva.
+
+        Args:
+            mensaje (email.message.Message): Mensaje con las cabeceras From y To
+
+        Returns:
+            bool: True si el servidor aceptó el mensaje
+        """
+        for intento in range(2):
+            try:
+                with self.conexion() as smtp:
+                    return self._enviar_en_sesion(smtp, mensaje)
+            except _ERRORES_CONEXION as e:
+                # La sesión caducó en el servidor (p. ej. 421 por inactividad)
+                if intento:
+                    logger.error(f"Sesión SMTP perdida de nuevo, correo a {mensaje.get('To')} sin enviar: {str(e)}")
+                    return False
+                with self._lock:
+                    self._metricas['reconnects'] += 1
+                logger.warning(f"Sesión SMTP cerrada por el servidor, se reconecta: {str(e)}")
+
+    def _enviar_en_sesion(self, smtp, mensaje):
+        """Envía un mensaje; los rechazos del destinatario no invalidan la sesión"""
+        try:
+            smtp.send_message(mensaje)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            if getattr(e, 'smtp_code', None) == 421:
+                raise smtplib.SMTPServerDisconnected(str(e))
+            smtp.rset()
+            with self._lock:
+                self._metricas['rejected'] += 1
+            logger.error(f"El servidor SMTP rechazó el correo a {mensaje.get('To')}: {str(e)}")
+            return False
+        with self._lock:
+            self._mensajes[id(smtp)] = self._mensajes.get(id(smtp), 0) + 1
+            self._metricas['sent'] += 1
+        return True
+
+    def _liberar(self, conn):
+        """Devuelve la sesión al pool, o la cierra si alcanzó el máximo de mensajes"""
+        if self._mensajes.get(id(conn), 0) >= self.max_mensajes:
+            with self._lock:
+                self._metricas['recycled'] += 1
+            self._descartar(conn)
+            return
+        super()._liberar(conn)
+
+    def _retirar(self, conn):
+        """Libera el cupo de una sesión que se va a cerrar (requiere tener el lock)"""
+        super()._retirar(conn)
+        self._mensajes.pop(id(conn), None)
+
+    def _cerrar(self, conn):
+        """Cierra la sesión con QUIT (sin el lock: un servidor lento no bloquea a los demás envíos)"""
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _sana(self, conn):
+        """Verifica con NOOP que la sesión siga abierta en el servidor"""
+        try:
+            return conn.noop()[0] == 250
+        except Exception as e:
+            logger.warning(f"Sesión SMTP inactiva descartada del pool: {str(e)}")
+            return False
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    """
+    Obtiene el pool SMTP del proceso, creándolo si es necesario.
+
+    Returns:
+        PoolSMTP: Pool de sesiones SMTP
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = PoolSMTP()
+                _pool_pid = os.getpid()
+                logger.info(f"Pool SMTP creado ({Config.MAIL_SERVER}:{Config.MAIL_PORT}, máximo {_pool.max_size} sesiones)")
+    return _pool
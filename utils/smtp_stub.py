@@ -0,0 +1,209 @@
+"""
+Servidor SMTP local para pruebas: acepta cualquier autenticación, guarda los
+mensajes en memoria (y opcionalmente en archivos .eml) y puede simular la
+latencia del saludo TLS y la autenticación de un servidor real.
+
+Uso:
+    python -m utils.smtp_stub --port 8025 --handshake-latency 0.3 --guardar-en /tmp/correos
+
+y en el entorno de la aplicación:
+    MAIL_SERVER=localhost
+    MAIL_PORT=8025
+    MAIL_USE_TLS=False
+"""
+import os
+import time
+import uuid
+import socket
+import base64
+import logging
+import argparse
+import threading
+import socketserver
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Atiende una sesión SMTP: EHLO, AUTH, MAIL, RCPT, DATA, RSET, NOOP y QUIT"""
+
+    def handle(self):
+        config = self.server.stub_config
+        self._contar('connections')
+        if config['idle_timeout']:
+            self.request.settimeout(config['idle_timeout'])
+        # Coste de la conexión TCP + TLS de un servidor real
+        time.sleep(config['handshake_latency'])
+        self._responder('220 vitalscan-smtp-stub ESMTP')
+
+        remitente, destinatarios = None, []
+        while True:
+            comando = self._leer_linea()
+            if comando is None:
+                return
+            verbo = comando.split(' ', 1)[0].upper()
+
+            if verbo == 'EHLO':
+                self._responder('250-vitalscan-smtp-stub', '250-AUTH PLAIN LOGIN', '250-8BITMIME', '250 PIPELINING')
+            elif verbo == 'HELO':
+                self._responder('250 vitalscan-smtp-stub')
+            elif verbo == 'AUTH':
+                if not self._autenticar(comando):
+                    return
+            elif verbo == 'MAIL':
+                remitente, destinatarios = comando[10:].strip(), []
+                self._responder('250 2.1.0 OK')
+            elif verbo == 'RCPT':
+                destinatarios.append(comando[8:].strip())
+                self._responder('250 2.1.5 OK')
+            elif verbo == 'DATA':
+                if not destinatarios:
+                    self._responder('503 5.5.1 Falta RCPT')
+                    continue
+                self._responder('354 Termine con <CRLF>.<CRLF>')
+                datos = self._leer_datos()
+                if datos is None:
+                    return
+                self._guardar(remitente, destinatarios, datos)
+                remitente, destinatarios = None, []
+                self._responder('250 2.0.0 Mensaje aceptado')
+            elif verbo == 'RSET':
+                remitente, destinatarios = None, []
+                self._responder('250 2.0.0 OK')
+            elif verbo == 'NOOP':
+                self._responder('250 2.0.0 OK')
+            elif verbo == 'QUIT':
+                self._responder('221 2.0.0 Adiós')
+                return
+            else:
+                self._responder('502 5.5.2 Comando no reconocido')
+
+    def _autenticar(self, comando):
+        """Acepta AUTH PLAIN y AUTH LOGIN con cualquier credencial"""
+        partes = comando.split()
+        metodo = partes[1].upper() if len(partes) > 1 else ''
+        if metodo == 'PLAIN' and len(partes) < 3:
+            self._responder('334 ')
+            if self._leer_linea() is None:
+                return False
+        elif metodo == 'LOGIN':
+            self._responder('334 ' + base64.b64encode(b'Username:').decode())
+            if self._leer_linea() is None:
+                return False
+            self._responder('334 ' + base64.b64encode(b'Password:').decode())
+            if self._leer_linea() is None:
+                return False
+        elif metodo != 'PLAIN':
+            self._responder('504 5.5.4 Mecanismo no soportado')
+            return True
+        # Coste de la autenticación de un servidor real
+        time.sleep(self.server.stub_config['handshake_latency'])
+        self._contar('logins')
+        self._responder('235 2.7.0 Autenticado')
+        return True
+
+    def _leer_linea(self):
+        """Lee un comando; cierra con 421 si la sesión supera el tiempo de inactividad"""
+        try:
+            linea = self.rfile.readline()
+        except socket.timeout:
+            self._responder('421 4.4.2 Tiempo de inactividad agotado')
+            return None
+        if not linea:
+            return None
+        return linea.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def _leer_datos(self):
+        """Lee el cuerpo del mensaje hasta la línea con un punto"""
+        lineas = []
+        while True:
+            try:
+                linea = self.rfile.readline()
+            except socket.timeout:
+                return None
+            if not linea:
+                return None
+            if linea in (b'.\r\n', b'.\n'):
+                return b''.join(lineas)
+            # Quitar el punto duplicado por el cliente (RFC 5321, 4.5.2)
+            lineas.append(linea[1:] if linea.startswith(b'..') else linea)
+
+    def _guardar(self, remitente, destinatarios, datos):
+        """Conserva el mensaje en memoria y, si se configuró, en un archivo .eml"""
+        self.server.mensajes.append({'from': remitente, 'to': destinatarios, 'data': datos})
+        self._contar('messages')
+        directorio = self.server.stub_config['guardar_en']
+        if directorio:
+            with open(os.path.join(directorio, f"{uuid.uuid4().hex}.eml"), 'wb') as f:
+                f.write(datos)
+
+    def _contar(self, metrica):
+        with self.server.stub_lock:
+            self.server.stub_stats[metrica] += 1
+
+    def _responder(self, *lineas):
+        self.wfile.write(''.join(f"{linea}\r\n" for linea in lineas).encode('utf-8'))
+
+
+def crear_servidor(host='127.0.0.1', port=8025, handshake_latency=0.0, idle_timeout=0.0,
+                   guardar_en=None, max_mensajes=1000):
+    """
+    Crea el servidor SMTP de pruebas.
+
+    Args:
+        host (str): Interfaz de escucha
+        port (int): Puerto de escucha (0 para uno libre)
+        handshake_latency (float): Segundos simulados al conectar y al autenticar
+        idle_timeout (float): Segundos de inactividad tras los que el servidor
+            cierra la sesión con 421 (0 para no cerrarla)
+        guardar_en (str, optional): Directorio donde escribir cada mensaje como .eml
+        max_mensajes (int): Mensajes conservados en memoria
+
+    Returns:
+        socketserver.ThreadingTCPServer: Servidor listo para serve_forever();
+            los mensajes recibidos están en server.mensajes y los contadores en server.stub_stats
+    """
+    if guardar_en:
+        os.makedirs(guardar_en, exist_ok=True)
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer((host, port), SMTPStubHandler)
+    server.daemon_threads = True
+    server.stub_config = {
+        'handshake_latency': handshake_latency,
+        'idle_timeout': idle_timeout,
+        'guardar_en': guardar_en,
+    }
+    server.stub_lock = threading.Lock()
+    server.stub_stats = {'connections': 0, 'logins': 0, 'messages': 0}
+    server.mensajes = deque(maxlen=max_mensajes)
+    return server
+
+
+def iniciar_en_segundo_plano(**kwargs):
+    """
+    Inicia el servidor SMTP de pruebas en un hilo daemon.
+
+    Returns:
+        socketserver.ThreadingTCPServer: Servidor en ejecución; su puerto es server.server_address[1]
+    """
+    server = crear_servidor(**kwargs)
+    threading.Thread(target=server.serve_forever, name='smtp-stub', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor SMTP local para pruebas')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--handshake-latency', type=float, default=0.0,
+                        help='Segundos simulados al conectar y al autenticar')
+    parser.add_argument('--idle-timeout', type=float, default=0.0,
+                        help='Cerrar sesiones inactivas tras estos segundos (0 = nunca)')
+    parser.add_argument('--guardar-en', default=None, help='Directorio donde guardar los mensajes .eml')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = crear_servidor(args.host, args.port, args.handshake_latency, args.idle_timeout, args.guardar_en)
+    logger.info(f"Servidor SMTP de pruebas en {args.host}:{server.server_address[1]}")
+    server.serve_forever()
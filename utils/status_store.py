@@ -0,0 +1,440 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AlmacenEstadoMemoria:
+    """Almacén de estado en memoria del proceso, solo válido con un único worker"""
+
+    def __init__(self, ttl=None):
+        """
+        Inicializa el almacén en memoria.
+
+        Args:
+            ttl (float, optional): Segundos que se conserva un estado desde su última actualización
+        """
+        self.ttl = ttl or Config.STATUS_TTL
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._cambio = threading.Condition(self._lock)
+
+    def get(self, diagnostico_id):
+        """
+        Obtiene el estado de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+
+        Returns:
+            dict: Estado del diagnóstico o None si no existe o expiró
+        """
+        with self._lock:
+            entrada = self._datos.get(diagnostico_id)
+            if entrada is None or entrada[0] < time.time():
+                return None
+            return dict(entrada[1])
+
+    def set(self, diagnostico_id, estado):
+        """
+        Reemplaza atómicamente el estado de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado (dict): Nuevo estado
+        """
+        with self._lock:
+            self._datos[diagnostico_id] = (time.time() + self.ttl, dict(estado))
+            self._datos.move_to_end(diagnostico_id)
+            self._evictar()
+            self._cambio.notify_all()
+
+    def get_varios(self, diagnostico_ids):
+        """
+        Obtiene el estado de varios diagnósticos en una sola operación.
+
+        Args:
+            diagnostico_ids (list): IDs de los diagnósticos
+
+        Returns:
+            dict: Estado vigente por ID (los inexistentes o expirados no aparecen)
+        """
+        ahora = time.time()
+        with self._lock:
+            return {
+                diagnostico_id: dict(entrada[1])
+                for diagnostico_id, entrada in ((i, self._datos.get(i)) for i in diagnostico_ids)
+                if entrada is not None and entrada[0] >= ahora
+            }
+
+    def esperar_cambio(self, diagnostico_id, estado_actual, timeout):
+        """
+        Bloquea hasta que el estado de un diagnóstico cambie o venza el tiempo.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado_actual (dict): Último estado conocido por quien espera
+            timeout (float): Segundos máximos de espera
+
+        Returns:
+            dict: Estado vigente al terminar la espera
+        """
+        limite = time.time() + timeout
+        with self._cambio:
+            while True:
+                entrada = self._datos.get(diagnostico_id)
+                estado = dict(entrada[1]) if entrada and entrada[0] >= time.time() else None
+                restante = limite - time.time()
+                if estado != estado_actual or restante <= 0:
+                    return estado
+                self._cambio.wait(restante)
+
+    def _evictar(self):
+        """Elimina los estados expirados (el orden de inserción coincide con el de expiración)"""
+        ahora = time.time()
+        while self._datos:
+            diagnostico_id, (expira, _) = next(iter(self._datos.items()))
+            if expira >= ahora:
+                break
+            del self._datos[diagnostico_id]
+
+    def stats(self):
+        """Devuelve el número de estados almacenados"""
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._datos)}
+
+
+class AlmacenEstadoSQLite:
+    """Almacén de estado en SQLite compartido por todos los workers de un mismo equipo"""
+
+    def __init__(self, db_path=None, ttl=None):
+        """
+        Inicializa el almacén en SQLite. Con una ruta en /dev/shm el archivo
+        reside en memoria compartida y no toca el disco.
+
+        Args:
+            db_path (str, optional): Ruta al archivo SQLite
+            ttl (float, optional): Segundos que se conserva un estado desde su última actualización
+        """
+        self.db_path = db_path or Config.STATUS_DB_PATH
+        self.ttl = ttl or Config.STATUS_TTL
+        self._local = threading.local()
+        self._ultima_purga = 0
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS diagnostico_status (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._conn().execute(
+            "CREATE INDEX IF NOT EXISTS idx_status_expires ON diagnostico_status(expires)"
+        )
+
+    def _conn(self):
+        """Obtiene la conexión SQLite del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, diagnostico_id):
+        """
+        Obtiene el estado de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+
+        Returns:
+            dict: Estado del diagnóstico o None si no existe o expiró
+        """
+        row = self._conn().execute(
+            "SELECT data FROM diagnostico_status WHERE id = ? AND expires >= ?",
+            (diagnostico_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, diagnostico_id, estado):
+        """
+        Reemplaza atómicamente el estado de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado (dict): Nuevo estado
+        """
+        ahora = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO diagnostico_status (id, data, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires = excluded.expires",
+            (diagnostico_id, json.dumps(estado, ensure_ascii=False), ahora + self.ttl)
+        )
+        # Purgar estados expirados como máximo una vez por minuto
+        if ahora - self._ultima_purga > 60:
+            self._ultima_purga = ahora
+            conn.execute("DELETE FROM diagnostico_status WHERE expires < ?", (ahora,))
+
+    def get_varios(self, diagnostico_ids):
+        """
+        Obtiene el estado de varios diagnósticos en una sola operación.
+
+        Args:
+            diagnostico_ids (list): IDs de los diagnósticos
+
+        Returns:
+            dict: Estado vigente por ID (los inexistentes o expirados no aparecen)
+        """
+        estados = {}
+        conn = self._conn()
+        ids = list(diagnostico_ids)
+        # SQLite limita el número de parámetros por sentencia
+        for i in range(0, len(ids), 500):
+            bloque = ids[i:i + 500]
+            filas = conn.execute(
+                f"SELECT id, data FROM diagnostico_status WHERE id IN ({','.join('?' * len(bloque))}) AND expires >= ?",
+                (*bloque, time.time())
+            ).fetchall()
+            estados.update((fila[0], json.loads(fila[1])) for fila in filas)
+        return estados
+
+    def esperar_cambio(self, diagnostico_id, estado_actual, timeout):
+        """
+        Espera a que el estado de un diagnóstico cambie o venza el tiempo.
+        Los cambios pueden venir de otro proceso, por lo que se consulta
+        el archivo local a intervalos cortos.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado_actual (dict): Último estado conocido por quien espera
+            timeout (float): Segundos máximos de espera
+
+        Returns:
+            dict: Estado vigente al terminar la espera
+        """
+        limite = time.time() + timeout
+        while True:
+            estado = self.get(diagnostico_id)
+            if estado != estado_actual or time.time() >= limite:
+                return estado
+            time.sleep(min(Config.STATUS_STREAM_POLL, max(0, limite - time.time())))
+
+    def stats(self):
+        """Devuelve el número de estados almacenados"""
+        total = self._conn().execute("SELECT COUNT(*) FROM diagnostico_status").fetchone()[0]
+        return {'backend': 'sqlite', 'entries': total}
+
+
+class AlmacenEstadoRedis:
+    """Almacén de estado en Redis compartido por varios equipos"""
+
+    def __init__(self, url=None, ttl=None):
+        """
+        Inicializa el almacén en Redis.
+
+        Args:
+            url (str, optional): URL de conexión a Redis
+            ttl (float, optional): Segundos que se conserva un estado desde su última actualización
+        """
+        import redis
+
+        self.ttl = int(ttl or Config.STATUS_TTL)
+        self._redis = redis.Redis.from_url(url or Config.STATUS_REDIS_URL)
+
+    def _key(self, diagnostico_id):
+        """Clave de Redis para un diagnóstico"""
+        return f"vitalscan:status:{diagnostico_id}"
+
+    def get(self, diagnostico_id):
+        """
+        Obtiene el estado de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+
+        Returns:
+            dict: Estado del diagnóstico o None si no existe o expiró
+        """
+        data = self._redis.get(self._key(diagnostico_id))
+        return json.loads(data) if data else None
+
+    def set(self, diagnostico_id, estado):
+        """
+        Reemplaza atómicamente el estado de un diagnóstico.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado (dict): Nuevo estado
+        """
+        data = json.dumps(estado, ensure_ascii=False)
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(diagnostico_id), data, ex=self.ttl)
+        pipe.publish(self._key(diagnostico_id), data)
+        pipe.execute()
+
+    def get_varios(self, diagnostico_ids):
+        """
+        Obtiene el estado de varios diagnósticos en una sola operación.
+
+        Args:
+            diagnostico_ids (list): IDs de los diagnósticos
+
+        Returns:
+            dict: Estado vigente por ID (los inexistentes o expirados no aparecen)
+        """
+        ids = list(diagnostico_ids)
+        if not ids:
+            return {}
+        valores = self._redis.mget([self._key(i) for i in ids])
+        return {i: json.loads(v) for i, v in zip(ids, valores) if v}
+
+    def esperar_cambio(self, diagnostico_id, estado_actual, timeout):
+        """
+        Espera a que el estado de un diagnóstico cambie o venza el tiempo,
+        usando pub/sub de Redis para recibir los cambios al instante.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado_actual (dict): Último estado conocido por quien espera
+            timeout (float): Segundos máximos de espera
+
+        Returns:
+            dict: Estado vigente al terminar la espera
+        """
+        limite = time.time() + timeout
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self._key(diagnostico_id))
+            # Consultar después de suscribirse para no perder cambios intermedios
+            estado = self.get(diagnostico_id)
+            while estado == estado_actual and time.time() < limite:
+                mensaje = pubsub.get_message(timeout=max(0, limite - time.time()))
+                if mensaje and mensaje['type'] == 'message':
+                    estado = json.loads(mensaje['data'])
+            return estado
+        finally:
+            pubsub.close()
+
+    def stats(self):
+        """Devuelve información básica del backend"""
+        return {'backend': 'redis'}
+
+
+class VigilanteEstados:
+    """
+    Espera asíncrona de cambios de estado para el modo ASGI. En lugar de una
+    consulta por cliente, una sola tarea consulta periódicamente todos los
+    diagnósticos vigilados con get_varios() y despierta a quienes esperan, de
+    modo que miles de conexiones abiertas cuestan una consulta por intervalo.
+    """
+
+    def __init__(self, almacen, intervalo=None):
+        """
+        Inicializa el vigilante.
+
+        Args:
+            almacen: Almacén de estado (cualquiera de los backends)
+            intervalo (float, optional): Segundos entre consultas
+        """
+        self.almacen = almacen
+        self.intervalo = intervalo or Config.STATUS_STREAM_POLL
+        self._esperas = {}
+        self._tarea = None
+        self._metricas = {'polls': 0, 'wakeups': 0, 'errors': 0}
+
+    async def get(self, diagnostico_id):
+        """
+        Obtiene el estado de un diagnóstico sin bloquear el bucle de eventos.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+
+        Returns:
+            dict: Estado del diagnóstico o None si no existe o expiró
+        """
+        return await asyncio.to_thread(self.almacen.get, diagnostico_id)
+
+    async def esperar_cambio(self, diagnostico_id, estado_actual, timeout):
+        """
+        Espera a que el estado de un diagnóstico cambie o venza el tiempo.
+
+        Args:
+            diagnostico_id (str): ID del diagnóstico
+            estado_actual (dict): Último estado conocido por quien espera
+            timeout (float): Segundos máximos de espera
+
+        Returns:
+            dict: Estado vigente al terminar la espera
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        espera = (estado_actual, futuro)
+        self._esperas.setdefault(diagnostico_id, []).append(espera)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._bucle())
+        try:
+            return await asyncio.wait_for(futuro, timeout)
+        except asyncio.TimeoutError:
+            return estado_actual
+        finally:
+            esperas = self._esperas.get(diagnostico_id)
+            if esperas is not None:
+                esperas.remove(espera)
+                if not esperas:
+                    del self._esperas[diagnostico_id]
+
+    async def _bucle(self):
+        """Consulta los diagnósticos vigilados mientras haya alguien esperando"""
+        while self._esperas:
+            await asyncio.sleep(self.intervalo)
+            ids = list(self._esperas)
+            if not ids:
+                break
+            try:
+                estados = await asyncio.to_thread(self.almacen.get_varios, ids)
+            except Exception as e:
+                self._metricas['errors'] += 1
+                logger.warning(f"Error al consultar el estado de {len(ids)} diagnósticos: {str(e)}")
+                continue
+            self._metricas['polls'] += 1
+            for diagnostico_id in ids:
+                estado = estados.get(diagnostico_id)
+                for conocido, futuro in self._esperas.get(diagnostico_id, ()):
+                    if estado != conocido and not futuro.done():
+                        futuro.set_result(estado)
+                        self._metricas['wakeups'] += 1
+
+    def stats(self):
+        """Devuelve los diagnósticos vigilados y los contadores del vigilante"""
+        return {
+            'watched': len(self._esperas),
+            'waiters': sum(len(e) for e in self._esperas.values()),
+            **self._metricas
+        }
+
+
+def crear_almacen_estado():
+    """
+    Crea el almacén de estado según el backend configurado.
+
+    Returns:
+        AlmacenEstadoMemoria | AlmacenEstadoSQLite | AlmacenEstadoRedis: Almacén de estado
+    """
+    backend = Config.STATUS_BACKEND
+    if backend == 'redis':
+        return AlmacenEstadoRedis()
+    if backend == 'memory':
+        return AlmacenEstadoMemoria()
+    if backend != 'sqlite':
+        logger.warning(f"Backend de estado desconocido '{backend}', se usará SQLite")
+    return AlmacenEstadoSQLite()
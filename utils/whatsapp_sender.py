@@ -1,13 +1,76 @@
 import os
 import json
+import uuid
 import logging
+import threading
 import requests
 import time
 import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _crear_sesion():
+    """
+    Crea una sesión HTTP con conexiones persistentes y reintentos con backoff exponencial.
+
+    Returns:
+        requests.Session: Sesión configurada
+    """
+    reintentos = Retry(
+        total=Config.WHATSAPP_MAX_RETRIES,
+        connect=Config.WHATSAPP_MAX_RETRIES,
+        # Un POST cuya respuesta se perdió no se repite a ciegas: se consulta su estado
+        read=False,
+        status=Config.WHATSAPP_MAX_RETRIES,
+        status_forcelist=(502, 503, 504),
+        # El envío es idempotente gracias a la cabecera Idempotency-Key
+        allowed_methods=frozenset({'GET', 'POST'}),
+        backoff_factor=Config.WHATSAPP_RETRY_BACKOFF,
+        backoff_jitter=Config.WHATSAPP_RETRY_BACKOFF,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=Config.WHATSAPP_POOL_SIZE,
+        max_retries=reintentos,
+        pool_block=True
+    )
+    session = requests.Session()
+    session.mount('http://', adaptador)
+    session.mount('https://', adaptador)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+
+def get_session():
+    """
+    Obtiene la sesión HTTP del proceso hacia el servicio de WhatsApp, creándola si es necesario.
+
+    Returns:
+        requests.Session: Sesión compartida
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _crear_sesion()
+                _session_pid = os.getpid()
+                logger.info(
+                    f"Sesión HTTP de WhatsApp creada ({Config.WHATSAPP_API_URL}, "
+                    f"máximo {Config.WHATSAPP_POOL_SIZE} conexiones)"
+                )
+    return _session
+
+
 class WhatsappSender:
     """Clase para enviar mensajes por WhatsApp usando la API existente"""
     
@@ -15,7 +78,7 @@ class WhatsappSender:
         """Inicializa el servicio de envío de WhatsApp"""
         self.api_url = f"{Config.WHATSAPP_API_URL}/lead"
         
-    def send_message(self, para, mensaje=None, pdf_path=None, datos=None):
+    def send_message(self, para, mensaje=None, pdf_path=None, datos=None, idempotency_key=None, enlace_pdf=None):
         """
         Envía un mensaje de WhatsApp y opcionalmente un archivo PDF adjunto.
         
@@ -24,6 +87,9 @@ class WhatsappSender:
             mensaje (str, optional): Texto del mensaje a enviar o None para generar mensaje personalizado
             pdf_path (str, optional): Ruta al archivo PDF para adjuntar
             datos (dict, optional): Datos para personalizar el mensaje si mensaje es None
+            idempotency_key (str, optional): Clave del envío; los reintentos con la misma
+                clave no duplican el mensaje. Si es None se genera una nueva
+            enlace_pdf (str, optional): Enlace de descarga firmado que sustituye al PDF adjunto
         
         Returns:
             dict: Respuesta del servidor
@@ -50,9 +116,11 @@ class WhatsappSender:
             
             # Si no hay mensaje pero hay datos, generar mensaje personalizado
             if mensaje is None and datos:
-                mensaje_final = self._generar_mensaje_personalizado(datos)
+                mensaje_final = self._generar_mensaje_personalizado(datos, enlace_pdf)
             else:
                 mensaje_final = mensaje or "Tu diagnóstico de bienestar está listo."
+                if enlace_pdf:
+                    mensaje_final = f"{mensaje_final}\n\nDescarga tu informe en PDF: {enlace_pdf}"
             
             data = {
                 'message': mensaje_final,
@@ -60,7 +128,7 @@ class WhatsappSender:
             }
             
             # Si hay un archivo PDF para enviar, verificar que exista
-            if pdf_path:
+            if pdf_path and not enlace_pdf:
                 if os.path.exists(pdf_path):
                     data['pdfPath'] = pdf_path
                     logger.info(f"Enviando archivo adjunto: {pdf_path}")
@@ -68,25 +136,25 @@ class WhatsappSender:
                     logger.error(f"Error: El archivo no existe: {pdf_path}")
                     return {"status": "error", "message": f"El archivo no existe: {pdf_path}"}
                 
+            idempotency_key = idempotency_key or uuid.uuid4().hex
             headers = {
-                'Content-Type': 'application/json'
+                'Idempotency-Key': idempotency_key
             }
             
             logger.info(f"Enviando mensaje a {para}: {mensaje_final[:100]}...")
             
-            response = requests.post(self.api_url, json=data, headers=headers, timeout=30)
-            time.sleep(3)  # Reducimos el tiempo de espera a 3 segundos
-            
-            # Intentar decodificar la respuesta JSON
             try:
-                return response.json()
-            except json.JSONDecodeError:
-                return {
-                    "status": "error", 
-                    "message": "No se pudo decodificar la respuesta JSON",
-                    "http_status": response.status_code,
-                    "response_text": response.text[:200]  # Primeros 200 caracteres para diagnóstico
-                }
+                response = get_session().post(
+                    self.api_url, json=data, headers=headers,
+                    timeout=(Config.WHATSAPP_CONNECT_TIMEOUT, Config.WHATSAPP_TIMEOUT)
+                )
+            except requests.ReadTimeout:
+                # El servicio recibió la petición pero no respondió a tiempo: consultar el estado
+                logger.warning(f"Sin respuesta del envío {idempotency_key}, consultando su estado")
+                return self._esperar_confirmacion(idempotency_key)
+            
+            # La respuesta del servicio confirma el envío (el mensaje ya salió)
+            return self._interpretar_respuesta(response)
                 
         except requests.RequestException as e:
             logger.error(f"Error al enviar mensaje por WhatsApp: {str(e)}", exc_info=True)
@@ -95,12 +163,78 @@ class WhatsappSender:
             logger.error(f"Error inesperado: {str(e)}", exc_info=True)
             return {"status": "error", "message": f"Error inesperado: {str(e)}"}
     
-    def _generar_mensaje_personalizado(self, datos):
+    def _interpretar_respuesta(self, response):
+        """
+        Convierte la respuesta HTTP del servicio en el diccionario devuelto al llamador.
+
+        Args:
+            response (requests.Response): Respuesta del servicio de WhatsApp
+
+        Returns:
+            dict: Respuesta del servidor o diccionario con status 'error'
+        """
+        # Intentar decodificar la respuesta JSON
+        try:
+            contenido = response.json()
+        except json.JSONDecodeError:
+            return {
+                "status": "error", 
+                "message": "No se pudo decodificar la respuesta JSON",
+                "http_status": response.status_code,
+                "response_text": response.text[:200]  # Primeros 200 caracteres para diagnóstico
+            }
+        if not response.ok:
+            return {
+                "status": "error",
+                "message": contenido.get('error', 'Error del servicio de WhatsApp') if isinstance(contenido, dict) else str(contenido),
+                "http_status": response.status_code
+            }
+        return contenido
+
+    def _esperar_confirmacion(self, idempotency_key):
+        """
+        Consulta el estado de un envío hasta que el servicio lo confirme o falle.
+
+        Args:
+            idempotency_key (str): Clave del envío
+
+        Returns:
+            dict: Respuesta del envío o diccionario con status 'error'
+        """
+        url = f"{Config.WHATSAPP_API_URL}/lead/status/{idempotency_key}"
+        limite = time.monotonic() + Config.WHATSAPP_ACK_TIMEOUT
+        espera = 0.5
+        while True:
+            try:
+                response = get_session().get(
+                    url, timeout=(Config.WHATSAPP_CONNECT_TIMEOUT, Config.WHATSAPP_CONNECT_TIMEOUT)
+                )
+                if response.status_code == 404:
+                    # Servicio reiniciado o sin soporte de estado: el envío no consta
+                    return {"status": "error", "message": f"El servicio no conoce el envío {idempotency_key}"}
+                estado = response.json()
+                if estado.get('status') == 'sent':
+                    return estado.get('response') or estado
+                if estado.get('status') == 'error':
+                    return {"status": "error", "message": f"El servicio no pudo completar el envío {idempotency_key}"}
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Error al consultar el estado del envío {idempotency_key}: {str(e)}")
+
+            if time.monotonic() + espera > limite:
+                return {
+                    "status": "error",
+                    "message": f"El envío {idempotency_key} no se confirmó en {Config.WHATSAPP_ACK_TIMEOUT} segundos"
+                }
+            time.sleep(espera)
+            espera = min(espera * 2, 5)
+
+    def _generar_mensaje_personalizado(self, datos, enlace_pdf=None):
         """
         Genera un mensaje personalizado para WhatsApp basado en los datos del usuario.
         
         Args:
             datos (dict): Datos del usuario y el diagnóstico
+            enlace_pdf (str, optional): Enlace de descarga del PDF cuando no se adjunta
         
         Returns:
             str: Mensaje personalizado
@@ -108,12 +242,23 @@ class WhatsappSender:
         # Extraer datos relevantes
         nombre = datos.get('nombre', datos.get('first_name', 'Cliente'))
         
+        if enlace_pdf:
+            entrega_pdf = (
+                "Hemos analizado a fondo tu información. Puedes descargar el informe detallado "
+                f"en PDF desde este enlace para revisar nuestros hallazgos:\n{enlace_pdf}"
+            )
+        else:
+            entrega_pdf = (
+                "Hemos analizado a fondo tu información y te adjuntamos el informe detallado "
+                "en PDF para que puedas revisar nuestros hallazgos."
+            )
+        
         # Generar mensaje personalizado con emojis
         mensaje = f"""¡Hola {nombre}! 👋
 
 Tu diagnóstico de bienestar está listo. ✅
 
-Hemos analizado a fondo tu información y te adjuntamos el informe detallado en PDF para que puedas revisar nuestros hallazgos.
+{entrega_pdf}
 
 El informe incluye:
 📊 Evaluación de tu bienestar general
@@ -0,0 +1,154 @@
+"""
+Servidor local que imita la API de WhatsApp (api-whatsapp-ts) para pruebas sin conexión.
+
+Uso:
+    python -m utils.whatsapp_stub --port 3001 --latency 0.5
+
+y en el entorno de la aplicación:
+    WHATSAPP_API_URL=http://localhost:3001
+"""
+import os
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Atiende POST /lead y GET /lead/status/<clave> como el servicio real"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/lead':
+            self._responder_json(404, {'error': 'Ruta no encontrada'})
+            return
+
+        longitud = int(self.headers.get('Content-Length', 0))
+        cuerpo = json.loads(self.rfile.read(longitud) or b'{}')
+        if not cuerpo.get('message') or not cuerpo.get('phone'):
+            self._responder_json(400, {'error': 'Se requieren los campos message y phone'})
+            return
+
+        server = self.server
+        clave = self.headers.get('Idempotency-Key')
+        with server.stub_lock:
+            server.stub_stats['received'] += 1
+            previo = server.envios.get(clave) if clave else None
+            if previo is not None:
+                server.stub_stats['replayed'] += 1
+                self._responder_json(200, previo['response'], {'Idempotent-Replayed': 'true'})
+                return
+            if clave:
+                server.envios[clave] = {'status': 'pending'}
+
+        config = server.stub_config
+        time.sleep(max(0, random.gauss(config['latency'], config['latency'] * 0.1)))
+        if random.random() < config['error_rate']:
+            with server.stub_lock:
+                server.stub_stats['errors'] += 1
+                if clave:
+                    server.envios[clave] = {'status': 'error'}
+            self._responder_json(500, {'error': 'Error interno del servidor'})
+            return
+
+        # El servicio real lee el PDF completo para enviarlo como documento
+        tamano_pdf = 0
+        ruta = cuerpo.get('pdfPath')
+        if ruta and os.path.exists(ruta):
+            with open(ruta, 'rb') as f:
+                tamano_pdf = len(f.read())
+
+        respuesta = {
+            'responseDbSave': 'ok',
+            'messageSentResponse': {'phone': cuerpo['phone'], 'pdfBytes': tamano_pdf}
+        }
+        with server.stub_lock:
+            server.stub_stats['sent'] += 1
+            if clave:
+                server.envios[clave] = {'status': 'sent', 'response': respuesta}
+            server.mensajes.append(cuerpo)
+            del server.mensajes[:-config['max_mensajes']]
+        self._responder_json(200, respuesta)
+
+    def do_GET(self):
+        prefijo = '/lead/status/'
+        if not self.path.startswith(prefijo):
+            self._responder_json(404, {'error': 'Ruta no encontrada'})
+            return
+        with self.server.stub_lock:
+            envio = self.server.envios.get(self.path[len(prefijo):])
+        if envio is None:
+            self._responder_json(404, {'status': 'unknown'})
+            return
+        self._responder_json(200, envio)
+
+    def _responder_json(self, codigo, cuerpo, headers=None):
+        data = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for nombre, valor in (headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def crear_servidor(host='127.0.0.1', port=3001, latency=0.5, error_rate=0.0, max_mensajes=1000):
+    """
+    Crea el servidor simulado de WhatsApp.
+
+    Args:
+        host (str): Interfaz de escucha
+        port (int): Puerto de escucha (0 para uno libre)
+        latency (float): Segundos que tarda cada envío
+        error_rate (float): Proporción de envíos que responden 500
+        max_mensajes (int): Mensajes conservados en memoria
+
+    Returns:
+        ThreadingHTTPServer: Servidor listo para serve_forever(); los mensajes
+            recibidos quedan en server.mensajes y los contadores en server.stub_stats
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.stub_config = {'latency': latency, 'error_rate': error_rate, 'max_mensajes': max_mensajes}
+    server.stub_lock = threading.Lock()
+    server.stub_stats = {'received': 0, 'sent': 0, 'replayed': 0, 'errors': 0}
+    server.envios = {}
+    server.mensajes = []
+    return server
+
+
+def iniciar_en_segundo_plano(**kwargs):
+    """
+    Inicia el servidor simulado en un hilo daemon.
+
+    Returns:
+        ThreadingHTTPServer: Servidor en ejecución; su URL base es
+            f"http://{host}:{server.server_port}"
+    """
+    server = crear_servidor(**kwargs)
+    threading.Thread(target=server.serve_forever, name='whatsapp-stub', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor simulado de la API de WhatsApp')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3001)
+    parser.add_argument('--latency', type=float, default=0.5, help='Segundos por envío')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proporción de respuestas 500')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = crear_servidor(args.host, args.port, args.latency, args.error_rate)
+    logger.info(f"Servidor simulado de WhatsApp en http://{args.host}:{server.server_port}")
+    server.serve_forever()
@@ -0,0 +1,230 @@
+import os
+import re
+import glob
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from multiprocessing import util as mp_util
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Opciones de wkhtmltopdf equivalentes a las usadas con pdfkit
+OPCIONES_WKHTMLTOPDF = [
+    '--page-size', 'A4',
+    '--margin-top', '1cm',
+    '--margin-right', '1cm',
+    '--margin-bottom', '1cm',
+    '--margin-left', '1cm',
+    '--encoding', 'UTF-8',
+    '--no-outline',
+]
+
+# Prefijo de los directorios temporales de cada proceso (vitalscan-pdf-<pid>)
+_PREFIJO_TMP = 'vitalscan-pdf-'
+
+# Líneas con las que wkhtmltopdf indica el fin de cada conversión
+_FIN_CONVERSION = re.compile(r'^(Done|Exit with code (\d+).*)$')
+
+
+def _proceso_vivo(pid):
+    """Comprueba si existe un proceso con el PID indicado"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _limpiar_directorios_huerfanos():
+    """Elimina los directorios temporales de procesos que terminaron sin limpiarlos (p. ej. workers terminados)"""
+    for ruta in glob.glob(os.path.join(tempfile.gettempdir(), f'{_PREFIJO_TMP}*')):
+        sufijo = os.path.basename(ruta)[len(_PREFIJO_TMP):]
+        if sufijo.isdigit() and int(sufijo) != os.getpid() and not _proceso_vivo(int(sufijo)):
+            shutil.rmtree(ruta, ignore_errors=True)
+
+
+class RendererPersistente:
+    """
+    Mantiene vivo un proceso de wkhtmltopdf en modo --read-args-from-stdin:
+    cada línea enviada por stdin es una conversión independiente, por lo que
+    WebKit se inicializa una sola vez para muchos informes.
+    """
+
+    def __init__(self, max_renders=None, timeout=None):
+        """
+        Inicializa el renderizador.
+
+        Args:
+            max_renders (int, optional): Conversiones tras las que se recicla el proceso
+                para acotar el consumo de memoria
+            timeout (float, optional): Segundos máximos por conversión
+        """
+        self.max_renders = max_renders or Config.PDF_RENDERER_MAX_RENDERS
+        self.timeout = timeout or Config.PDF_RENDER_TIMEOUT
+        self.binario = shutil.which('wkhtmltopdf') or 'wkhtmltopdf'
+        self._proceso = None
+        self._lineas = None
+        self._renders = 0
+        self._lock = threading.Lock()
+        # Un directorio por proceso: si el worker muere sin limpiar, el siguiente renderizador lo elimina
+        _limpiar_directorios_huerfanos()
+        self._tmp_dir = os.path.join(tempfile.gettempdir(), f'{_PREFIJO_TMP}{os.getpid()}')
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        # Finalize de multiprocessing (a diferencia de atexit) también se ejecuta al salir
+        # un worker del pool, p. ej. al reciclarse tras PDF_WORKER_MAX_TASKS informes
+        mp_util.Finalize(self, shutil.rmtree, args=(self._tmp_dir, True), exitpriority=10)
+        self._metricas = {'rendered': 0, 'failed': 0, 'restarts': 0}
+
+    def _iniciar(self):
+        """Arranca un proceso nuevo de wkhtmltopdf (requiere el lock)"""
+        self._proceso = subprocess.Popen(
+            [self.binario, *OPCIONES_WKHTMLTOPDF, '--read-args-from-stdin'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        self._lineas = queue.Queue()
+        threading.Thread(
+            target=self._leer_salida, args=(self._proceso, self._lineas),
+            name='wkhtmltopdf-stderr', daemon=True
+        ).start()
+        self._renders = 0
+        logger.info(f"Proceso persistente de wkhtmltopdf iniciado (PID {self._proceso.pid})")
+
+    @staticmethod
+    def _leer_salida(proceso, lineas):
+        """Lee la salida de progreso de wkhtmltopdf y entrega las líneas de fin de conversión"""
+        buffer = b''
+        while True:
+            data = proceso.stderr.read1(4096) if hasattr(proceso.stderr, 'read1') else proceso.stderr.read(1)
+            if not data:
+                lineas.put(None)
+                return
+            buffer += data
+            # Las barras de progreso usan retornos de carro en lugar de saltos de línea
+            *completas, buffer = re.split(rb'[\r\n]', buffer)
+            for linea in completas:
+                texto = linea.decode('utf-8', 'replace').strip()
+                if _FIN_CONVERSION.match(texto):
+                    lineas.put(texto)
+
+    def _detener(self):
+        """Detiene el proceso actual (requiere el lock)"""
+        if self._proceso is None:
+            return
+        try:
+            self._proceso.stdin.close()
+            self._proceso.wait(timeout=5)
+        except Exception:
+            self._proceso.kill()
+        self._proceso = None
+
+    def _sano(self):
+        """Indica si el proceso sigue vivo y por debajo del límite de conversiones"""
+        return (
+            self._proceso is not None
+            and self._proceso.poll() is None
+            and self._renders < self.max_renders
+        )
+
+    def renderizar(self, html, pdf_path):
+        """
+        Convierte un documento HTML a PDF con el proceso persistente.
+
+        Args:
+            html (str): Contenido HTML del informe
+            pdf_path (str): Ruta de salida para el PDF
+
+        Returns:
+            bool: True si el PDF se generó correctamente
+        """
+        with self._lock:
+            if not self._sano():
+                if self._proceso is not None:
+                    self._metricas['restarts'] += 1
+                self._detener()
+                self._iniciar()
+
+            # Descartar líneas pendientes de conversiones anteriores
+            while not self._lineas.empty():
+                self._lineas.get_nowait()
+
+            # Rutas temporales sin espacios: wkhtmltopdf separa los argumentos por espacios
+            fd, html_path = tempfile.mkstemp(suffix='.html', dir=self._tmp_dir)
+            salida = f"{html_path[:-5]}.pdf"
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(html)
+
+                self._proceso.stdin.write(f"{html_path} {salida}\n".encode('utf-8'))
+                self._proceso.stdin.flush()
+                self._renders += 1
+
+                try:
+                    linea = self._lineas.get(timeout=self.timeout)
+                except queue.Empty:
+                    linea = None
+                    logger.error(f"wkhtmltopdf no respondió en {self.timeout} segundos, se reinicia el proceso")
+                    self._proceso.kill()
+                    self._proceso = None
+
+                if linea is None or not os.path.exists(salida) or os.path.getsize(salida) == 0:
+                    if linea:
+                        logger.error(f"wkhtmltopdf falló al convertir {pdf_path}: {linea}")
+                    self._metricas['failed'] += 1
+                    return False
+
+                os.replace(salida, pdf_path)
+                self._metricas['rendered'] += 1
+                return True
+            except (BrokenPipeError, OSError) as e:
+                logger.error(f"Error de comunicación con wkhtmltopdf: {str(e)}")
+                self._metricas['failed'] += 1
+                self._detener()
+                return False
+            finally:
+                for ruta in (html_path, salida):
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+
+    def stats(self):
+        """Devuelve los contadores del renderizador"""
+        with self._lock:
+            return {
+                'pid': self._proceso.pid if self._proceso else None,
+                'renders_since_start': self._renders,
+                **self._metricas,
+            }
+
+    def close(self):
+        """Detiene el proceso persistente"""
+        with self._lock:
+            self._detener()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+_renderer = None
+_renderer_pid = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """
+    Obtiene el renderizador persistente del proceso, creándolo si es necesario.
+
+    Returns:
+        RendererPersistente: Renderizador de wkhtmltopdf
+    """
+    global _renderer, _renderer_pid
+    if _renderer is None or _renderer_pid != os.getpid():
+        with _renderer_lock:
+            if _renderer is None or _renderer_pid != os.getpid():
+                _renderer = RendererPersistente()
+                _renderer_pid = os.getpid()
+    return _renderer
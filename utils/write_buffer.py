@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import atexit
+import socket
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import pymysql
+from config import Config
+from utils.db_pool import get_pool
+from utils.record_cache import cache_registros
+
+logger = logging.getLogger(__name__)
+
+# Segundos tras los que un lote reclamado por un proceso que no terminó vuelve a estar disponible
+_CONCESION_SEGUNDOS = 120
+
+
+def completar_valores(valores, columnas, creado):
+    """
+    Completa las filas guardadas antes de añadir fecha_creacion al final del INSERT,
+    usando el momento en que el registro entró en el spool o en el almacén.
+
+    Args:
+        valores (tuple): Valores guardados
+        columnas (int): Valores que espera la sentencia INSERT
+        creado (float): Marca de tiempo de llegada del registro
+
+    Returns:
+        tuple: Valores completos
+    """
+    if len(valores) == columnas - 1:
+        return (*valores, datetime.fromtimestamp(int(creado)))
+    return valores
+
+
+class BufferEscritura:
+    """
+    Buffer de escritura diferida: los registros se guardan primero en un spool
+    SQLite local (duradero) y un hilo los inserta en MySQL por lotes cuando se
+    alcanza el tamaño o la espera máxima configurados.
+    """
+
+    def __init__(self, sql, spool_path=None, tamano_lote=None, max_espera=None, al_volcar=None):
+        """
+        Inicializa el buffer.
+
+        Args:
+            sql (str): Sentencia INSERT ... VALUES (%s, ...) de una fila
+            spool_path (str, optional): Ruta al archivo SQLite del spool
+            tamano_lote (int, optional): Filas por inserción
+            max_espera (float, optional): Segundos máximos que un registro espera en el spool
+            al_volcar (callable, optional): Recibe los IDs ya insertados en MySQL
+        """
+        # Idempotente: un lote reintentado tras un corte no duplica filas
+        self.sql = f"{sql.strip()} ON DUPLICATE KEY UPDATE id = id"
+        self._columnas = sql.count('%s')
+        self.spool_path = spool_path or Config.DB_WRITE_SPOOL_PATH
+        self.tamano_lote = tamano_lote or Config.DB_WRITE_BATCH_SIZE
+        self.max_espera = max_espera if max_espera is not None else Config.DB_WRITE_MAX_DELAY
+        self.al_volcar = al_volcar
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._condicion = threading.Condition()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._metricas = {'queued': 0, 'flushed': 0, 'batches': 0, 'failures': 0, 'dead': 0, 'last_error': None}
+
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                id TEXT PRIMARY KEY,
+                valores TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL NOT NULL DEFAULT 0,
+                owner TEXT,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_spool_pendientes ON spool(dead, lease_until, created)")
+
+    def _conn(self):
+        """Obtiene la conexión SQLite del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.spool_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def agregar(self, registro_id, valores, datos):
+        """
+        Guarda un registro en el spool para insertarlo en el siguiente lote.
+
+        Args:
+            registro_id (str): ID del registro
+            valores (tuple): Valores para la sentencia INSERT
+            datos (dict): Registro completo, para servir lecturas antes del volcado
+        """
+        self.agregar_varios([(registro_id, valores, datos)])
+
+    def agregar_varios(self, registros):
+        """
+        Guarda varios registros en el spool en una sola transacción.
+
+        Args:
+            registros (list): Tuplas (registro_id, valores, datos)
+        """
+        ahora = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO spool (id, valores, datos, created) VALUES (?, ?, ?, ?)",
+                [(registro_id, json.dumps(list(valores), ensure_ascii=False, default=str),
+                  json.dumps(datos, ensure_ascii=False, default=str), ahora)
+                 for registro_id, valores, datos in registros]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._condicion:
+            self._metricas['queued'] += len(registros)
+            self._condicion.notify()
+        self.start()
+
+    def buscar(self, registro_id):
+        """
+        Busca un registro que aún no se ha volcado a MySQL.
+
+        Args:
+            registro_id (str): ID del registro
+
+        Returns:
+            dict: Registro o None si no está en el spool
+        """
+        row = self._conn().execute("SELECT datos FROM spool WHERE id = ?", (registro_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def start(self):
+        """Inicia el hilo de volcado (idempotente)"""
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='write-behind', daemon=True)
+                self._hilo.start()
+                atexit.register(self.cerrar)
+
+    def _pendientes(self):
+        """Devuelve cuántos registros esperan volcado y la antigüedad del más antiguo"""
+        total, primero = self._conn().execute(
+            "SELECT COUNT(*), MIN(created) FROM spool WHERE dead = 0 AND lease_until < ?",
+            (time.time(),)
+        ).fetchone()
+        return total, (time.time() - primero) if primero else 0.0
+
+    def _bucle(self):
+        """Vuelca el spool cuando se llena un lote o vence la espera máxima"""
+        fallos = 0
+        while not self._detener.is_set():
+            try:
+                total, antiguedad = self._pendientes()
+                if total == 0 or (total < self.tamano_lote and antiguedad < self.max_espera):
+                    espera = self.max_espera - antiguedad if total else self.max_espera
+                    with self._condicion:
+                        self._condicion.wait(timeout=max(0.05, espera))
+                    continue
+
+                if self.vaciar():
+                    fallos = 0
+                    continue
+                # MySQL no disponible: los registros siguen en el spool, reintentar con retroceso
+                fallos += 1
+                self._detener.wait(min(Config.DB_WRITE_RETRY_MAX_BACKOFF, 2 ** fallos))
+            except Exception as e:
+                logger.error(f"Error en el volcado diferido: {str(e)}", exc_info=True)
+                self._detener.wait(1)
+
+    def _reclamar(self):
+        """Reserva el siguiente lote del spool para este proceso"""
+        conn = self._conn()
+        ahora = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, valores, created FROM spool WHERE dead = 0 AND lease_until < ? ORDER BY created LIMIT ?",
+                (ahora, self.tamano_lote)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE spool SET lease_until = ?, owner = ? WHERE id = ?",
+                [(ahora + _CONCESION_SEGUNDOS, self._owner, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(row[0], completar_valores(tuple(json.loads(row[1])), self._columnas, row[2])) for row in rows]
+
+    def vaciar(self):
+        """
+        Inserta en MySQL el siguiente lote del spool.
+
+        Returns:
+            bool: False si MySQL no está disponible y hay que reintentar más tarde
+        """
+        lote = self._reclamar()
+        if not lote:
+            return True
+
+        try:
+            self._insertar(lote)
+            self._confirmar([registro_id for registro_id, _ in lote])
+            return True
+        except pymysql.err.OperationalError as e:
+            self._liberar(lote, str(e))
+            logger.warning(f"MySQL no disponible, {len(lote)} diagnósticos siguen en el spool: {str(e)}")
+            return False
+        except Exception as e:
+            # Error de datos: aislar las filas problemáticas insertándolas una a una
+            logger.error(f"Error al insertar lote de {len(lote)} diagnósticos, se reintenta fila a fila: {str(e)}")
+            for registro_id, valores in lote:
+                try:
+                    self._insertar([(registro_id, valores)])
+                    self._confirmar([registro_id])
+                except pymysql.err.OperationalError as e_fila:
+                    self._liberar([(registro_id, valores)], str(e_fila))
+                    return False
+                except Exception as e_fila:
+                    self._descartar(registro_id, str(e_fila))
+            return True
+
+    def _insertar(self, lote):
+        """Inserta las filas con una sola sentencia de varias filas y un solo commit"""
+        inicio = time.monotonic()
+        with get_pool().conexion() as conn, conn.cursor() as cursor:
+            cursor.executemany(self.sql, [valores for _, valores in lote])
+            conn.commit()
+        with self._lock:
+            self._metricas['flushed'] += len(lote)
+            self._metricas['batches'] += 1
+        logger.info(f"Volcados {len(lote)} diagnósticos a MySQL en {time.monotonic() - inicio:.3f} segundos")
+
+    def _confirmar(self, ids):
+        """Elimina del spool los registros ya insertados"""
+        self._conn().executemany("DELETE FROM spool WHERE id = ? AND owner = ?", [(i, self._owner) for i in ids])
+        if self.al_volcar is not None:
+            try:
+                self.al_volcar(ids)
+            except Exception as e:
+                logger.warning(f"Error al notificar {len(ids)} registros volcados: {str(e)}")
+
+    def _liberar(self, lote, error):
+        """Devuelve un lote al spool para reintentarlo"""
+        self._conn().executemany(
+            "UPDATE spool SET lease_until = 0, attempts = attempts + 1, last_error = ? WHERE id = ?",
+            [(error, registro_id) for registro_id, _ in lote]
+        )
+        with self._lock:
+            self._metricas['failures'] += 1
+            self._metricas['last_error'] = error
+
+    def _descartar(self, registro_id, error):
+        """Aparta un registro que MySQL rechaza; se conserva en el spool para revisarlo"""
+        self._conn().execute(
+            "UPDATE spool SET dead = 1, attempts = attempts + 1, last_error = ? WHERE id = ?",
+            (error, registro_id)
+        )
+        with self._lock:
+            self._metricas['dead'] += 1
+            self._metricas['last_error'] = error
+        logger.error(f"Diagnóstico {registro_id} rechazado por MySQL, queda apartado en el spool: {error}")
+
+    def cerrar(self, timeout=10):
+        """Detiene el hilo e intenta volcar lo pendiente antes de salir"""
+        self._detener.set()
+        with self._condicion:
+            self._condicion.notify_all()
+        limite = time.monotonic() + timeout
+        try:
+            while time.monotonic() < limite and self._pendientes()[0] and self.vaciar():
+                pass
+        except Exception as e:
+            logger.warning(f"No se pudo vaciar el spool al cerrar, se volcará en el próximo arranque: {str(e)}")
+
+    def stats(self):
+        """
+        Obtiene las métricas del buffer.
+
+        Returns:
+            dict: Registros pendientes y volcados, lotes y errores
+        """
+        pendientes, antiguedad = self._pendientes()
+        with self._lock:
+            volcados, lotes = self._metricas['flushed'], self._metricas['batches']
+            return {
+                'pending': pendientes,
+                'oldest_seconds': round(antiguedad, 2),
+                'batch_size': self.tamano_lote,
+                'avg_batch': round(volcados / lotes, 2) if lotes else 0.0,
+                **self._metricas,
+            }
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def buffer_escritura_existente():
+    """
+    Obtiene el buffer de escritura del proceso solo si ya se creó (p. ej. para estadísticas).
+
+    Returns:
+        BufferEscritura: Buffer de escritura o None
+    """
+    return _buffer if _buffer_pid == os.getpid() else None
+
+
+def get_buffer_escritura():
+    """
+    Obtiene el buffer de escritura diferida de diagnósticos del proceso.
+    Al crearlo se vuelca lo que haya quedado en el spool de ejecuciones anteriores.
+
+    Returns:
+        BufferEscritura: Buffer de escritura
+    """
+    global _buffer, _buffer_pid
+    if _buffer is None or _buffer_pid != os.getpid():
+        with _buffer_lock:
+            if _buffer is None or _buffer_pid != os.getpid():
+                # Importación diferida: models.diagnostico importa este módulo
+                from models.diagnostico import SQL_INSERTAR
+                # La fila de MySQL (con sus valores por defecto, p. ej. fecha_creacion)
+                # sustituye a la copia en caché tomada antes de insertarla
+                _buffer = BufferEscritura(SQL_INSERTAR, al_volcar=cache_registros.invalidar_varios)
+                _buffer_pid = os.getpid()
+                _buffer.start()
+    return _buffer